@@ -1,29 +1,163 @@
-import threading
+import asyncio
+import logging
+from decimal import Decimal
 from PyQt5.QtWidgets import (
-    QWidget, QVBoxLayout, QHBoxLayout, QLabel, QGroupBox, QFormLayout, QTableWidget, QTableWidgetItem, QHeaderView, QScrollArea
+    QWidget, QVBoxLayout, QHBoxLayout, QLabel, QGroupBox, QFormLayout, QTableWidget, QTableWidgetItem, QHeaderView, QScrollArea,
+    QComboBox
 )
 from PyQt5.QtCore import Qt, pyqtSignal, QObject
-from tinkoff.invest import Client, AccountType, InstrumentIdType # Добавлено InstrumentIdType
+from tinkoff.invest import AccountType
+from tinkoff.invest.utils import money_to_decimal, quotation_to_decimal
+from datetime import datetime
+from instrument_cache import display_name, get_instrument_cache
+from money import NANO, format_nano, from_nano, to_nano
+from operations_sync import OperationsSync, get_operations_store
+from portfolio_analytics import BASE_CURRENCY, PortfolioBook
+from session_pool import get_pool
+from request_scheduler import PRIORITY_INTERACTIVE
+from workers import get_worker_pool
+
+logger = logging.getLogger(__name__)
+
+# Пауза перед переподключением упавшего стрима портфеля
+STREAM_RECONNECT_DELAY = 5
+
+# Ключ сводного представления в списке счетов
+ALL_ACCOUNTS = ""
+
+# Сколько последних операций показывать в таблице истории
+OPERATIONS_SHOWN = 50
+
+# Суммы портфеля по классам активов: ключ данных -> поле PortfolioResponse
+TOTAL_FIELDS = {
+    'shares': 'total_amount_shares',
+    'bonds': 'total_amount_bonds',
+    'etf': 'total_amount_etf',
+    'currencies': 'total_amount_currencies',
+    'futures': 'total_amount_futures',
+    'portfolio': 'total_amount_portfolio',
+}
+
+# Названия классов активов (PortfolioPosition.instrument_type) в аналитике
+INSTRUMENT_TYPE_NAMES = {
+    'share': "Акции",
+    'bond': "Облигации",
+    'etf': "ETF",
+    'currency': "Валюта",
+    'futures': "Фьючерсы",
+    'option': "Опционы",
+    'sp': "Структурные ноты",
+}
+
+
+class PortfolioStreamer(QObject):
+    """Подписка на PortfolioStream и PositionsStream по всем счетам разом."""
+    portfolio_updated = pyqtSignal(dict)  # данные счета в формате _portfolio_to_data
+    balances_updated = pyqtSignal(dict)  # {'account_id': ..., 'balances': {instrument_uid: Decimal}}
+    stream_error = pyqtSignal(str)
+
+    def __init__(self, token, account_ids, portfolio_to_data):
+        super().__init__()
+        self.token = token
+        self.account_ids = list(account_ids)
+        self.portfolio_to_data = portfolio_to_data
+        self.tasks = []
+
+    def start(self):
+        pool = get_worker_pool()
+        self.tasks = [
+            pool.run_coroutine(self._run_portfolio_stream, name="portfolio stream"),
+            pool.run_coroutine(self._run_positions_stream, name="positions stream"),
+        ]
+
+    def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+
+    async def _run_portfolio_stream(self):
+        async def consume(client):
+            async for response in client.operations_stream.portfolio_stream(accounts=self.account_ids):
+                if response.portfolio is not None:
+                    self.portfolio_updated.emit(self.portfolio_to_data(response.portfolio))
+        await self._run_forever("Portfolio", consume)
+
+    async def _run_positions_stream(self):
+        async def consume(client):
+            async for response in client.operations_stream.positions_stream(accounts=self.account_ids):
+                position = response.position
+                if position is None:
+                    continue
+                balances = {
+                    s.instrument_uid: Decimal(s.balance)
+                    for s in list(position.securities) + list(position.futures)
+                }
+                if balances:
+                    self.balances_updated.emit({'account_id': position.account_id, 'balances': balances})
+        await self._run_forever("Positions", consume)
+
+    async def _run_forever(self, name, consume):
+        # Стрим переподключается после ошибок, пока его не отменят
+        while True:
+            try:
+                async with get_pool(self.token).async_session() as client:
+                    await consume(client)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"{name} stream error: {e}")
+                self.stream_error.emit(f"Стрим портфеля прерван: {e}")
+            await asyncio.sleep(STREAM_RECONNECT_DELAY)
+
 
 class AccountInfoWindow(QGroupBox):
-    # Сигнал для обновления UI из потока
-    data_loaded = pyqtSignal(dict)
+    # Поля позиции в порядке столбцов таблицы
+    POSITION_COLUMNS = ('ticker', 'quantity', 'average_position_price', 'current_price', 'expected_yield')
+
+    # Сигналы для обновления UI из потока
+    static_loaded = pyqtSignal(dict)  # счета и статус пользователя
+    data_loaded = pyqtSignal(dict)  # портфель одного счета
+    position_resolved = pyqtSignal(str, str)  # instrument_uid, тикер
+    operations_synced = pyqtSignal(str)  # account_id, в локальной истории появились новые операции
+    operations_sync_ready = pyqtSignal(str, dict)  # токен, account_id -> дата открытия счета
     
     def __init__(self, parent=None):
         super().__init__("МОЙ КАБИНЕТ")
         self.parent = parent
         self.token = None
-        self.account_id = None
+        self.accounts_info = {}  # account_id -> сведения о счете
+        self.accounts_data = {}  # account_id -> портфель счета (числа, без форматирования)
+        self.user_info = None
+        self._position_rows = {}  # instrument_uid -> строка таблицы позиций
+        self.positions = {}  # instrument_uid -> отображаемые данные позиции
+        self._static_data = {}  # token -> счета и статус пользователя
+        self._requested_uids = set()  # инструменты, для которых уже запрошен тикер
+        self.portfolio_books = {}  # account_id (или ALL_ACCOUNTS) -> PortfolioBook
+        self.portfolio_streamer = None
+        self.operations_sync_task = None
+        self._operations_account = None  # счет, чьи операции сейчас в таблице
         self.init_ui()
         
-        # Подключаем сигнал к слоту обновления UI
-        self.data_loaded.connect(self.update_ui_with_data)
+        # Подключаем сигналы к слотам обновления UI
+        self.static_loaded.connect(self.on_static_loaded)
+        self.data_loaded.connect(self.on_account_data)
+        self.position_resolved.connect(self.update_position_ticker)
+        self.operations_synced.connect(self.on_operations_synced)
+        self.operations_sync_ready.connect(self.start_operations_sync)
 
     def init_ui(self):
         main_layout = QVBoxLayout(self)
         main_layout.setContentsMargins(10, 15, 10, 10)
         main_layout.setSpacing(15)
 
+        # --- Выбор счета ---
+        account_select_layout = QHBoxLayout()
+        self.account_combo = QComboBox()
+        self.account_combo.currentIndexChanged.connect(self.show_selected_account)
+        account_select_layout.addWidget(QLabel("Счет:"))
+        account_select_layout.addWidget(self.account_combo, 1)
+        main_layout.addLayout(account_select_layout)
+
         # --- Секция "Информация о счете" ---
         self.account_group = QGroupBox("Информация о счете")
         self.account_form_layout = QFormLayout()
@@ -77,6 +211,24 @@ class AccountInfoWindow(QGroupBox):
         self.portfolio_group.setLayout(self.portfolio_form_layout)
         main_layout.addWidget(self.portfolio_group)
 
+        # --- Секция "Аналитика портфеля" ---
+        self.analytics_group = QGroupBox("Аналитика портфеля")
+        analytics_layout = QFormLayout()
+        self.analytics_value_label = QLabel("-")
+        self.analytics_pnl_label = QLabel("-")
+        self.analytics_by_class_label = QLabel("-")
+        self.analytics_by_currency_label = QLabel("-")
+        self.analytics_concentration_label = QLabel("-")
+        self.analytics_by_class_label.setWordWrap(True)
+        self.analytics_by_currency_label.setWordWrap(True)
+        analytics_layout.addRow("Стоимость позиций:", self.analytics_value_label)
+        analytics_layout.addRow("Нереализованный P&L:", self.analytics_pnl_label)
+        analytics_layout.addRow("По классам:", self.analytics_by_class_label)
+        analytics_layout.addRow("По валютам:", self.analytics_by_currency_label)
+        analytics_layout.addRow("Концентрация:", self.analytics_concentration_label)
+        self.analytics_group.setLayout(analytics_layout)
+        main_layout.addWidget(self.analytics_group)
+
         # --- Секция "Позиции" ---
         self.positions_group = QGroupBox("Позиции")
         self.positions_table = QTableWidget(0, 5) # Тикер, Количество, Средняя цена, Текущая цена, Доходность
@@ -94,6 +246,17 @@ class AccountInfoWindow(QGroupBox):
         self.positions_group.setLayout(positions_layout)
         main_layout.addWidget(self.positions_group)
 
+        # --- Секция "Операции" (из локальной истории) ---
+        self.operations_group = QGroupBox("Последние операции")
+        self.operations_table = QTableWidget(0, 5)
+        self.operations_table.setHorizontalHeaderLabels(["Дата", "Операция", "Инструмент", "Кол-во", "Сумма"])
+        self.operations_table.horizontalHeader().setStretchLastSection(True)
+        self.operations_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        operations_layout = QVBoxLayout()
+        operations_layout.addWidget(self.operations_table)
+        self.operations_group.setLayout(operations_layout)
+        main_layout.addWidget(self.operations_group)
+
         main_layout.addStretch()
         self.set_data_placeholders()
 
@@ -116,118 +279,408 @@ class AccountInfoWindow(QGroupBox):
         self.total_amount_futures_label.setText("-")
         self.total_amount_total_label.setText("-")
         self.expected_yield_label.setText("-")
+        for label in (self.analytics_value_label, self.analytics_pnl_label, self.analytics_by_class_label,
+                      self.analytics_by_currency_label, self.analytics_concentration_label):
+            label.setText("-")
         self.positions_table.setRowCount(0)
+        self.operations_table.setRowCount(0)
+        self._operations_account = None
+        self._position_rows = {}
+        self.positions = {}
 
-    def set_account_info(self, token, account_id):
-        """Устанавливает токен и ID счета и запускает загрузку данных."""
+    def set_accounts(self, token, account_ids):
+        """Устанавливает токен и список счетов и загружает их все параллельно."""
         self.token = token
-        self.account_id = account_id
-        if self.token and self.account_id:
-            self.parent.show_info(f"Загрузка данных для счета: {self.account_id}...")
-            self.set_data_placeholders() # Очищаем старые данные
-            threading.Thread(target=self._load_data_in_thread, daemon=True).start()
-        else:
-            self.parent.show_info("Токен или ID счета не установлены.")
-            self.set_data_placeholders()
+        if self.portfolio_streamer:
+            self.portfolio_streamer.stop()
+            self.portfolio_streamer = None
+        if self.operations_sync_task:
+            self.operations_sync_task.cancel()
+            self.operations_sync_task = None
+        self.accounts_info = {}
+        self.accounts_data = {}
+        self.portfolio_books = {}
+        self.account_combo.blockSignals(True)
+        self.account_combo.clear()
+        self.account_combo.blockSignals(False)
+        self.set_data_placeholders() # Очищаем старые данные
+        if not self.token or not account_ids:
+            self.parent.show_info("Токен или счета не установлены.")
+            return
+        self.parent.show_info(f"Загрузка данных счетов: {len(account_ids)}...")
+        get_worker_pool().submit(self._load_data_in_thread, self.token, list(account_ids))
+        # Дальше портфели и позиции обновляются стримами, без повторной загрузки
+        self.portfolio_streamer = PortfolioStreamer(self.token, account_ids, self._portfolio_to_data)
+        self.portfolio_streamer.portfolio_updated.connect(self.on_account_data)
+        self.portfolio_streamer.balances_updated.connect(self.update_position_balances)
+        self.portfolio_streamer.stream_error.connect(self.parent.show_info)
+        self.portfolio_streamer.start()
 
-    def _load_data_in_thread(self):
-        """Загружает данные в отдельном потоке."""
-        data = {}
-        try:
-            with Client(self.token) as client:
-                # Информация о счете
-                accounts_response = client.users.get_accounts()
-                account = next((a for a in accounts_response.accounts if a.id == self.account_id), None)
-                if account:
-                    account_type_str = ""
-                    # Используем константы для более читаемого типа счета
-                    if account.type == AccountType.ACCOUNT_TYPE_TINKOFF: 
-                        account_type_str = "Брокерский счет"
-                    elif account.type == AccountType.ACCOUNT_TYPE_TINKOFF_IIS: 
-                        account_type_str = "ИИС"
-                    elif account.type == AccountType.ACCOUNT_TYPE_INVEST_BOX: 
-                        account_type_str = "Инвесткопилка"
-                    else:
-                        account_type_str = str(account.type).split('.')[-1] # Fallback
-                        
-                    data['account_info'] = {
-                        'id': account.id,
-                        'type': account_type_str,
-                        'name': account.name,
-                        'status': str(account.status).split('.')[-1]
-                    }
-                else:
-                    self.parent.show_info(f"Счет {self.account_id} не найден.")
-                    data['account_info'] = None
-
-                # Информация о пользователе
-                user_info_response = client.users.get_info()
-                data['user_info'] = {
+    def _load_static_data(self, scheduler):
+        """Счета и статус пользователя: меняются редко, грузятся один раз на токен."""
+        static = self._static_data.get(self.token)
+        if static is None:
+            accounts_response = scheduler.call("users", lambda client: client.users.get_accounts())
+            user_info_response = scheduler.call("users", lambda client: client.users.get_info())
+            static = {
+                'accounts': accounts_response.accounts,
+                'user_info': {
                     'prem_status': "Да" if user_info_response.prem_status else "Нет",
                     'qual_status': "Да" if user_info_response.qual_status else "Нет",
                     'tariff': user_info_response.tariff if user_info_response.tariff else "-",
                     'qualified_for_work_with': ", ".join(user_info_response.qualified_for_work_with) if user_info_response.qualified_for_work_with else "Нет"
                 }
+            }
+            self._static_data[self.token] = static
+        return static
 
-                # Портфель
-                portfolio_response = client.operations.get_portfolio(account_id=self.account_id)
-                data['portfolio'] = {
-                    'total_amount_shares': self._format_money(portfolio_response.total_amount_shares),
-                    'total_amount_bonds': self._format_money(portfolio_response.total_amount_bonds),
-                    'total_amount_etf': self._format_money(portfolio_response.total_amount_etf),
-                    'total_amount_currencies': self._format_money(portfolio_response.total_amount_currencies),
-                    'total_amount_futures': self._format_money(portfolio_response.total_amount_futures),
-                    'total_amount_portfolio': self._format_money(portfolio_response.total_amount_portfolio),
-                    'expected_yield': self._format_quotation(portfolio_response.expected_yield)
-                }
-
-                # Позиции
-                positions = []
-                for p in portfolio_response.positions: 
-                    ticker = ""
-                    current_price = ""
-                    try:
-                        # Попробуем найти инструмент по UID
-                        instrument_response = client.instruments.get_instrument_by(id_type=InstrumentIdType.INSTRUMENT_ID_TYPE_UID, id=p.instrument_uid) 
-                        ticker = instrument_response.instrument.ticker if instrument_response.instrument.ticker else instrument_response.instrument.name
-                        if not ticker: # Если тикер не найден, пробуем имя
-                             ticker = instrument_response.instrument.name
-                    except Exception:
-                        # Если не удалось получить инфу по UID, пробуем FIGI
-                        try:
-                            instrument_response = client.instruments.get_instrument_by(id_type=InstrumentIdType.INSTRUMENT_ID_TYPE_FIGI, id=p.figi)
-                            ticker = instrument_response.instrument.ticker if instrument_response.instrument.ticker else instrument_response.instrument.name
-                            if not ticker:
-                                ticker = instrument_response.instrument.name
-                        except Exception:
-                            ticker = p.figi if p.figi else "Неизвестно" # Если ничего не помогло, используем FIGI или "Неизвестно"
-                    
-                    if p.current_price:
-                        current_price = self._format_money(p.current_price)
-                    else:
-                        current_price = "-"
-
-                    positions.append({
-                        'ticker': ticker,
-                        'quantity': self._format_quotation(p.quantity),
-                        'average_position_price': self._format_money(p.average_position_price_fifo), 
-                        'current_price': current_price,
-                        'expected_yield': self._format_quotation(p.expected_yield_fifo)
-                    })
-                data['positions'] = positions
-
+    def _load_data_in_thread(self, token, account_ids):
+        """Загружает данные в отдельном потоке: портфели всех счетов запрашиваются разом."""
+        scheduler = self.parent.scheduler
+        try:
+            static = self._load_static_data(scheduler)
         except Exception as e:
             self.parent.show_info(f"Ошибка загрузки данных счета: {str(e)}")
-            data['error'] = str(e)
-        
-        self.data_loaded.emit(data)
+            return
 
-    def update_ui_with_data(self, data):
-        """Обновляет элементы UI данными."""
-        if 'error' in data:
-            self.set_data_placeholders()
+        accounts = {}
+        for account in static['accounts']:
+            if account.id not in account_ids:
+                continue
+            account_type_str = ""
+            # Используем константы для более читаемого типа счета
+            if account.type == AccountType.ACCOUNT_TYPE_TINKOFF: 
+                account_type_str = "Брокерский счет"
+            elif account.type == AccountType.ACCOUNT_TYPE_TINKOFF_IIS: 
+                account_type_str = "ИИС"
+            elif account.type == AccountType.ACCOUNT_TYPE_INVEST_BOX: 
+                account_type_str = "Инвесткопилка"
+            else:
+                account_type_str = str(account.type).split('.')[-1] # Fallback
+
+            accounts[account.id] = {
+                'id': account.id,
+                'type': account_type_str,
+                'name': account.name,
+                'status': str(account.status).split('.')[-1]
+            }
+        self.static_loaded.emit({'accounts': accounts, 'user_info': static['user_info']})
+
+        # Портфели: запросы уходят одновременно по общему каналу, каждый счет
+        # отображается, как только пришел его ответ
+        for account_id in accounts:
+            future = scheduler.submit(
+                "operations",
+                lambda client, account_id=account_id: client.operations.get_portfolio(account_id=account_id),
+                PRIORITY_INTERACTIVE
+            )
+            future.add_done_callback(lambda f, account_id=account_id: self._on_portfolio_loaded(account_id, f))
+
+        # История операций догружается в фоне, окно читает ее из локальной базы.
+        # Задачу запускает поток GUI: только он читает и отменяет operations_sync_task
+        opened = {account.id: account.opened_date for account in static['accounts'] if account.id in accounts}
+        self.operations_sync_ready.emit(token, opened)
+
+    def start_operations_sync(self, token, opened):
+        if token != self.token:
+            return  # пока грузились счета, токен сменился: синхронизацию запустит новая загрузка
+        if self.operations_sync_task:
+            self.operations_sync_task.cancel()
+        self.operations_sync_task = get_worker_pool().spawn(
+            self._sync_operations, self.parent.scheduler, opened, name="operations sync"
+        )
+
+    def _sync_operations(self, token, scheduler, opened):
+        sync = OperationsSync(scheduler, get_operations_store())
+        for account_id, opened_date in opened.items():
+            if token.cancelled:
+                return
+            try:
+                if sync.sync(token, account_id, opened_date):
+                    self.operations_synced.emit(account_id)
+            except Exception as e:
+                logger.error(f"Operations sync failed for {account_id}: {e}")
+                self.parent.show_info(f"Ошибка загрузки операций {account_id}: {e}")
+
+    def on_operations_synced(self, account_id):
+        if self.selected_account() in (account_id, ALL_ACCOUNTS):
+            self._show_operations(self.selected_account())
+
+    def _show_operations(self, account_id):
+        """Последние операции выбранного счета из локальной базы, без запросов к API."""
+        self._operations_account = account_id
+        store = get_operations_store()
+        account_ids = list(self.accounts_info) if account_id == ALL_ACCOUNTS else [account_id]
+        operations = []
+        for item in account_ids:
+            operations.extend(store.query(item, limit=OPERATIONS_SHOWN))
+        operations.sort(key=lambda op: op['date_ms'], reverse=True)
+        operations = operations[:OPERATIONS_SHOWN]
+
+        cache = get_instrument_cache()
+        self.operations_table.setRowCount(len(operations))
+        for row, op in enumerate(operations):
+            instrument = display_name(cache.get(op['instrument_uid'] or "", op['figi'] or "")) or op['figi'] or ""
+            payment = op['payment_nano']
+            values = (
+                datetime.fromtimestamp(op['date_ms'] / 1000).strftime("%d.%m.%Y %H:%M"),
+                op['name'] or op['type'],
+                instrument,
+                str(op['quantity'] or ""),
+                self._format_money(from_nano(payment), op['currency']) if payment is not None else "-",
+            )
+            for column, value in enumerate(values):
+                self.operations_table.setItem(row, column, QTableWidgetItem(value))
+
+    def _on_portfolio_loaded(self, account_id, future):
+        if future.cancelled():
             return
+        if future.exception() is not None:
+            self.parent.show_info(f"Ошибка загрузки портфеля {account_id}: {future.exception()}")
+            return
+        self.data_loaded.emit(self._portfolio_to_data(future.result()))
+
+    @staticmethod
+    def _portfolio_to_data(portfolio_response):
+        """Переводит PortfolioResponse в числовые данные счета."""
+        totals = {}
+        for key, field in TOTAL_FIELDS.items():
+            money = getattr(portfolio_response, field)
+            totals[key] = (money_to_decimal(money), money.currency) if money is not None else None
 
+        positions = {}
+        for p in portfolio_response.positions:
+            positions[p.instrument_uid] = {
+                'uid': p.instrument_uid,
+                'figi': p.figi,
+                'instrument_type': p.instrument_type,
+                'quantity': quotation_to_decimal(p.quantity),
+                'average_price': money_to_decimal(p.average_position_price_fifo),
+                'current_price': money_to_decimal(p.current_price) if p.current_price else None,
+                'currency': p.current_price.currency if p.current_price else p.average_position_price_fifo.currency,
+                'expected_yield': quotation_to_decimal(p.expected_yield_fifo),
+            }
+        return {
+            'account_id': portfolio_response.account_id,
+            'totals': totals,
+            'expected_yield': quotation_to_decimal(portfolio_response.expected_yield),
+            'positions': positions,
+        }
+
+    def on_static_loaded(self, static):
+        """Заполняет список счетов: отдельные счета и сводное представление."""
+        self.accounts_info = static['accounts']
+        self.user_info = static['user_info']
+        self.account_combo.blockSignals(True)
+        self.account_combo.clear()
+        for account_id, info in self.accounts_info.items():
+            self.account_combo.addItem(f"{info['name']} ({info['type']})", account_id)
+        if len(self.accounts_info) > 1:
+            self.account_combo.addItem("Все счета (сводно)", ALL_ACCOUNTS)
+        self.account_combo.blockSignals(False)
+        self.show_selected_account()
+
+    def on_account_data(self, data):
+        """Портфель счета из первой загрузки или из стрима."""
+        self.accounts_data[data['account_id']] = data
+        self._resolve_tickers(data['positions'].values())
+        if self.selected_account() in (data['account_id'], ALL_ACCOUNTS):
+            self.show_selected_account()
+
+    def selected_account(self):
+        return self.account_combo.currentData()
+
+    def update_position_balances(self, update):
+        """Количество из стрима позиций: меняется сразу после сделки, раньше снимка портфеля."""
+        data = self.accounts_data.get(update['account_id'])
+        if data is None:
+            return
+        changed = False
+        for uid, quantity in update['balances'].items():
+            position = data['positions'].get(uid)
+            if position is not None and position['quantity'] != quantity:
+                position['quantity'] = quantity
+                changed = True
+        if changed and self.selected_account() in (update['account_id'], ALL_ACCOUNTS):
+            self.show_selected_account()
+
+    def _combined_data(self):
+        """Сводный портфель: суммы по счетам, позиции объединены по instrument_uid."""
+        totals = {}
+        positions = {}
+        for data in self.accounts_data.values():
+            for key, total in data['totals'].items():
+                if total is None:
+                    continue
+                current = totals.get(key)
+                totals[key] = total if current is None else (current[0] + total[0], current[1])
+            for uid, position in data['positions'].items():
+                combined = positions.get(uid)
+                if combined is None:
+                    positions[uid] = dict(position)
+                    continue
+                quantity = combined['quantity'] + position['quantity']
+                # Средняя цена взвешивается по количеству
+                if quantity:
+                    combined['average_price'] = (
+                        combined['average_price'] * combined['quantity'] + position['average_price'] * position['quantity']
+                    ) / quantity
+                combined['quantity'] = quantity
+                combined['expected_yield'] += position['expected_yield']
+                if combined['current_price'] is None:
+                    combined['current_price'] = position['current_price']
+        return {'totals': totals, 'expected_yield': self._combined_yield(), 'positions': positions}
+
+    def _combined_yield(self):
+        """Доходность сводного портфеля, %.
+
+        expected_yield счета - процент от его вложений, складывать проценты нельзя.
+        Из стоимости портфеля счета (в рублях) и процента восстанавливаются
+        вложения и доход в рублях; итог - сумма доходов к сумме вложений.
+        None, если у какого-то счета нет стоимости портфеля.
+        """
+        invested = Decimal(0)
+        profit = Decimal(0)
+        for data in self.accounts_data.values():
+            total = data['totals'].get('portfolio')
+            percent = data['expected_yield']
+            if total is None or percent <= -100:
+                return None
+            value = total[0]
+            cost = value * 100 / (100 + percent)
+            invested += cost
+            profit += value - cost
+        return profit / invested * 100 if invested else None
+
+    def show_selected_account(self, *args):
+        """Показывает выбранный счет или сводный портфель из памяти, без запросов к API."""
+        account_id = self.selected_account()
+        if account_id is None:
+            return
+        if account_id == ALL_ACCOUNTS:
+            account_info = {
+                'id': ", ".join(self.accounts_info),
+                'type': "Все счета",
+                'name': f"Счетов: {len(self.accounts_info)}",
+                'status': "-"
+            }
+            data = self._combined_data()
+        else:
+            account_info = self.accounts_info.get(account_id)
+            data = self.accounts_data.get(account_id)
+        self.update_ui_with_data({
+            'account_info': account_info,
+            'user_info': self.user_info,
+            'portfolio': self._format_portfolio(data) if data else None,
+            'positions': self._format_positions(data['positions']) if data else [],
+        })
+        if data:
+            self._update_analytics(account_id, data['positions'])
+        if self._operations_account != account_id:
+            self._show_operations(account_id)
+
+    def _update_analytics(self, account_id, positions):
+        """Пересчитывает аналитику выбранного представления: в книге меняются только затронутые строки."""
+        book = self.portfolio_books.get(account_id)
+        if book is None:
+            book = self.portfolio_books[account_id] = PortfolioBook()
+        book.set_fx_rates(self._fx_rates(positions))
+        book.sync(positions)
+        summary = book.summary()
+
+        currency = BASE_CURRENCY
+        self.analytics_value_label.setText(self._format_money_nano(summary['total'], currency))
+        self.analytics_pnl_label.setText(self._format_money_nano(summary['pnl'], currency))
+        self.analytics_by_class_label.setText(", ".join(
+            f"{INSTRUMENT_TYPE_NAMES.get(key, key)} {self._format_percent(value, summary['total'])}"
+            for key, value in sorted(summary['by_class'].items(), key=lambda item: -item[1])
+        ) or "-")
+        by_currency = ", ".join(
+            self._format_money_nano(value, key) for key, value in sorted(summary['by_currency'].items())
+        )
+        if summary['unpriced_currencies']:
+            by_currency += f" (нет курса: {', '.join(summary['unpriced_currencies'])})"
+        self.analytics_by_currency_label.setText(by_currency or "-")
+        if summary['top_uid']:
+            top = self.positions.get(summary['top_uid'], {}).get('ticker', summary['top_uid'])
+            self.analytics_concentration_label.setText(
+                f"HHI {format_nano(summary['hhi'], 3)}, крупнейшая: {top} {format_nano(summary['top_weight'] * 100, 1)}%"
+            )
+        else:
+            self.analytics_concentration_label.setText("-")
+
+    @staticmethod
+    def _fx_rates(positions):
+        """Курсы валют к рублю по валютным позициям портфеля.
+
+        Код валюты берется из начала тикера инструмента (USD000UTSTOM, CNYRUB_TOM),
+        цена позиции - рублей за единицу валюты.
+        """
+        cache = get_instrument_cache()
+        rates = {}
+        for position in positions.values():
+            if position.get('instrument_type') != 'currency' or position['current_price'] is None:
+                continue
+            ticker = display_name(cache.get(position['uid'], position['figi']))
+            if ticker and position['currency'] == BASE_CURRENCY:
+                rates[ticker[:3].lower()] = to_nano(position['current_price'])
+        return rates
+
+    def _format_portfolio(self, data):
+        totals = data['totals']
+        portfolio = {}
+        for key in TOTAL_FIELDS:
+            total = totals.get(key)
+            portfolio[f'total_amount_{key}'] = self._format_money(*total) if total else "-"
+        portfolio['expected_yield'] = self._format_quotation(data['expected_yield'])
+        return portfolio
+
+    def _format_positions(self, positions):
+        cache = get_instrument_cache()
+        rows = []
+        for position in positions.values():
+            # Тикеры берем из локального кэша инструментов, неизвестные дозапрашиваются
+            ticker = display_name(cache.get(position['uid'], position['figi']))
+            if not ticker:
+                ticker = position['figi'] if position['figi'] else "Неизвестно" # Пока не нашли, показываем FIGI или "Неизвестно"
+            current_price = position['current_price']
+            rows.append({
+                'uid': position['uid'],
+                'ticker': ticker,
+                'quantity': self._format_quantity(position['quantity']),
+                'average_position_price': self._format_money(position['average_price'], position['currency']),
+                'current_price': self._format_money(current_price, position['currency']) if current_price is not None else "-",
+                'expected_yield': self._format_quotation(position['expected_yield'])
+            })
+        return rows
+
+    def _resolve_tickers(self, positions):
+        # Неизвестные инструменты запрашиваются параллельно, строки обновляются по мере ответов
+        keys = [(p['uid'], p['figi']) for p in positions if p['uid'] not in self._requested_uids]
+        if keys and self.parent.scheduler:
+            self._requested_uids.update(uid for uid, _ in keys)
+            get_instrument_cache().resolve(self.parent.scheduler, keys, self._on_instrument_resolved)
+
+    def _on_instrument_resolved(self, uid, info):
+        ticker = display_name(info)
+        if ticker:
+            self.position_resolved.emit(uid, ticker)
+
+    def update_position_ticker(self, uid, ticker):
+        """Подставляет найденный тикер в строку позиции."""
+        row = self._position_rows.get(uid)
+        if row is not None:
+            self.positions[uid]['ticker'] = ticker
+            item = self.positions_table.item(row, 0)
+            if item is None:
+                item = QTableWidgetItem()
+                item.setData(Qt.UserRole, uid)
+                self.positions_table.setItem(row, 0, item)
+            # Меняется только текст: UID в Qt.UserRole нужен для пересборки индекса строк
+            item.setText(ticker)
+
+    def update_ui_with_data(self, data):
+        """Обновляет элементы UI данными."""
         # Обновление информации о счете
         account_info = data.get('account_info')
         if account_info:
@@ -255,22 +708,67 @@ class AccountInfoWindow(QGroupBox):
             self.total_amount_total_label.setText(portfolio['total_amount_portfolio'])
             self.expected_yield_label.setText(portfolio['expected_yield'])
 
-        # Обновление позиций
-        positions = data.get('positions', [])
-        self.positions_table.setRowCount(len(positions))
-        for row, pos in enumerate(positions):
-            self.positions_table.setItem(row, 0, QTableWidgetItem(pos['ticker']))
-            self.positions_table.setItem(row, 1, QTableWidgetItem(pos['quantity']))
-            self.positions_table.setItem(row, 2, QTableWidgetItem(pos['average_position_price']))
-            self.positions_table.setItem(row, 3, QTableWidgetItem(pos['current_price']))
-            self.positions_table.setItem(row, 4, QTableWidgetItem(pos['expected_yield']))
-
-    def _format_money(self, money_value):
-        if money_value is None:
+        if 'positions' in data:
+            self._update_positions(data['positions'])
+
+    def _update_positions(self, positions):
+        """Обновляет таблицу позиций по разнице с текущим состоянием:
+        закрытые позиции удаляются, новые добавляются, у остальных
+        перезаписываются только изменившиеся ячейки."""
+        incoming = {pos['uid']: pos for pos in positions}
+
+        closed = [uid for uid in self.positions if uid not in incoming]
+        # Снизу вверх: удаление строки не сдвигает строки, которые еще предстоит удалить
+        for row in sorted((self._position_rows.pop(uid) for uid in closed), reverse=True):
+            self.positions_table.removeRow(row)
+        for uid in closed:
+            del self.positions[uid]
+        if closed:
+            # Строки сдвинулись, индекс собираем заново по UID в первом столбце
+            self._position_rows = {}
+            for row in range(self.positions_table.rowCount()):
+                item = self.positions_table.item(row, 0)
+                if item is not None:
+                    self._position_rows[item.data(Qt.UserRole)] = row
+
+        for uid, pos in incoming.items():
+            current = self.positions.get(uid)
+            if current is None:
+                row = self.positions_table.rowCount()
+                self.positions_table.insertRow(row)
+                self._position_rows[uid] = row
+                current = {}
+            row = self._position_rows[uid]
+            for column, key in enumerate(self.POSITION_COLUMNS):
+                if current.get(key) != pos[key]:
+                    item = QTableWidgetItem(pos[key])
+                    if column == 0:
+                        item.setData(Qt.UserRole, uid)
+                    self.positions_table.setItem(row, column, item)
+            self.positions[uid] = pos
+
+    @staticmethod
+    def _format_money(value, currency):
+        if value is None:
             return "-"
-        return f"{money_value.units}.{money_value.nano / 1e9:.2f} {money_value.currency}"
+        return f"{value:.2f} {currency}"
 
-    def _format_quotation(self, quotation_value):
-        if quotation_value is None:
+    @staticmethod
+    def _format_money_nano(value, currency):
+        return f"{format_nano(value)} {currency}"
+
+    @staticmethod
+    def _format_percent(value, total):
+        if not total:
+            return "-"
+        return f"{format_nano(value * 100 * NANO // total, 1)}%"
+
+    @staticmethod
+    def _format_quotation(value):
+        if value is None:
             return "-"
-        return f"{quotation_value.units}.{quotation_value.nano / 1e9:.2f}"
\ No newline at end of file
+        return f"{value:.2f}"
+
+    @staticmethod
+    def _format_quantity(value):
+        return format(value.normalize(), 'f')
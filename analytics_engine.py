@@ -0,0 +1,448 @@
+# analytics_engine.py
+import logging
+import multiprocessing
+import queue
+import struct
+import time
+from array import array
+from typing import Dict, List, Optional
+
+from book_metrics import SERIES_BUCKET, SERIES_WINDOW, BookMetricsSeries, compute_metrics
+from burst_detector import BurstMonitor, get_burst_monitor
+from order_flow import OrderFlowAggregator
+from shm_ring import SharedRing
+from trade_counters import RollingCounter
+from trade_index import LargeTradeIndex
+from trade_tape import TradeTape
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних крупных сделок держать по каждой стороне
+MAX_LARGE_TRADES = 50
+
+# Окна метрик потока ордеров: секунды (None - вся сессия)
+ORDER_FLOW_WINDOWS = (10, 60, 300, None)
+
+# Запись сделки в кольце: время (с), цена, объем, направление, номер инструмента (команда "slot")
+TRADE_RECORD = struct.Struct("ddqbxH4x")
+TRADE_RING_CAPACITY = 65536
+
+# Запись стакана: время, число bids, число asks, затем по BOOK_DEPTH цен и объемов каждой стороны
+BOOK_DEPTH = 50
+BOOK_RECORD = struct.Struct(f"dHH4x{BOOK_DEPTH}d{BOOK_DEPTH}q{BOOK_DEPTH}d{BOOK_DEPTH}q")
+BOOK_RING_CAPACITY = 256
+
+# Как часто процесс аналитики отдает снимок результатов, секунды
+SNAPSHOT_INTERVAL = 0.25
+
+# Пауза процесса аналитики, когда кольца пусты
+IDLE_SLEEP = 0.005
+
+# Как часто процесс аналитики сохраняет базовые линии всплесков, секунды
+BURST_SAVE_INTERVAL = 300.0
+
+# Теплый старт ждет, пока писатель базы тиков догонит живые сделки (не дольше), и как часто проверяет
+WARM_START_WAIT = 2.0
+WARM_START_POLL = 0.1
+
+
+class AnalyticsEngine:
+    """Вся аналитика ленты сделок и стакана без Qt.
+
+    Сделки и снимки стакана подаются по одному (on_trade/on_book), наружу
+    уходит только компактный snapshot(): счетчики, метрики окон, состояние
+    всплеска, скаляры стакана и крупные сделки, появившиеся с прошлого снимка.
+    """
+
+    def __init__(self, threshold: int = 1000, burst_monitor: Optional[BurstMonitor] = None):
+        self.large_trades = LargeTradeIndex(threshold=threshold, max_entries=MAX_LARGE_TRADES)
+        self.trade_counter = RollingCounter(horizon=3600)  # сделки по секундам за последний час
+        self.trade_tape = TradeTape()  # все сделки сессии в колоночном виде
+        self.order_flow = OrderFlowAggregator(ORDER_FLOW_WINDOWS)
+        self.burst_monitor = burst_monitor or get_burst_monitor()
+        self.instrument_key = None  # инструмент, чьи сделки сейчас приходят
+        self.book_series = BookMetricsSeries()  # метрики стакана по снимкам
+        self.last_book_metrics = None
+        self._new_large: List[tuple] = []
+        self._large_reset: Optional[Dict[int, List[tuple]]] = None
+        self._warm_start: Optional[tuple] = None  # (инструмент, начало, крайний срок ожидания)
+        self._held: List[tuple] = []  # живые сделки, пришедшие во время теплого старта
+        self._next_warm_check = 0.0
+        self._slots: Dict[int, str] = {}  # номер инструмента в кольце -> инструмент
+        self._unresolved: List[tuple] = []  # записи кольца, номер которых еще не пришел командой
+
+    def on_trade(self, ts: float, price: float, quantity: int, direction: int, live: bool = True):
+        if live and self._warm_start is not None:
+            self._held.append((ts, price, quantity, direction))
+            return
+        seq = self.trade_tape.append(int(ts * 1_000_000), price, quantity, direction)
+        self.trade_counter.add(ts)
+        self.order_flow.add(ts, price, quantity, direction)
+        # История из базы тиков не учится базовой линией всплесков повторно
+        if live and self.instrument_key:
+            self.burst_monitor.add(self.instrument_key, ts, quantity)
+        if self.large_trades.add(seq, quantity, direction):
+            self._new_large.append(self._large_row(seq))
+
+    def on_instrument_trade(self, key: str, ts: float, price: float, quantity: int, direction: int):
+        """Сделка любого инструмента стрима: лента и метрики - только по выбранному,
+        базовые линии всплесков учатся по всем"""
+        if key == self.instrument_key:
+            self.on_trade(ts, price, quantity, direction)
+        else:
+            self.burst_monitor.add(key, ts, quantity)
+
+    def set_slot(self, slot: int, key: str):
+        self._slots[slot] = key
+        if self._unresolved:
+            unresolved, self._unresolved = self._unresolved, []
+            self.on_records(unresolved)
+
+    def on_records(self, records):
+        """Записи кольца сделок. Команда с номером инструмента идет очередью и может
+        отстать от первых записей - они ждут ее в порядке прихода"""
+        slots = self._slots
+        for record in records:
+            ts, price, quantity, direction, slot = record
+            key = slots.get(slot)
+            if key is None or self._unresolved:
+                self._unresolved.append(record)
+                continue
+            self.on_instrument_trade(key, ts, price, quantity, direction)
+
+    def on_book(self, ts: float, bid_prices: array, bid_quantities: array, ask_prices: array, ask_quantities: array):
+        metrics = compute_metrics(bid_prices, bid_quantities, ask_prices, ask_quantities)
+        if metrics is not None:
+            self.book_series.append(ts, metrics)
+            self.last_book_metrics = metrics
+
+    def _large_row(self, seq: int) -> tuple:
+        ts_us, price, quantity, direction = self.trade_tape.row(seq)
+        return direction, ts_us, price, quantity
+
+    def set_threshold(self, threshold: int):
+        """Смена порога: последние крупные сделки берутся запросом диапазона из индекса по объему"""
+        recent = self.large_trades.set_threshold(threshold)
+        self._new_large = []
+        self._large_reset = {
+            int(direction): [self._large_row(seq) for seq in seqs] for direction, seqs in recent.items()
+        }
+
+    def set_instrument(self, key: Optional[str]):
+        """Инструмент, сделки которого будут приходить; базовые линии прошлого сохраняются"""
+        if self.instrument_key and self.instrument_key != key:
+            self.burst_monitor.save()
+        self.instrument_key = key
+        self.book_series.clear()
+        self.last_book_metrics = None
+
+    def set_z_threshold(self, z_threshold: float):
+        self.burst_monitor.set_z_threshold(z_threshold)
+
+    def warm_start(self, instrument: str, start: float):
+        """Очищает ленту и восстанавливает сделки инструмента с start из базы тиков.
+
+        Живые сделки до завершения придерживаются: база пишется с задержкой,
+        поэтому история дочитывается, когда писатель догонит первую из них
+        (или через WARM_START_WAIT). Граница - последняя сделка в базе: все,
+        что не позже нее, берется из базы, придержанные сделки до нее
+        отбрасываются, остальные идут следом.
+        """
+        self.clear()
+        self._warm_start = (instrument, start, time.monotonic() + WARM_START_WAIT)
+        self._next_warm_check = 0.0
+        self.poll_warm_start()
+
+    def poll_warm_start(self):
+        """Завершает отложенный теплый старт, когда база тиков готова. Вызывается в цикле обработки."""
+        if self._warm_start is None or time.monotonic() < self._next_warm_check:
+            return
+        self._next_warm_check = time.monotonic() + WARM_START_POLL
+        from market_events import PRICE_SCALE
+        from tick_db import get_tick_db
+
+        instrument, start, deadline = self._warm_start
+        try:
+            db = get_tick_db()
+            time_range = db.time_range(instrument)
+            cutoff = time_range[1] if time_range else None
+            timed_out = time.monotonic() >= deadline
+            # Сделки в базе идут пачками в порядке стрима: если в ней есть первая придержанная,
+            # то есть и все, что было до нее
+            caught_up = bool(self._held) and cutoff is not None and cutoff // 1000 >= round(self._held[0][0] * 1e6)
+            if not caught_up and not timed_out:
+                return
+            rows = db.trades(instrument, start) if cutoff is not None else []
+        except Exception as e:
+            logger.error(f"Failed to read tick database: {e}")
+            rows, cutoff = [], None
+
+        held, self._held = self._held, []
+        self._warm_start = None
+        replayed = 0
+        for ts_ns, price, quantity, direction in rows:
+            if ts_ns > cutoff:
+                break
+            self.on_trade(ts_ns / 1e9, price / PRICE_SCALE, quantity, direction, live=False)
+            replayed += 1
+        cutoff_us = cutoff // 1000 if cutoff is not None else None
+        for ts, price, quantity, direction in held:
+            # Время в кольце - float секунды; сравнение по микросекундам (точность времени биржи)
+            if cutoff_us is None or round(ts * 1e6) > cutoff_us:
+                self.on_trade(ts, price, quantity, direction)
+        # Крупные сделки истории уходят в окно таблицами целиком
+        self.set_threshold(self.large_trades.threshold)
+        logger.info(f"Warm start of {instrument}: {replayed} trades from the tick database, {len(held)} held live trades")
+
+    def clear(self):
+        self.large_trades.clear()
+        self.trade_tape.clear()
+        self.order_flow.clear()
+        self.trade_counter.clear()
+        self._new_large = []
+        self._large_reset = {}
+        self._warm_start = None
+        self._held = []
+
+    def _burst_snapshot(self, now: float) -> Optional[dict]:
+        if not self.instrument_key:
+            return None
+        detector = self.burst_monitor.detector(self.instrument_key)
+        detector.advance(now)
+        state = detector.state()
+        state["warm"] = detector.warm
+        state["samples"] = detector.samples
+        state["z_threshold"] = self.burst_monitor.z_threshold
+        return state
+
+    def _book_snapshot(self) -> Optional[dict]:
+        metrics = self.last_book_metrics
+        if metrics is None:
+            return None
+        snapshot = {name: metrics[name] for name in ("best_bid", "best_ask", "mid", "spread", "spread_bps",
+                                                     "microprice", "imbalance", "walls")}
+        # Накопленная глубина нужна на экране только итогом
+        snapshot["bid_depth"] = metrics["bid_depth"][-1] if metrics["bid_depth"] else 0
+        snapshot["ask_depth"] = metrics["ask_depth"][-1] if metrics["ask_depth"] else 0
+        return snapshot
+
+    def snapshot(self, now: Optional[float] = None) -> dict:
+        """Результаты для отображения; крупные сделки - только новые с прошлого вызова.
+
+        Если large_trades_reset не None, таблицы крупных сделок надо заменить
+        им целиком (сменился порог или история очищена).
+        """
+        now = time.time() if now is None else now
+        snapshot = {
+            "ts": now,
+            "minute": self.trade_counter.since(now // 60 * 60),
+            "five_min": self.trade_counter.since(now // 300 * 300),
+            "last_60": self.trade_counter.last(60, now),
+            "order_flow": self.order_flow.metrics(now),
+            "burst": self._burst_snapshot(now),
+            "book": self._book_snapshot(),
+            # Ряд метрик стакана: средние по SERIES_BUCKET секунд за последние SERIES_WINDOW секунд
+            "book_series": self.book_series.downsample(now - SERIES_WINDOW, SERIES_BUCKET),
+            "large_trades": self._new_large,
+            "large_trades_reset": self._large_reset,
+            "tape_size": len(self.trade_tape),
+        }
+        self._new_large = []
+        self._large_reset = None
+        return snapshot
+
+    def close(self):
+        self.trade_tape.close()
+        self.burst_monitor.save()
+
+
+def _book_values(ts: float, bid_prices, bid_quantities, ask_prices, ask_quantities) -> list:
+    """Снимок стакана -> значения записи BOOK_RECORD (лишние уровни отбрасываются, недостающие - нули)."""
+    n_bids = min(len(bid_prices), BOOK_DEPTH)
+    n_asks = min(len(ask_prices), BOOK_DEPTH)
+    values = [ts, n_bids, n_asks]
+    for column, count, zero in ((bid_prices, n_bids, 0.0), (bid_quantities, n_bids, 0),
+                                (ask_prices, n_asks, 0.0), (ask_quantities, n_asks, 0)):
+        values.extend(column[:count])
+        values.extend([zero] * (BOOK_DEPTH - count))
+    return values
+
+
+def _book_arrays(record: tuple):
+    ts, n_bids, n_asks = record[:3]
+    offset = 3
+    columns = []
+    for code, count in (("d", n_bids), ("q", n_bids), ("d", n_asks), ("q", n_asks)):
+        columns.append(array(code, record[offset:offset + count]))
+        offset += BOOK_DEPTH
+    return ts, columns
+
+
+def _apply_command(engine: AnalyticsEngine, command: tuple):
+    name, *args = command
+    if name == "threshold":
+        engine.set_threshold(*args)
+    elif name == "instrument":
+        engine.set_instrument(*args)
+    elif name == "z_threshold":
+        engine.set_z_threshold(*args)
+    elif name == "clear":
+        engine.clear()
+    elif name == "warm_start":
+        engine.warm_start(*args)
+    elif name == "slot":
+        engine.set_slot(*args)
+    else:
+        logger.warning(f"Unknown analytics command: {name}")
+
+
+def run_engine(trade_ring_name: str, book_ring_name: str, commands, results, threshold: int):
+    """Точка входа процесса аналитики: читает кольца, раз в SNAPSHOT_INTERVAL отдает снимок."""
+    trade_ring = SharedRing.attach(TRADE_RECORD, TRADE_RING_CAPACITY, trade_ring_name)
+    book_ring = SharedRing.attach(BOOK_RECORD, BOOK_RING_CAPACITY, book_ring_name)
+    engine = AnalyticsEngine(threshold)
+    next_snapshot = time.monotonic()
+    # Процесс может быть снят terminate() - базовые линии сохраняются и по ходу работы
+    next_save = time.monotonic() + BURST_SAVE_INTERVAL
+    try:
+        while True:
+            try:
+                while True:
+                    command = commands.get_nowait()
+                    if command[0] == "stop":
+                        return
+                    _apply_command(engine, command)
+            except queue.Empty:
+                pass
+
+            trades = trade_ring.pop_all()
+            engine.on_records(trades)
+            # Из стаканов важен только последний, но ряд метрик собирается по каждому
+            books = book_ring.pop_all()
+            for record in books:
+                ts, columns = _book_arrays(record)
+                engine.on_book(ts, *columns)
+            engine.poll_warm_start()
+
+            if time.monotonic() >= next_snapshot:
+                results.put(engine.snapshot())
+                next_snapshot = time.monotonic() + SNAPSHOT_INTERVAL
+            if time.monotonic() >= next_save:
+                engine.burst_monitor.save()
+                next_save = time.monotonic() + BURST_SAVE_INTERVAL
+            if not trades and not books:
+                time.sleep(IDLE_SLEEP)
+    finally:
+        engine.close()
+        trade_ring.close()
+        book_ring.close()
+
+
+class AnalyticsProcess:
+    """Сторона GUI: кладет сделки и стаканы в кольца, забирает снимки результатов.
+
+    Писатель в кольца один - поток GUI, читатель один - процесс аналитики,
+    поэтому блокировки не нужны. Если процесс запустить не удалось, тот же
+    AnalyticsEngine работает в текущем процессе.
+    """
+
+    def __init__(self, threshold: int = 1000):
+        self._trade_ring: Optional[SharedRing] = None
+        self._book_ring: Optional[SharedRing] = None
+        self._process = None
+        self._local: Optional[AnalyticsEngine] = None
+        self._next_local_snapshot = 0.0
+        self._slots: Dict[str, int] = {}
+        try:
+            context = multiprocessing.get_context("spawn")
+            self._trade_ring = SharedRing(TRADE_RECORD, TRADE_RING_CAPACITY)
+            self._book_ring = SharedRing(BOOK_RECORD, BOOK_RING_CAPACITY)
+            self._commands = context.Queue()
+            self._results = context.Queue()
+            self._process = context.Process(
+                target=run_engine,
+                args=(self._trade_ring.name, self._book_ring.name, self._commands, self._results, threshold),
+                name="analytics",
+                daemon=True,
+            )
+            self._process.start()
+        except Exception as e:
+            logger.error(f"Analytics process failed to start, running in-process: {e}")
+            self._close_rings()
+            self._process = None
+            self._local = AnalyticsEngine(threshold)
+
+    @property
+    def dropped(self) -> int:
+        """Сколько записей не поместилось в кольца, пока процесс аналитики отставал."""
+        return sum(ring.dropped for ring in (self._trade_ring, self._book_ring) if ring is not None)
+
+    def push_trade(self, key: str, ts: float, price: float, quantity: int, direction: int):
+        """Сделка инструмента key; в кольце инструмент - номер, выданный командой "slot"."""
+        if self._local is not None:
+            self._local.on_instrument_trade(key, ts, price, quantity, direction)
+            return
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._slots[key] = len(self._slots)
+            self._commands.put(("slot", slot, key))
+        self._trade_ring.push(ts, price, quantity, direction, slot)
+
+    def push_book(self, ts: float, bid_prices, bid_quantities, ask_prices, ask_quantities):
+        if self._local is not None:
+            self._local.on_book(ts, bid_prices, bid_quantities, ask_prices, ask_quantities)
+        else:
+            self._book_ring.push(*_book_values(ts, bid_prices, bid_quantities, ask_prices, ask_quantities))
+
+    def send(self, name: str, *args):
+        if self._local is not None:
+            _apply_command(self._local, (name, *args))
+        else:
+            self._commands.put((name, *args))
+
+    def poll(self) -> Optional[dict]:
+        """Последний готовый снимок или None; крупные сделки всех пропущенных снимков сливаются."""
+        if self._local is not None:
+            self._local.poll_warm_start()
+            if time.monotonic() < self._next_local_snapshot:
+                return None
+            self._next_local_snapshot = time.monotonic() + SNAPSHOT_INTERVAL
+            return self._local.snapshot()
+
+        latest = None
+        large_trades = []
+        reset = None
+        while True:
+            try:
+                snapshot = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if snapshot["large_trades_reset"] is not None:
+                reset = snapshot["large_trades_reset"]
+                large_trades = []
+            large_trades.extend(snapshot["large_trades"])
+            latest = snapshot
+        if latest is not None:
+            latest["large_trades"] = large_trades
+            latest["large_trades_reset"] = reset
+        return latest
+
+    def _close_rings(self):
+        for ring in (self._trade_ring, self._book_ring):
+            if ring is not None:
+                ring.close()
+        self._trade_ring = self._book_ring = None
+
+    def stop(self, timeout: float = 2.0):
+        if self._local is not None:
+            self._local.close()
+            return
+        if self._process is None:
+            return
+        self._commands.put(("stop",))
+        self._process.join(timeout)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join(timeout)
+        self._process = None
+        self._close_rings()
@@ -1,24 +1,55 @@
+import logging
 import time 
 import threading
 from datetime import datetime, timedelta
 from PyQt5.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QComboBox, QTableWidget,
     QTableWidgetItem, QHeaderView, QMessageBox, QGroupBox, QScrollArea,
-    QSplitter, QProgressBar, QLineEdit, QSpinBox
+    QSplitter, QProgressBar, QLineEdit, QSpinBox, QDoubleSpinBox
 )
-from PyQt5.QtCore import Qt, pyqtSignal, QObject, QMetaObject, Q_ARG, QTimer, pyqtSlot
+from PyQt5.QtCore import Qt, pyqtSignal, QObject, QMetaObject, Q_ARG, QTimer
 from PyQt5.QtGui import QColor, QFont
 from tinkoff.invest import TradeDirection
 import pytz
+from analytics_engine import MAX_LARGE_TRADES, ORDER_FLOW_WINDOWS, AnalyticsProcess
+from bar_builder import INTERVALS, get_bar_builder
+from book_metrics import SERIES_BUCKET, SERIES_WINDOW
+from burst_detector import BUCKET_SECONDS, Z_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+# Заголовки столбцов окон потока ордеров
+ORDER_FLOW_HEADERS = ["10 с", "1 мин", "5 мин", "Сессия"]
+
+# Строки таблицы потока ордеров: ключ метрики -> подпись
+ORDER_FLOW_ROWS = (
+    ('vwap', "VWAP"),
+    ('delta', "Дельта объема"),
+    ('buy_sell_ratio', "Покупки/продажи"),
+    ('avg_size', "Средняя сделка"),
+    ('rate', "Сделок/с"),
+    ('volume', "Объем"),
+)
+
+# Подписи интервалов баров
+BAR_INTERVAL_NAMES = {1: "1 с", 5: "5 с", 60: "1 мин", 300: "5 мин", 900: "15 мин", 3600: "1 ч"}
+BAR_COLUMNS = ("open", "high", "low", "close", "volume", "buy_volume", "sell_volume")
+
+# Цвета строк крупных сделок: (фон, текст)
+LARGE_TRADE_COLORS = {
+    TradeDirection.TRADE_DIRECTION_BUY: (QColor(40, 60, 40), QColor(Qt.green)),
+    TradeDirection.TRADE_DIRECTION_SELL: (QColor(60, 40, 40), QColor(Qt.red)),
+}
 
 class AnalyticsWindow(QGroupBox):
     def __init__(self, parent=None):
         super().__init__("АНАЛИТИКА СДЕЛОК")
         self.parent = parent
-        self.large_buys = []
-        self.large_sells = []
-        self.trade_timestamps = []  # Хранит (timestamp, broker_time)
-        self.all_trades_history = []
+        # Расчеты идут в отдельном процессе; сюда возвращаются только снимки результатов
+        self.engine = AnalyticsProcess(threshold=1000)
+        self.instrument_key = None  # инструмент, чьи сделки сейчас приходят
+        self.last_snapshot = None
+        self.dropped = 0  # записи, не поместившиеся в кольца процесса аналитики
         
         # Таймеры для сброса счетчиков
         self.current_minute = None
@@ -42,15 +73,29 @@ class AnalyticsWindow(QGroupBox):
         
         self.apply_filters_button = QPushButton("Применить фильтры")
         self.apply_filters_button.clicked.connect(self._filter_and_display_data)
+        self.trade_threshold_input.returnPressed.connect(self._filter_and_display_data)
         
         self.clear_history_button = QPushButton("Очистить историю")
         self.clear_history_button.clicked.connect(self.clear_history)
         self.clear_history_button.setStyleSheet("background-color: #f44336; color: white;")
 
+        self.load_session_button = QPushButton("Загрузить сессию")
+        self.load_session_button.setToolTip("Заново прочитать сделки сессии из локальной базы тиков")
+        self.load_session_button.clicked.connect(self.reload_session)
+
         filter_layout.addWidget(QLabel("Порог сделок:"))
         filter_layout.addWidget(self.trade_threshold_input)
         filter_layout.addWidget(self.apply_filters_button)
         filter_layout.addWidget(self.clear_history_button)
+        filter_layout.addWidget(self.load_session_button)
+
+        self.burst_threshold_input = QDoubleSpinBox()
+        self.burst_threshold_input.setRange(1.0, 10.0)
+        self.burst_threshold_input.setSingleStep(0.5)
+        self.burst_threshold_input.setValue(Z_THRESHOLD)
+        self.burst_threshold_input.valueChanged.connect(lambda value: self.engine.send("z_threshold", value))
+        filter_layout.addWidget(QLabel("Всплеск от (σ):"))
+        filter_layout.addWidget(self.burst_threshold_input)
         filter_layout.addStretch()
 
         main_layout.addLayout(filter_layout)
@@ -79,6 +124,52 @@ class AnalyticsWindow(QGroupBox):
         trades_splitter.addWidget(sell_group)
 
         main_layout.addWidget(trades_splitter)
+        self.large_trade_tables = {
+            TradeDirection.TRADE_DIRECTION_BUY: self.large_buys_table,
+            TradeDirection.TRADE_DIRECTION_SELL: self.large_sells_table,
+        }
+
+        # Метрики потока ордеров по скользящим окнам
+        order_flow_group = QGroupBox("Поток ордеров")
+        order_flow_layout = QVBoxLayout(order_flow_group)
+        self.order_flow_table = QTableWidget(len(ORDER_FLOW_ROWS), len(ORDER_FLOW_WINDOWS))
+        self.order_flow_table.setHorizontalHeaderLabels(ORDER_FLOW_HEADERS)
+        self.order_flow_table.setVerticalHeaderLabels([title for _, title in ORDER_FLOW_ROWS])
+        self.order_flow_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.order_flow_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        order_flow_layout.addWidget(self.order_flow_table)
+        main_layout.addWidget(order_flow_group)
+
+        # Текущие бары по интервалам (строятся локально из сделок)
+        bars_group = QGroupBox("Бары")
+        bars_layout = QVBoxLayout(bars_group)
+        self.bars_table = QTableWidget(len(INTERVALS), len(BAR_COLUMNS))
+        self.bars_table.setHorizontalHeaderLabels(["Откр.", "Макс.", "Мин.", "Закр.", "Объем", "Покупки", "Продажи"])
+        self.bars_table.setVerticalHeaderLabels([BAR_INTERVAL_NAMES.get(i, f"{i} с") for i in INTERVALS])
+        self.bars_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.bars_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        bars_layout.addWidget(self.bars_table)
+        main_layout.addWidget(bars_group)
+
+        # Микроструктура стакана (последний снимок)
+        book_group = QGroupBox("Стакан")
+        book_group_layout = QVBoxLayout(book_group)
+        book_layout = QHBoxLayout()
+        self.book_spread_label = QLabel("Спред: -")
+        self.book_mid_label = QLabel("Mid: -")
+        self.book_microprice_label = QLabel("Микроцена: -")
+        self.book_imbalance_label = QLabel("Дисбаланс: -")
+        self.book_depth_label = QLabel("Глубина: -")
+        self.book_walls_label = QLabel("Стены: -")
+        self.book_walls_label.setWordWrap(True)
+        for label in (self.book_spread_label, self.book_mid_label, self.book_microprice_label,
+                      self.book_imbalance_label, self.book_depth_label, self.book_walls_label):
+            book_layout.addWidget(label)
+        book_group_layout.addLayout(book_layout)
+        # Ряд метрик по снимкам из процесса аналитики
+        self.book_trend_label = QLabel(f"За {SERIES_WINDOW // 60} мин: -")
+        book_group_layout.addWidget(self.book_trend_label)
+        main_layout.addWidget(book_group)
 
         # Группа для счетчиков сделок
         counters_group = QGroupBox("Счетчики сделок")
@@ -110,9 +201,18 @@ class AnalyticsWindow(QGroupBox):
         self.time_layout = QHBoxLayout()
         self.current_time_label = QLabel("Время брокера: --:--:--")
         self.next_reset_label = QLabel("Сброс через: --:--")
+        self.rate_label = QLabel("За 60 секунд: 0")
         self.time_layout.addWidget(self.current_time_label)
+        self.time_layout.addWidget(self.rate_label)
         self.time_layout.addWidget(self.next_reset_label)
+        # Появляется, только если процесс аналитики не успевал разбирать кольца
+        self.dropped_label = QLabel()
+        self.dropped_label.setStyleSheet("color: #FF5252;")
+        self.dropped_label.setVisible(False)
+        self.time_layout.addWidget(self.dropped_label)
 
+        self.burst_label = QLabel("Активность: нет данных")
+        counters_layout.addWidget(self.burst_label)
         counters_layout.addLayout(self.minute_layout)
         counters_layout.addLayout(self.five_min_layout)
         counters_layout.addLayout(self.time_layout)
@@ -124,6 +224,11 @@ class AnalyticsWindow(QGroupBox):
         self.ui_timer.timeout.connect(self.update_ui_time)
         self.ui_timer.start(1000)  # Обновляем каждую секунду
 
+        # Таймер для приема результатов процесса аналитики
+        self.results_timer = QTimer()
+        self.results_timer.timeout.connect(self.poll_engine)
+        self.results_timer.start(250)
+
     def reset_timers(self):
         """Сбрасывает счетчики в зависимости от интервала"""
         now = datetime.now(self.broker_timezone)
@@ -132,15 +237,13 @@ class AnalyticsWindow(QGroupBox):
         new_minute = now.replace(second=0, microsecond=0)
         if self.current_minute != new_minute:
             self.current_minute = new_minute
-            self.minute_bar.setValue(0)
-            self.minute_label.setText("0")
+            self._show_counter(self.minute_bar, self.minute_label, 0)
         
         # Обновляем 5-минутный интервал (каждые 5 минут)
         new_5min = now.replace(minute=(now.minute // 5) * 5, second=0, microsecond=0)
         if self.current_5min_interval != new_5min:
             self.current_5min_interval = new_5min
-            self.five_min_bar.setValue(0)
-            self.five_min_label.setText("0")
+            self._show_counter(self.five_min_bar, self.five_min_label, 0)
         
         # Рассчитываем время следующего сброса
         next_minute = self.current_minute + timedelta(minutes=1)
@@ -153,6 +256,7 @@ class AnalyticsWindow(QGroupBox):
         """Обновляет отображение времени и проверяет сброс счетчиков"""
         now = datetime.now(self.broker_timezone)
         self.current_time_label.setText(f"Время брокера: {now.strftime('%H:%M:%S')}")
+        self.display_bars()
         
         # Проверяем, не настало ли время сброса
         if now >= self.next_reset_time:
@@ -164,37 +268,152 @@ class AnalyticsWindow(QGroupBox):
             f"Сброс через: {time_left.seconds // 60}:{time_left.seconds % 60:02d}"
         )
 
-    def update_trade_counters(self, broker_time):
-        """Обновляет счетчики сделок на основе времени брокера"""
-        broker_time = broker_time.astimezone(self.broker_timezone)
-        
-        # Считаем сделки за текущую минуту
-        if broker_time.replace(second=0, microsecond=0) == self.current_minute:
-            minute_trades = sum(
-                1 for _, bt in self.trade_timestamps 
-                if bt.astimezone(self.broker_timezone).replace(second=0, microsecond=0) == self.current_minute
-            )
-            self.minute_bar.setValue(minute_trades)
-            self.minute_label.setText(str(minute_trades))
-        
-        # Считаем сделки за текущую 5-минутку
-        if broker_time.replace(minute=(broker_time.minute // 5) * 5, second=0, microsecond=0) == self.current_5min_interval:
-            five_min_trades = sum(
-                1 for _, bt in self.trade_timestamps 
-                if bt.astimezone(self.broker_timezone).replace(
-                    minute=(bt.minute // 5) * 5, second=0, microsecond=0
-                ) == self.current_5min_interval
-            )
-            self.five_min_bar.setValue(five_min_trades)
-            self.five_min_label.setText(str(five_min_trades))
+    def poll_engine(self):
+        """Забирает последний снимок результатов процесса аналитики и показывает его"""
+        self.check_dropped()
+        snapshot = self.engine.poll()
+        if snapshot is None:
+            return
+        self.last_snapshot = snapshot
+        self._show_counter(self.minute_bar, self.minute_label, snapshot['minute'])
+        self._show_counter(self.five_min_bar, self.five_min_label, snapshot['five_min'])
+        self.rate_label.setText(f"За 60 секунд: {snapshot['last_60']}")
+        self.update_order_flow(snapshot['order_flow'])
+        self.update_burst_state(snapshot['burst'])
+        self.display_book_metrics(snapshot['book'])
+        self.display_book_series(snapshot['book_series'])
+        if snapshot['large_trades_reset'] is not None:
+            self.display_large_trades(snapshot['large_trades_reset'])
+        for trade in snapshot['large_trades']:
+            self._append_large_trade(trade)
+
+    def check_dropped(self):
+        """Потери в кольцах: метрики неполны, пользователь должен это видеть"""
+        dropped = self.engine.dropped
+        if dropped == self.dropped:
+            return
+        logger.warning(f"Analytics process is lagging: {dropped - self.dropped} records dropped ({dropped} total)")
+        self.dropped = dropped
+        self.dropped_label.setText(f"Пропущено записей: {dropped}")
+        self.dropped_label.setVisible(True)
+
+    def _show_counter(self, bar, label, trades):
+        bar.setValue(min(trades, bar.maximum()))
+        label.setText(str(trades))
+
+    def update_order_flow(self, metrics):
+        """Показывает метрики потока ордеров, посчитанные процессом аналитики"""
+        for column, window in enumerate(ORDER_FLOW_WINDOWS):
+            values = metrics[window]
+            for row, (key, _) in enumerate(ORDER_FLOW_ROWS):
+                value = values[key]
+                if value is None:
+                    text = "-"
+                elif key in ('delta', 'volume'):
+                    text = f"{value:+d}" if key == 'delta' else str(value)
+                else:
+                    text = f"{value:.3f}" if key == 'vwap' else f"{value:.2f}"
+                item = self.order_flow_table.item(row, column)
+                if item is None:
+                    self.order_flow_table.setItem(row, column, QTableWidgetItem(text))
+                elif item.text() != text:
+                    item.setText(text)
+
+    def update_book(self, book):
+        """Снимок стакана (BookSnapshot) уходит в процесс аналитики; метрики вернутся в снимке результатов"""
+        self.engine.push_book(book.ts, *book.float_arrays())
+
+    def display_book_metrics(self, metrics):
+        if metrics is None:
+            return
+        self.book_spread_label.setText(f"Спред: {metrics['spread']:.3f} ({metrics['spread_bps']:.1f} bps)")
+        self.book_mid_label.setText(f"Mid: {metrics['mid']:.3f}")
+        self.book_microprice_label.setText(f"Микроцена: {metrics['microprice']:.3f}")
+        self.book_imbalance_label.setText(f"Дисбаланс: {metrics['imbalance']:+.2f}")
+        self.book_depth_label.setText(f"Глубина: {metrics['bid_depth']} / {metrics['ask_depth']}")
+        walls = ", ".join(
+            f"{'покупка' if side == 'bid' else 'продажа'} {price:.3f} ({qty})" for side, price, qty in metrics['walls']
+        )
+        self.book_walls_label.setText(f"Стены: {walls or '-'}")
+
+    def display_book_series(self, series):
+        """Сводка ряда метрик стакана за окно: средние по интервалам и изменение mid"""
+        points = len(series['ts'])
+        if not points:
+            self.book_trend_label.setText(f"За {SERIES_WINDOW // 60} мин: -")
+            return
+        spread = sum(series['spread']) / points
+        imbalance = sum(series['imbalance']) / points
+        mid_change = series['mid'][-1] - series['mid'][0]
+        self.book_trend_label.setText(
+            f"За {SERIES_WINDOW // 60} мин ({points} x {SERIES_BUCKET} с): средний спред {spread:.3f}, "
+            f"средний дисбаланс {imbalance:+.2f}, mid {mid_change:+.3f}, "
+            f"дисбаланс сейчас/начало {series['imbalance'][-1]:+.2f}/{series['imbalance'][0]:+.2f}"
+        )
+
+    def display_bars(self):
+        if not self.instrument_key:
+            return
+        builder = get_bar_builder()
+        for row, interval in enumerate(INTERVALS):
+            bar = builder.current(self.instrument_key, interval)
+            for column, name in enumerate(BAR_COLUMNS):
+                if bar is None:
+                    text = "-"
+                else:
+                    value = getattr(bar, name)
+                    text = f"{value:.3f}" if isinstance(value, float) else str(value)
+                item = self.bars_table.item(row, column)
+                if item is None:
+                    self.bars_table.setItem(row, column, QTableWidgetItem(text))
+                elif item.text() != text:
+                    item.setText(text)
+
+    def set_instrument(self, key):
+        """Инструмент, сделки которого будут приходить; базовые линии прошлого сохраняются"""
+        self.instrument_key = key
+        self.engine.send("instrument", key)
+        self.reload_session()
+
+    def reload_session(self):
+        """Очищает историю и восстанавливает сессию инструмента из базы тиков.
+
+        Очистка и чтение базы - одна команда процессу аналитики: он сам дожидается
+        писателя базы и сшивает историю с живыми сделками без пропусков и повторов.
+        """
+        if not self.instrument_key:
+            self.clear_history()
+            return
+        self._reset_history_view()
+        session_start = datetime.now(self.broker_timezone).replace(hour=0, minute=0, second=0, microsecond=0)
+        self.engine.send("warm_start", self.instrument_key, session_start.timestamp())
+
+    def update_burst_state(self, state):
+        """Показывает отклонение активности от базовой линии инструмента и масштабирует шкалы по ней"""
+        if state is None:
+            return
+        if not state['warm']:
+            self.burst_label.setText(f"Активность: набираем базовую линию ({state['samples']} интервалов)")
+            self.burst_label.setStyleSheet("")
+            return
+        text = f"Активность: {state['trades']} сделок за {BUCKET_SECONDS} с, z = {state['trades_z']:.1f} / объем z = {state['volume_z']:.1f}"
+        if state['burst']:
+            self.burst_label.setText(f"ВСПЛЕСК! {text}")
+            self.burst_label.setStyleSheet("color: #FF5252; font-weight: bold;")
+        else:
+            self.burst_label.setText(text)
+            self.burst_label.setStyleSheet("")
+        # Шкалы: ожидаемое число сделок плюс запас до порога всплеска
+        per_bucket = state['expected_trades'] + state['z_threshold'] * state['trades_std']
+        self.minute_bar.setRange(0, max(int(per_bucket * 60 / BUCKET_SECONDS), 10))
+        self.five_min_bar.setRange(0, max(int(per_bucket * 300 / BUCKET_SECONDS), 50))
 
     def clear_history(self):
         """Полностью очищает историю и сбрасывает счетчики"""
-        self.large_buys = []
-        self.large_sells = []
-        self.all_trades_history = []
-        self.trade_timestamps = []
-        
+        self.engine.send("clear")
+        self._reset_history_view()
+
+    def _reset_history_view(self):
         self.large_buys_table.setRowCount(0)
         self.large_sells_table.setRowCount(0)
         
@@ -213,71 +432,55 @@ class AnalyticsWindow(QGroupBox):
         self._filter_and_display_large_trades(trade_threshold)
 
     def _filter_and_display_large_trades(self, threshold):
-        self.large_buys = []
-        self.large_sells = []
-
-        for trade in self.all_trades_history:
-            if trade['quantity'] >= threshold:
-                if trade["direction"] == TradeDirection.TRADE_DIRECTION_BUY:
-                    self.large_buys.append(trade)
-                elif trade["direction"] == TradeDirection.TRADE_DIRECTION_SELL:
-                    self.large_sells.append(trade)
-        
-        max_entries = 50
-        if len(self.large_buys) > max_entries:
-            self.large_buys = self.large_buys[-max_entries:]
-        if len(self.large_sells) > max_entries:
-            self.large_sells = self.large_sells[-max_entries:]
-
-        self.display_large_trades()
-
-    def display_large_trades(self):
-        self.large_buys_table.setRowCount(len(self.large_buys))
-        for row, trade in enumerate(self.large_buys):
-            self.large_buys_table.setItem(row, 0, QTableWidgetItem(f"{trade['price']:.3f}"))
-            self.large_buys_table.setItem(row, 1, QTableWidgetItem(str(trade['quantity'])))
-            self.large_buys_table.setItem(row, 2, QTableWidgetItem(trade['time']))
-            for col in range(3):
-                item = self.large_buys_table.item(row, col)
-                if item:
-                    item.setBackground(QColor(40, 60, 40))
-                    item.setForeground(QColor(Qt.green))
-
-        self.large_sells_table.setRowCount(len(self.large_sells))
-        for row, trade in enumerate(self.large_sells):
-            self.large_sells_table.setItem(row, 0, QTableWidgetItem(f"{trade['price']:.3f}"))
-            self.large_sells_table.setItem(row, 1, QTableWidgetItem(str(trade['quantity'])))
-            self.large_sells_table.setItem(row, 2, QTableWidgetItem(trade['time']))
-            for col in range(3):
-                item = self.large_sells_table.item(row, col)
-                if item:
-                    item.setBackground(QColor(60, 40, 40))
-                    item.setForeground(QColor(Qt.red))
-
-    @pyqtSlot(dict)
-    def update_trades_data(self, trade_data: dict):
-        """Обрабатывает новую сделку"""
-        try:
-            trade_time_str = trade_data['time']  # Формат: "10:34:38.634"
-            
-            # Парсим время без даты
-            current_time = datetime.strptime(trade_time_str, "%H:%M:%S.%f").replace(
-                year=datetime.now().year,
-                month=datetime.now().month,
-                day=datetime.now().day
-            ).astimezone(self.broker_timezone)
-            
-            self.trade_timestamps.append((time.time(), current_time))
-            self.all_trades_history.append(trade_data)
-            
-            self.update_trade_counters(current_time)
-            
-            try:
-                threshold = int(self.trade_threshold_input.text())
-                if trade_data['quantity'] >= threshold:
-                    self._filter_and_display_large_trades(threshold)
-            except ValueError:
-                pass
-            
-        except Exception as e:
-            print(f"Error processing trade data: {e}")
+        """Смена порога: процесс аналитики пришлет таблицы крупных сделок заново"""
+        self.engine.send("threshold", threshold)
+
+    def display_large_trades(self, recent):
+        for direction, table in self.large_trade_tables.items():
+            trades = recent.get(int(direction), [])
+            table.setRowCount(len(trades))
+            for row, trade in enumerate(trades):
+                self._set_large_trade_row(table, row, self._engine_trade(trade))
+
+    def _engine_trade(self, trade):
+        """Крупная сделка из снимка результатов в виде, который показывают таблицы"""
+        direction, ts_us, price, quantity = trade
+        trade_time = datetime.fromtimestamp(ts_us / 1_000_000, self.broker_timezone)
+        return {
+            'price': price,
+            'quantity': quantity,
+            'direction': TradeDirection(direction),
+            'time': trade_time.strftime("%H:%M:%S.%f")[:-3],
+        }
+
+    def _set_large_trade_row(self, table, row, trade):
+        background, foreground = LARGE_TRADE_COLORS[trade['direction']]
+        values = (f"{trade['price']:.3f}", str(trade['quantity']), trade['time'])
+        for col, value in enumerate(values):
+            item = QTableWidgetItem(value)
+            item.setBackground(background)
+            item.setForeground(foreground)
+            table.setItem(row, col, item)
+
+    def _append_large_trade(self, trade):
+        """Новая крупная сделка: добавляется одна строка, самая старая уходит"""
+        trade = self._engine_trade(trade)
+        table = self.large_trade_tables.get(trade['direction'])
+        if table is None:
+            return
+        row = table.rowCount()
+        table.insertRow(row)
+        self._set_large_trade_row(table, row, trade)
+        if table.rowCount() > MAX_LARGE_TRADES:
+            table.removeRow(0)
+
+    def update_trades(self, trades):
+        """Пачка сделок (Trade) из стрима уходит в процесс аналитики"""
+        push_trade = self.engine.push_trade
+        for trade in trades:
+            push_trade(trade.instrument, trade.ts, trade.price_float, trade.quantity, trade.direction)
+
+    def shutdown(self):
+        """Останавливает процесс аналитики (при закрытии окна рыночных данных)"""
+        self.results_timer.stop()
+        self.engine.stop()
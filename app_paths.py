@@ -0,0 +1,15 @@
+# app_paths.py
+import os
+
+APP_DIR_NAME = ".t_invest_api"
+
+
+def data_dir(*parts: str) -> str:
+    """Каталог локальных данных приложения (кэши, базы). Создается при первом обращении.
+
+    По умолчанию ~/.t_invest_api, переопределяется переменной T_INVEST_DATA_DIR.
+    """
+    root = os.environ.get("T_INVEST_DATA_DIR") or os.path.join(os.path.expanduser("~"), APP_DIR_NAME)
+    path = os.path.join(root, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
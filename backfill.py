@@ -0,0 +1,149 @@
+# backfill.py
+import argparse
+import logging
+import os
+import threading
+from concurrent.futures import Future
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from tinkoff.invest import CandleInterval
+
+from bar_builder import candles_to_rows
+from candle_store import CandleStore, get_candle_store
+from request_scheduler import PRIORITY_BACKGROUND
+from workers import CancellationToken
+
+logger = logging.getLogger(__name__)
+
+# Интервалы: имя в хранилище -> (CandleInterval, длина свечи в секундах, максимум периода одного GetCandles)
+INTERVALS = {
+    "1m": (CandleInterval.CANDLE_INTERVAL_1_MIN, 60, timedelta(days=1)),
+    "5m": (CandleInterval.CANDLE_INTERVAL_5_MIN, 300, timedelta(days=1)),
+    "15m": (CandleInterval.CANDLE_INTERVAL_15_MIN, 900, timedelta(days=1)),
+    "1h": (CandleInterval.CANDLE_INTERVAL_HOUR, 3600, timedelta(days=7)),
+    "1d": (CandleInterval.CANDLE_INTERVAL_DAY, 86400, timedelta(days=365)),
+}
+
+
+def split_range(start: datetime, end: datetime, step: timedelta) -> List[Tuple[datetime, datetime]]:
+    """Делит [start, end) на куски не длиннее лимита одного запроса."""
+    chunks = []
+    while start < end:
+        chunk_end = min(start + step, end)
+        chunks.append((start, chunk_end))
+        start = chunk_end
+    return chunks
+
+
+class CandleBackfill:
+    """Параллельная догрузка истории свечей в локальное хранилище.
+
+    Диапазон каждого инструмента продолжается с последней сохраненной свечи и
+    делится на куски по лимиту GetCandles. Все куски всех инструментов сразу
+    ставятся в фоновую очередь планировщика: параллельность и лимиты запросов
+    обеспечивает он, результат каждого куска пишется в хранилище по мере ответа.
+    """
+
+    def __init__(self, scheduler, store: Optional[CandleStore] = None):
+        self.scheduler = scheduler
+        self.store = store or get_candle_store()
+
+    def plan(self, instruments: Iterable[str], interval: str, start: datetime,
+             end: Optional[datetime] = None) -> Dict[str, List[Tuple[datetime, datetime]]]:
+        step = INTERVALS[interval][2]
+        end = end or datetime.now(timezone.utc)
+        plan = {}
+        for instrument in instruments:
+            last = self.store.last_timestamp(instrument, interval)
+            # Последняя сохраненная свеча могла быть незакрытой - перезапрашиваем и ее
+            resume = datetime.fromtimestamp(last, timezone.utc) if last is not None else start
+            plan[instrument] = split_range(max(start, resume), end, step)
+        return plan
+
+    def run(self, token: CancellationToken, instruments: Iterable[str], interval: str, start: datetime,
+            end: Optional[datetime] = None,
+            on_progress: Optional[Callable[[str, int, int], None]] = None) -> Dict[str, int]:
+        """Загружает историю; возвращает число сохраненных свечей по инструментам.
+
+        on_progress(instrument, готово кусков, всего кусков) вызывается из потоков планировщика.
+        """
+        candle_interval = INTERVALS[interval][0]
+        plan = self.plan(instruments, interval, start, end)
+        saved = {instrument: 0 for instrument in plan}
+        done = {instrument: 0 for instrument in plan}
+        lock = threading.Lock()
+        futures: List[Future] = []
+
+        def on_chunk(instrument: str, future: Future):
+            if future.cancelled():
+                return
+            if future.exception() is not None:
+                logger.error(f"Backfill of {instrument} failed: {future.exception()}")
+                return
+            count = self.store.write(instrument, interval, candles_to_rows(future.result().candles))
+            with lock:
+                saved[instrument] += count
+                done[instrument] += 1
+                progress = done[instrument]
+            if on_progress:
+                on_progress(instrument, progress, len(plan[instrument]))
+
+        for instrument, chunks in plan.items():
+            for chunk_start, chunk_end in chunks:
+                future = self.scheduler.submit(
+                    "market_data",
+                    lambda client, instrument=instrument, chunk_start=chunk_start, chunk_end=chunk_end:
+                        client.market_data.get_candles(
+                            instrument_id=instrument, from_=chunk_start, to=chunk_end, interval=candle_interval
+                        ),
+                    PRIORITY_BACKGROUND,
+                    key=("candles", instrument, interval, chunk_start)
+                )
+                future.add_done_callback(lambda f, instrument=instrument: on_chunk(instrument, f))
+                futures.append(future)
+
+        for future in futures:
+            while not future.done():
+                if token.sleep(0.2):
+                    for pending in futures:
+                        pending.cancel()
+                    return saved
+        return saved
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Загрузка истории свечей в локальное хранилище")
+    parser.add_argument("instruments", nargs="+", help="UID или FIGI инструментов")
+    parser.add_argument("--token", help="API-токен T-Invest, если не задан T_INVEST_TOKEN "
+                                         "(флаг виден другим пользователям в списке процессов)")
+    parser.add_argument("--interval", choices=sorted(INTERVALS), default="1m")
+    parser.add_argument("--days", type=int, default=30, help="Глубина истории в днях")
+    args = parser.parse_args(argv)
+    args.token = os.environ.get("T_INVEST_TOKEN") or args.token
+    if not args.token:
+        parser.error("задайте токен переменной окружения T_INVEST_TOKEN или флагом --token")
+
+    logging.basicConfig(level=logging.INFO)
+    from request_scheduler import RequestScheduler
+    from session_pool import close_all
+
+    scheduler = RequestScheduler(args.token)
+    start = datetime.now(timezone.utc) - timedelta(days=args.days)
+
+    def progress(instrument, done, total):
+        logger.info(f"{instrument}: {done}/{total}")
+
+    try:
+        saved = CandleBackfill(scheduler).run(
+            CancellationToken(), args.instruments, args.interval, start, on_progress=progress
+        )
+    finally:
+        scheduler.stop()
+        close_all()
+    for instrument, count in saved.items():
+        print(f"{instrument}: {count} свечей")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+# bar_builder.py
+import threading
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Интервалы баров в секундах: 1s, 5s, 1m, 5m, 15m, 1h
+INTERVALS = (1, 5, 60, 300, 900, 3600)
+
+# Сколько закрытых баров хранить на инструмент и интервал
+MAX_BARS = 2000
+
+BUY = 1
+SELL = 2
+
+
+class Bar:
+    __slots__ = ("start", "open", "high", "low", "close", "volume", "buy_volume", "sell_volume")
+
+    def __init__(self, start: int, price: float, volume: int = 0, buy_volume: int = 0, sell_volume: int = 0,
+                 high: Optional[float] = None, low: Optional[float] = None, open_: Optional[float] = None):
+        self.start = start
+        self.open = price if open_ is None else open_
+        self.high = price if high is None else high
+        self.low = price if low is None else low
+        self.close = price
+        self.volume = volume
+        self.buy_volume = buy_volume
+        self.sell_volume = sell_volume
+
+    def add(self, price: float, quantity: int, direction: int):
+        if price > self.high:
+            self.high = price
+        if price < self.low:
+            self.low = price
+        self.close = price
+        self.volume += quantity
+        if direction == BUY:
+            self.buy_volume += quantity
+        elif direction == SELL:
+            self.sell_volume += quantity
+
+    def merge(self, other: "Bar"):
+        """Добавляет более поздний бар того же периода (при сборке крупных интервалов)."""
+        self.high = max(self.high, other.high)
+        self.low = min(self.low, other.low)
+        self.close = other.close
+        self.volume += other.volume
+        self.buy_volume += other.buy_volume
+        self.sell_volume += other.sell_volume
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class _Series:
+    __slots__ = ("closed", "current")
+
+    def __init__(self, max_bars: int):
+        self.closed: Deque[Bar] = deque(maxlen=max_bars)
+        self.current: Optional[Bar] = None
+
+
+class BarBuilder:
+    """OHLCV-бары нескольких интервалов по сделкам стрима, для любого числа инструментов.
+
+    Бар закрывается по биржевому времени: когда приходит сделка следующего
+    периода или advance() получает время биржи позже конца бара. Историю
+    можно засеять свечами одного запроса GetCandles (seed), дальше бары
+    строятся только из сделок.
+    """
+
+    def __init__(self, intervals: Sequence[int] = INTERVALS, max_bars: int = MAX_BARS):
+        self.intervals = tuple(intervals)
+        self.max_bars = max_bars
+        self._series: Dict[Tuple[str, int], _Series] = {}
+        self._lock = threading.Lock()
+
+    def _get_series(self, key: str, interval: int) -> _Series:
+        series = self._series.get((key, interval))
+        if series is None:
+            series = self._series[(key, interval)] = _Series(self.max_bars)
+        return series
+
+    def add_trade(self, key: str, ts: float, price: float, quantity: int, direction: int) -> List[Tuple[int, Bar]]:
+        """Учитывает сделку. Возвращает закрытые ею бары [(interval, bar)]."""
+        closed = []
+        with self._lock:
+            for interval in self.intervals:
+                series = self._get_series(key, interval)
+                start = int(ts // interval) * interval
+                current = series.current
+                # После advance() текущего бара нет, но сделка закрытого периода - все равно запоздавшая
+                if current is not None:
+                    last_start = current.start
+                else:
+                    last_start = series.closed[-1].start if series.closed else None
+                if last_start is None or start > last_start:
+                    if current is not None:
+                        series.closed.append(current)
+                        closed.append((interval, current))
+                    series.current = Bar(start, price)
+                    series.current.add(price, quantity, direction)
+                elif current is not None and start == current.start:
+                    current.add(price, quantity, direction)
+                else:
+                    # Запоздавшая сделка: дописываем в свой закрытый бар, если он еще хранится
+                    for bar in reversed(series.closed):
+                        if bar.start == start:
+                            close = bar.close  # цена закрытия бара не меняется
+                            bar.add(price, quantity, direction)
+                            bar.close = close
+                            break
+                        if bar.start < start:
+                            break
+        return closed
+
+    def advance(self, key: str, ts: float) -> List[Tuple[int, Bar]]:
+        """Закрывает бары, период которых по биржевому времени ts уже кончился."""
+        closed = []
+        with self._lock:
+            for interval in self.intervals:
+                series = self._series.get((key, interval))
+                if series is None or series.current is None:
+                    continue
+                if ts >= series.current.start + interval:
+                    series.closed.append(series.current)
+                    closed.append((interval, series.current))
+                    series.current = None
+        return closed
+
+    def seed(self, key: str, candles: Iterable[Tuple[int, float, float, float, float, int]], interval: int):
+        """Засевает историю свечами интервала interval: (start, open, high, low, close, volume).
+
+        Засеянные бары заменяют бары интервала с тем же началом; последняя
+        свеча становится текущим баром, если сделки стрима еще не открыли
+        более поздний. Кратные интервалы затронутых периодов пересобираются
+        из всех баров интервала, а не только из переданных свечей, поэтому
+        свечи можно досевать частями (например, только последнюю минуту).
+        """
+        base = [Bar(start, close, volume, high=high, low=low, open_=open_)
+                for start, open_, high, low, close, volume in candles]
+        if not base:
+            return
+        with self._lock:
+            series = self._get_series(key, interval)
+            self._replace(series, base)
+            for target in self.intervals:
+                if target <= interval or target % interval:
+                    continue
+                # Период кратного интервала, в который попала первая свеча, собирается целиком
+                period = base[0].start // target * target
+                source = [series.current] if series.current is not None else []
+                for bar in reversed(series.closed):
+                    if bar.start < period:
+                        break
+                    source.append(bar)
+                bars: List[Bar] = []
+                for bar in reversed(source):
+                    start = bar.start // target * target
+                    if bars and bars[-1].start == start:
+                        bars[-1].merge(bar)
+                    else:
+                        bars.append(Bar(start, bar.close, bar.volume, bar.buy_volume, bar.sell_volume,
+                                        high=bar.high, low=bar.low, open_=bar.open))
+                self._replace(self._get_series(key, target), bars)
+
+    def _replace(self, series: _Series, bars: List[Bar]):
+        first, last = bars[0].start, bars[-1].start
+        current = series.current
+        kept = [bar for bar in series.closed if bar.start < first]
+        newer = [bar for bar in series.closed if bar.start > last]
+        if current is not None and current.start < first:
+            kept.append(current)
+        series.closed.clear()
+        series.closed.extend(kept)
+        if newer or (current is not None and current.start > last):
+            # Свечи пришли позже первых сделок стрима: живые бары остаются
+            series.closed.extend(bars)
+            series.closed.extend(newer)
+        else:
+            series.closed.extend(bars[:-1])
+            series.current = bars[-1]
+
+    def bars(self, key: str, interval: int, include_current: bool = True) -> List[Bar]:
+        with self._lock:
+            series = self._series.get((key, interval))
+            if series is None:
+                return []
+            result = list(series.closed)
+            if include_current and series.current is not None:
+                result.append(series.current)
+            return result
+
+    def current(self, key: str, interval: int) -> Optional[Bar]:
+        with self._lock:
+            series = self._series.get((key, interval))
+            return series.current if series else None
+
+    def last_start(self, key: str, interval: int) -> Optional[int]:
+        """Начало последнего известного бара (для догрузки свечей с этого места)."""
+        with self._lock:
+            series = self._series.get((key, interval))
+            if series is None:
+                return None
+            if series.current is not None:
+                return series.current.start
+            return series.closed[-1].start if series.closed else None
+
+    def volume_since(self, key: str, interval: int, since: float) -> int:
+        return sum(bar.volume for bar in self.bars(key, interval) if bar.start >= since)
+
+    def drop(self, key: str):
+        with self._lock:
+            for interval in self.intervals:
+                self._series.pop((key, interval), None)
+
+
+def candles_to_rows(candles) -> List[Tuple[int, float, float, float, float, int]]:
+    """HistoricCandle SDK -> строки для BarBuilder.seed."""
+    def price(q):
+        return q.units + q.nano / 1e9
+    return [
+        (int(c.time.timestamp()), price(c.open), price(c.high), price(c.low), price(c.close), c.volume)
+        for c in candles
+    ]
+
+
+_builder: Optional[BarBuilder] = None
+_builder_lock = threading.Lock()
+
+
+def get_bar_builder() -> BarBuilder:
+    """Общий построитель баров приложения."""
+    global _builder
+    with _builder_lock:
+        if _builder is None:
+            _builder = BarBuilder()
+        return _builder
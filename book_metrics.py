@@ -0,0 +1,149 @@
+# book_metrics.py
+from array import array
+from bisect import bisect_left
+from itertools import accumulate, compress, islice, repeat
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Сколько лучших уровней учитывать в дисбалансе
+TOP_LEVELS = 5
+
+# "Стена": уровень, объем которого во столько раз выше медианного по стакану
+WALL_FACTOR = 5.0
+
+# Длина временного ряда метрик (снимков)
+SERIES_CAPACITY = 65536
+
+SERIES_FIELDS = ("ts", "mid", "spread", "microprice", "imbalance")
+
+# Ряд в снимке результатов: последние SERIES_WINDOW секунд средними по SERIES_BUCKET секунд
+SERIES_WINDOW = 300
+SERIES_BUCKET = 5
+
+
+def book_arrays(levels: Iterable) -> Tuple[array, array]:
+    """Уровни стакана SDK (Order) -> массивы цен и объемов в порядке API.
+
+    API отдает asks по возрастанию цены, bids по убыванию, поэтому первый
+    элемент каждого массива - лучшая цена стороны.
+    """
+    levels = [level for level in levels if level.price is not None]
+    prices = array("d", [level.price.units + level.price.nano / 1e9 for level in levels])
+    quantities = array("q", [level.quantity for level in levels])
+    return prices, quantities
+
+
+def compute_metrics(bid_prices: array, bid_quantities: array, ask_prices: array, ask_quantities: array,
+                    top_levels: int = TOP_LEVELS, wall_factor: float = WALL_FACTOR) -> Optional[dict]:
+    """Метрики одного снимка стакана. None, если одна из сторон пуста."""
+    if not bid_prices or not ask_prices:
+        return None
+    best_bid = bid_prices[0]
+    best_ask = ask_prices[0]
+    bid_size = bid_quantities[0]
+    ask_size = ask_quantities[0]
+    mid = (best_bid + best_ask) / 2
+    spread = best_ask - best_bid
+    top_size = bid_size + ask_size
+    # Микроцена смещена к стороне с меньшим объемом на лучшем уровне
+    microprice = (best_bid * ask_size + best_ask * bid_size) / top_size if top_size else mid
+
+    top_bids = sum(islice(bid_quantities, top_levels))
+    top_asks = sum(islice(ask_quantities, top_levels))
+    top_total = top_bids + top_asks
+    imbalance = (top_bids - top_asks) / top_total if top_total else 0.0
+
+    bid_depth = array("q", accumulate(bid_quantities))
+    ask_depth = array("q", accumulate(ask_quantities))
+
+    # Без numpy: проходы по уровням идут встроенными функциями на C (sorted, map, compress),
+    # а не циклами интерпретатора
+    walls: List[Tuple[str, float, int]] = []
+    ordered = sorted(bid_quantities + ask_quantities)
+    middle = len(ordered) // 2
+    median_size = ordered[middle] if len(ordered) % 2 else (ordered[middle - 1] + ordered[middle]) / 2
+    wall_size = median_size * wall_factor
+    if wall_size > 0 and ordered[-1] >= wall_size:
+        for side, prices, quantities in (("bid", bid_prices, bid_quantities), ("ask", ask_prices, ask_quantities)):
+            if quantities and max(quantities) >= wall_size:
+                mask = list(map(wall_size.__le__, quantities))
+                walls.extend(zip(repeat(side), compress(prices, mask), compress(quantities, mask)))
+
+    return {
+        "best_bid": best_bid,
+        "best_ask": best_ask,
+        "mid": mid,
+        "spread": spread,
+        "spread_bps": spread / mid * 10000 if mid else 0.0,
+        "microprice": microprice,
+        "imbalance": imbalance,
+        "bid_depth": bid_depth,
+        "ask_depth": ask_depth,
+        "walls": walls,
+    }
+
+
+class BookMetricsSeries:
+    """Кольцевой временной ряд скалярных метрик стакана в столбцах array('d')."""
+
+    def __init__(self, capacity: int = SERIES_CAPACITY):
+        self.capacity = capacity
+        self._columns = {name: array("d", bytes(8 * capacity)) for name in SERIES_FIELDS}
+        self._next = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, ts: float, metrics: dict):
+        slot = self._next
+        self._columns["ts"][slot] = ts
+        for name in SERIES_FIELDS[1:]:
+            self._columns[name][slot] = metrics[name]
+        self._next = (slot + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def column(self, name: str) -> array:
+        """Столбец в хронологическом порядке."""
+        column = self._columns[name]
+        if self._size < self.capacity:
+            return column[:self._size]
+        return column[self._next:] + column[:self._next]
+
+    def tail(self, since: float) -> Dict[str, array]:
+        """Столбцы снимков со временем не раньше since, в хронологическом порядке."""
+        ts = self._columns["ts"]
+        first = (self._next - self._size) % self.capacity
+        # Поиск по логическим индексам кольца: копируется только хвост, а не весь ряд
+        offset = bisect_left(range(self._size), since, key=lambda i: ts[(first + i) % self.capacity])
+        start = (first + offset) % self.capacity
+        count = self._size - offset
+        result = {}
+        for name, column in self._columns.items():
+            if start + count <= self.capacity:
+                result[name] = column[start:start + count]
+            else:
+                result[name] = column[start:] + column[:start + count - self.capacity]
+        return result
+
+    def downsample(self, since: float, bucket: float) -> Dict[str, list]:
+        """Средние метрик по интервалам bucket секунд с since: {"ts": начала интервалов, метрика: [...]}.
+
+        Пустые интервалы пропускаются.
+        """
+        columns = self.tail(since)
+        ts = columns["ts"]
+        result: Dict[str, list] = {name: [] for name in SERIES_FIELDS}
+        lo = 0
+        while lo < len(ts):
+            bucket_start = ts[lo] // bucket * bucket
+            hi = bisect_left(ts, bucket_start + bucket, lo)
+            count = hi - lo
+            result["ts"].append(bucket_start)
+            for name in SERIES_FIELDS[1:]:
+                result[name].append(sum(columns[name][lo:hi]) / count)
+            lo = hi
+        return result
+
+    def clear(self):
+        self._next = 0
+        self._size = 0
@@ -0,0 +1,200 @@
+# burst_detector.py
+import json
+import logging
+import math
+import os
+import threading
+from typing import Dict, Optional
+
+from app_paths import data_dir
+
+logger = logging.getLogger(__name__)
+
+# Интервал, по которому считаются темп сделок и объема
+BUCKET_SECONDS = 10
+
+# Сглаживание EWMA: базовая линия "помнит" примерно последний час интервалов
+EWMA_SPAN = 360
+EWMA_ALPHA = 2.0 / (EWMA_SPAN + 1)
+
+# Порог всплеска в стандартных отклонениях
+Z_THRESHOLD = 3.0
+
+# Сколько закрытых интервалов нужно, прежде чем доверять базовой линии
+MIN_SAMPLES = 30
+
+# Пауза длиннее этого (клиринг, ночь, выходные) не учится как нулевая активность
+MAX_IDLE_BUCKETS = 30
+
+
+class _Ewma:
+    """Экспоненциально взвешенные среднее и дисперсия."""
+
+    __slots__ = ("mean", "var")
+
+    def __init__(self, mean: float = 0.0, var: float = 0.0):
+        self.mean = mean
+        self.var = var
+
+    def update(self, value: float, alpha: float):
+        diff = value - self.mean
+        incr = alpha * diff
+        self.mean += incr
+        self.var = (1 - alpha) * (self.var + diff * incr)
+
+    def zscore(self, value: float) -> float:
+        std = math.sqrt(self.var)
+        if std == 0:
+            return 0.0
+        return (value - self.mean) / std
+
+
+class BurstDetector:
+    """Детектор всплесков темпа сделок и объема по одному инструменту.
+
+    Сделки суммируются в текущем интервале BUCKET_SECONDS; закрытый интервал
+    обновляет EWMA-базовые линии. Всплеск - текущий (в том числе незакрытый)
+    интервал выше базовой линии на z_threshold стандартных отклонений.
+    Каждая сделка стоит O(1).
+    """
+
+    def __init__(self, bucket_seconds: int = BUCKET_SECONDS, alpha: float = EWMA_ALPHA,
+                 z_threshold: float = Z_THRESHOLD, baseline: Optional[dict] = None):
+        self.bucket_seconds = bucket_seconds
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.trades = _Ewma()
+        self.volume = _Ewma()
+        self.samples = 0
+        self._bucket: Optional[int] = None
+        self._count = 0
+        self._quantity = 0
+        if baseline:
+            self.trades = _Ewma(baseline["trades_mean"], baseline["trades_var"])
+            self.volume = _Ewma(baseline["volume_mean"], baseline["volume_var"])
+            self.samples = baseline["samples"]
+
+    def baseline(self) -> dict:
+        return {
+            "trades_mean": self.trades.mean,
+            "trades_var": self.trades.var,
+            "volume_mean": self.volume.mean,
+            "volume_var": self.volume.var,
+            "samples": self.samples,
+        }
+
+    def _close(self, value_count: int, value_quantity: int):
+        self.trades.update(value_count, self.alpha)
+        self.volume.update(value_quantity, self.alpha)
+        self.samples += 1
+
+    def advance(self, ts: float):
+        """Закрывает интервалы до момента ts."""
+        bucket = int(ts // self.bucket_seconds)
+        if self._bucket is None:
+            self._bucket = bucket
+            return
+        if bucket <= self._bucket:
+            return
+        self._close(self._count, self._quantity)
+        idle = bucket - self._bucket - 1
+        if idle <= MAX_IDLE_BUCKETS:
+            for _ in range(idle):
+                self._close(0, 0)
+        self._bucket = bucket
+        self._count = 0
+        self._quantity = 0
+
+    def add(self, ts: float, quantity: int) -> bool:
+        """Учитывает сделку. Возвращает True, если текущий интервал - всплеск."""
+        self.advance(ts)
+        if int(ts // self.bucket_seconds) == self._bucket:
+            self._count += 1
+            self._quantity += quantity
+        return self.is_burst()
+
+    @property
+    def warm(self) -> bool:
+        return self.samples >= MIN_SAMPLES
+
+    def is_burst(self) -> bool:
+        return self.state()["burst"]
+
+    def state(self) -> dict:
+        trades_z = self.trades.zscore(self._count)
+        volume_z = self.volume.zscore(self._quantity)
+        return {
+            "trades": self._count,
+            "volume": self._quantity,
+            "trades_z": trades_z,
+            "volume_z": volume_z,
+            "expected_trades": self.trades.mean,
+            "trades_std": math.sqrt(self.trades.var),
+            "burst": self.warm and max(trades_z, volume_z) >= self.z_threshold,
+        }
+
+
+class BurstMonitor:
+    """Детекторы всех инструментов с базовыми линиями, сохраняемыми между сессиями."""
+
+    def __init__(self, path: Optional[str] = None, z_threshold: float = Z_THRESHOLD):
+        self.path = path or os.path.join(data_dir(), "burst_baselines.json")
+        self.z_threshold = z_threshold
+        self._detectors: Dict[str, BurstDetector] = {}
+        self._baselines: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self._baselines = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Burst baselines are unreadable, starting cold: {e}")
+
+    def detector(self, key: str) -> BurstDetector:
+        with self._lock:
+            detector = self._detectors.get(key)
+            if detector is None:
+                detector = self._detectors[key] = BurstDetector(
+                    z_threshold=self.z_threshold, baseline=self._baselines.get(key)
+                )
+            return detector
+
+    def add(self, key: str, ts: float, quantity: int) -> bool:
+        return self.detector(key).add(ts, quantity)
+
+    def set_z_threshold(self, z_threshold: float):
+        with self._lock:
+            self.z_threshold = z_threshold
+            for detector in self._detectors.values():
+                detector.z_threshold = z_threshold
+
+    def save(self):
+        with self._lock:
+            for key, detector in self._detectors.items():
+                if detector.samples:
+                    self._baselines[key] = detector.baseline()
+            baselines = dict(self._baselines)
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(baselines, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Failed to save burst baselines: {e}")
+
+
+_monitor: Optional[BurstMonitor] = None
+_monitor_lock = threading.Lock()
+
+
+def get_burst_monitor() -> BurstMonitor:
+    """Общий монитор всплесков приложения."""
+    global _monitor
+    with _monitor_lock:
+        if _monitor is None:
+            _monitor = BurstMonitor()
+        return _monitor
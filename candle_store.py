@@ -0,0 +1,135 @@
+# candle_store.py
+import logging
+import os
+import threading
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app_paths import data_dir
+
+logger = logging.getLogger(__name__)
+
+# Столбцы свечей: имя -> typecode. Время - начало свечи в секундах эпохи (UTC)
+COLUMNS = (("ts", "q"), ("open", "d"), ("high", "d"), ("low", "d"), ("close", "d"), ("volume", "q"))
+
+Row = Tuple[int, float, float, float, float, int]
+
+
+def _partition_date(ts: int) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%d")
+
+
+def _safe_name(value: str) -> str:
+    return "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in value)
+
+
+class CandleStore:
+    """Локальное колоночное хранилище свечей.
+
+    Раскладка: <root>/<interval>/<instrument>/<YYYY-MM-DD>/<столбец>.bin, каждый
+    столбец - сырой массив array. Раздел (инструмент, день) перезаписывается
+    целиком при слиянии, поэтому повторная загрузка того же диапазона безопасна.
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = root or data_dir("candles")
+        self._lock = threading.Lock()
+
+    def _instrument_dir(self, instrument: str, interval: str) -> str:
+        return os.path.join(self.root, interval, _safe_name(instrument))
+
+    def _read_partition(self, path: str) -> Dict[str, array]:
+        columns = {}
+        for name, code in COLUMNS:
+            column = array(code)
+            try:
+                with open(os.path.join(path, f"{name}.bin"), "rb") as f:
+                    column.frombytes(f.read())
+            except FileNotFoundError:
+                return {name: array(code) for name, code in COLUMNS}
+            columns[name] = column
+        if len({len(column) for column in columns.values()}) != 1:
+            logger.warning(f"Candle partition {path} is inconsistent, ignoring it")
+            return {name: array(code) for name, code in COLUMNS}
+        return columns
+
+    def _write_partition(self, path: str, rows: List[Row]):
+        os.makedirs(path, exist_ok=True)
+        for index, (name, code) in enumerate(COLUMNS):
+            column = array(code, (row[index] for row in rows))
+            tmp_path = os.path.join(path, f"{name}.bin.tmp")
+            with open(tmp_path, "wb") as f:
+                column.tofile(f)
+            os.replace(tmp_path, os.path.join(path, f"{name}.bin"))
+
+    def write(self, instrument: str, interval: str, rows: Iterable[Row]) -> int:
+        """Сливает свечи в разделы по дням; свеча с тем же временем заменяется."""
+        by_date: Dict[str, Dict[int, Row]] = {}
+        for row in rows:
+            by_date.setdefault(_partition_date(row[0]), {})[row[0]] = row
+        base = self._instrument_dir(instrument, interval)
+        written = 0
+        with self._lock:
+            for date, new_rows in by_date.items():
+                path = os.path.join(base, date)
+                existing = self._read_partition(path)
+                merged = {row[0]: row for row in zip(*(existing[name] for name, _ in COLUMNS))}
+                merged.update(new_rows)
+                self._write_partition(path, [merged[ts] for ts in sorted(merged)])
+                written += len(new_rows)
+        return written
+
+    def dates(self, instrument: str, interval: str) -> List[str]:
+        try:
+            return sorted(os.listdir(self._instrument_dir(instrument, interval)))
+        except FileNotFoundError:
+            return []
+
+    def last_timestamp(self, instrument: str, interval: str) -> Optional[int]:
+        """Время последней сохраненной свечи - с него продолжается догрузка."""
+        base = self._instrument_dir(instrument, interval)
+        with self._lock:
+            for date in reversed(self.dates(instrument, interval)):
+                ts = self._read_partition(os.path.join(base, date))["ts"]
+                if ts:
+                    return ts[-1]
+        return None
+
+    def read(self, instrument: str, interval: str, start: Optional[int] = None,
+             end: Optional[int] = None) -> Dict[str, array]:
+        """Столбцы свечей с start <= ts < end; читаются только разделы нужных дней."""
+        result = {name: array(code) for name, code in COLUMNS}
+        first = _partition_date(start) if start is not None else None
+        last = _partition_date(end) if end is not None else None
+        base = self._instrument_dir(instrument, interval)
+        with self._lock:
+            for date in self.dates(instrument, interval):
+                if (first and date < first) or (last and date > last):
+                    continue
+                columns = self._read_partition(os.path.join(base, date))
+                ts = columns["ts"]
+                lo = 0 if start is None else bisect_left(ts, start)
+                hi = len(ts) if end is None else bisect_left(ts, end)
+                for name, _ in COLUMNS:
+                    result[name].extend(columns[name][lo:hi])
+        return result
+
+    def rows(self, instrument: str, interval: str, start: Optional[int] = None,
+             end: Optional[int] = None) -> List[Row]:
+        columns = self.read(instrument, interval, start, end)
+        return list(zip(*(columns[name] for name, _ in COLUMNS)))
+
+
+_store: Optional[CandleStore] = None
+_store_lock = threading.Lock()
+
+
+def get_candle_store() -> CandleStore:
+    """Общее хранилище свечей приложения."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = CandleStore()
+        return _store
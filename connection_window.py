@@ -2,15 +2,17 @@ from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel,
                             QLineEdit, QPushButton, QScrollArea, QGroupBox, 
                             QFormLayout)
 from PyQt5.QtGui import QFont
-from PyQt5.QtCore import Qt
-from tinkoff.invest import Client
-from account_info_window import AccountInfoWindow # Добавлено
+from PyQt5.QtCore import Qt, pyqtSignal
 
 class ConnectionWindow(QWidget):
+    # Ответ проверки токена приходит из потока планировщика: (планировщик, токен, Future)
+    connection_checked = pyqtSignal(object, str, object)
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.parent = parent
         self.init_ui()
+        self.connection_checked.connect(self._on_connection_checked)
         
     def init_ui(self):
         layout = QVBoxLayout(self)
@@ -32,44 +34,71 @@ class ConnectionWindow(QWidget):
         auth_layout.addWidget(self.auth_button)
         self.auth_group.setLayout(auth_layout)
         
-        # Создаем экземпляр AccountInfoWindow
-        self.account_info_window = AccountInfoWindow(self.parent) # Передаем parent из main.py
-        self.account_info_window.setVisible(False) # Скрываем до авторизации
+        # Кабинет (AccountInfoWindow) создается после первой успешной авторизации
+        self.account_info_window = None
         
         layout.addWidget(self.auth_group)
-        layout.addWidget(self.account_info_window) # Добавляем напрямую
         layout.addStretch()
+
+    def _ensure_account_info_window(self):
+        if self.account_info_window is None:
+            from account_info_window import AccountInfoWindow
+            self.account_info_window = AccountInfoWindow(self.parent) # Передаем parent из main_window.py
+            self.layout().insertWidget(1, self.account_info_window) # Добавляем напрямую
+        return self.account_info_window
+
+    def _hide_account_info_window(self):
+        if self.account_info_window is not None:
+            self.account_info_window.setVisible(False) # Скрыть кабинет
     
     def connect_to_api(self):
         token = self.token_input.text().strip()
         if not token:
             self.parent.show_info("Ошибка: Введите API токен")
             return
+
+        # SDK и grpc грузятся только к моменту подключения (обычно их уже догрузил фон)
+        from request_scheduler import RequestScheduler, PRIORITY_INTERACTIVE
             
+        # Все unary-запросы приложения идут через общий планировщик с лимитами API
+        scheduler = RequestScheduler(token)
+        # Проверка токена не блокирует GUI: при исчерпанном лимите ответ может ждать сброса
+        self.auth_button.setEnabled(False)
+        future = scheduler.submit("users", lambda client: client.users.get_accounts(), PRIORITY_INTERACTIVE)
+        future.add_done_callback(lambda f: self.connection_checked.emit(scheduler, token, f))
+
+    def _on_connection_checked(self, scheduler, token, future):
+        from session_pool import get_pool
+
+        self.auth_button.setEnabled(True)
         try:
-            with Client(token) as client:
-                # Test connection
-                accounts_response = client.users.get_accounts() # Получаем ответ с аккаунтами
-                
-                if not accounts_response.accounts:
-                    self.parent.show_info("Нет доступных счетов")
-                    self.parent.update_status(False)
-                    self.account_info_window.setVisible(False) # Скрыть кабинет
-                    return
+            accounts_response = future.result() # Получаем ответ с аккаунтами
+
+            if not accounts_response.accounts:
+                scheduler.stop()
+                get_pool(token).close()
+                self.parent.show_info("Нет доступных счетов")
+                self.parent.update_status(False)
+                self._hide_account_info_window()
+                return
+
+            account_ids = [account.id for account in accounts_response.accounts]
+
+            if self.parent.scheduler:
+                self.parent.scheduler.stop()
+            self.parent.scheduler = scheduler
+            self.parent.token = token # Сохраняем токен в главном окне
+            self.parent.update_status(True, "Успешное подключение")
 
-                # Используем первый найденный аккаунт по умолчанию
-                first_account_id = accounts_response.accounts[0].id
+            # Скрываем блок авторизации и показываем блок с информацией о счете
+            self.auth_group.setVisible(False)
+            self._ensure_account_info_window().setVisible(True) # Показываем кабинет
 
-                self.parent.token = token # Сохраняем токен в главном окне
-                self.parent.update_status(True, "Успешное подключение")
-                
-                # Скрываем блок авторизации и показываем блок с информацией о счете
-                self.auth_group.setVisible(False)
-                self.account_info_window.setVisible(True) # Показываем кабинет
+            # Передаем токен и все счета в AccountInfoWindow для загрузки данных
+            self.account_info_window.set_accounts(token, account_ids)
 
-                # Передаем токен и account_id в AccountInfoWindow для загрузки данных
-                self.account_info_window.set_account_info(token, first_account_id)
-                
         except Exception as e:
+            scheduler.stop()
+            get_pool(token).close() # Канал с неверным токеном не держим
             self.parent.update_status(False, f"Ошибка подключения: {str(e)}") # ИСПРАВЛЕНО: Используем update_status
-            self.account_info_window.setVisible(False) # Скрыть кабинет
\ No newline at end of file
+            self._hide_account_info_window()
\ No newline at end of file
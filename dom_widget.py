@@ -0,0 +1,339 @@
+# dom_widget.py
+from collections import deque
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+
+from PyQt5.QtCore import QRect, Qt, QTimer
+from PyQt5.QtGui import QColor, QFont, QImage, QPainter
+from PyQt5.QtWidgets import QWidget
+
+from market_events import PRICE_SCALE
+
+BUY = 1
+SELL = 2
+
+ROW_HEIGHT = 18
+
+# Кадр не чаще 60 раз в секунду: данные между кадрами только копятся
+FRAME_INTERVAL_MS = 16
+
+# Тепловая карта: столько последних снимков стакана, ширина области в пикселях
+HEATMAP_COLUMNS = 120
+HEATMAP_WIDTH = 240
+
+COLUMN_TITLES = ("Объем Покупок", "Заявки Покупка", "Цена", "Заявки Продажа", "Объем Продаж")
+
+BACKGROUND = QColor(25, 25, 25)
+HEADER_BACKGROUND = QColor(53, 53, 53)
+GRID = QColor(45, 45, 45)
+LAST_PRICE_BACKGROUND = QColor("#0d1a08")
+BID_BAR = QColor(30, 90, 30)
+ASK_BAR = QColor(100, 30, 30)
+BUY_TRADED_BAR = QColor(20, 55, 20)
+SELL_TRADED_BAR = QColor(60, 20, 20)
+BID_TEXT = QColor(Qt.green)
+ASK_TEXT = QColor(Qt.red)
+BUY_TRADED_TEXT = QColor(Qt.darkGreen)
+SELL_TRADED_TEXT = QColor(Qt.darkRed)
+TEXT = QColor(Qt.white)
+
+Row = Tuple[int, int, int, int, int, bool]  # цена (нано), bid, ask, куплено, продано, последняя цена
+
+
+def _format_price(price: int) -> str:
+    return f"{price / PRICE_SCALE:.3f}" if price // (PRICE_SCALE // 1000) % 10 else f"{price / PRICE_SCALE:.2f}"
+
+
+def _scale_for(value: int, scale: int) -> int:
+    """Масштаб полос меняется ступенями, чтобы не перерисовывать все строки на каждом снимке."""
+    if value > scale or value * 4 < scale:
+        scale = 1
+        while scale < value:
+            scale *= 2
+    return scale
+
+
+def _heat_palette() -> List[bytes]:
+    # Пиксели QImage.Format_RGB32 в памяти: B, G, R, 0xFF
+    palette = []
+    for level in range(256):
+        red = min(255, 25 + level)
+        green = min(255, 25 + level * 3 // 4)
+        blue = max(25, 60 - level // 4)
+        palette.append(bytes((blue, green, red, 255)))
+    return palette
+
+
+class DomWidget(QWidget):
+    """Стакан (DOM), нарисованный QPainter прямо по массивам уровней.
+
+    Цены - целые нано-единицы из событий стрима, поэтому уровни стакана и
+    сделок совпадают по ключу точно. Столбцы: объем сделок покупок, заявки bid с полосами размера, цена,
+    заявки ask, объем сделок продаж; слева - необязательная тепловая карта
+    ликвидности (время x цена). Обновления данных копятся и применяются раз в
+    кадр; перерисовываются только строки, которые изменились.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setMinimumSize(420, 200)
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
+        self._bids: Dict[int, int] = {}
+        self._asks: Dict[int, int] = {}
+        self._traded: Dict[int, List[int]] = {}  # цена -> [куплено, продано]
+        self._totals = [0, 0]
+        self._last_price: Optional[int] = None
+        self._rows: List[Row] = []  # видимые строки последнего кадра
+        self._size_scale = 1
+        self._traded_scale = 1
+        self._scroll = 0  # сдвиг от центра спреда колесом мыши, строк
+        self._heatmap_enabled = False
+        self._heatmap: Deque[Dict[int, int]] = deque(maxlen=HEATMAP_COLUMNS)
+        self._heatmap_dirty = False
+        self._heat_palette = _heat_palette()
+        self._font = QFont(self.font())
+        self._bold_font = QFont(self.font())
+        self._bold_font.setBold(True)
+
+        self._frame_timer = QTimer(self)
+        self._frame_timer.setSingleShot(True)
+        self._frame_timer.setInterval(FRAME_INTERVAL_MS)
+        self._frame_timer.timeout.connect(self._flush)
+        self._full_repaint = True
+
+    # --- данные ---
+
+    def set_book(self, bid_prices: Sequence[int], bid_quantities: Sequence[int],
+                 ask_prices: Sequence[int], ask_quantities: Sequence[int]):
+        self._bids = dict(zip(bid_prices, bid_quantities))
+        self._asks = dict(zip(ask_prices, ask_quantities))
+        if self._heatmap_enabled:
+            column = dict(self._bids)
+            column.update(self._asks)
+            self._heatmap.append(column)
+            self._heatmap_dirty = True
+        self._schedule()
+
+    def add_trade(self, price: int, quantity: int, direction: int):
+        volumes = self._traded.setdefault(price, [0, 0])
+        if direction == BUY:
+            volumes[0] += quantity
+            self._totals[0] += quantity
+        elif direction == SELL:
+            volumes[1] += quantity
+            self._totals[1] += quantity
+        self._schedule()
+
+    def set_last_price(self, price: Optional[int]):
+        self._last_price = price
+        self._schedule()
+
+    def set_heatmap_enabled(self, enabled: bool):
+        self._heatmap_enabled = enabled
+        self._heatmap.clear()
+        self._full_repaint = True
+        self._schedule()
+
+    def clear(self):
+        self._bids = {}
+        self._asks = {}
+        self._traded = {}
+        self._totals = [0, 0]
+        self._last_price = None
+        self._scroll = 0
+        self._heatmap.clear()
+        self._full_repaint = True
+        self._schedule()
+
+    # --- кадр ---
+
+    def _schedule(self):
+        if not self._frame_timer.isActive():
+            self._frame_timer.start()
+
+    def _visible_count(self) -> int:
+        # Строка заголовка сверху и строка итогов снизу
+        return max(0, self.height() // ROW_HEIGHT - 2)
+
+    def _build_rows(self) -> List[Row]:
+        prices = set(self._bids)
+        prices.update(self._asks)
+        prices.update(self._traded)
+        prices = sorted(prices, reverse=True)
+        visible = self._visible_count()
+        if not prices or not visible:
+            return []
+        # Центр - граница между asks (сверху) и bids
+        if self._bids:
+            best_bid = max(self._bids)
+            boundary = sum(1 for price in prices if price > best_bid)
+        elif self._asks:
+            best_ask = min(self._asks)
+            boundary = sum(1 for price in prices if price >= best_ask)
+        else:
+            boundary = len(prices) // 2
+        first = boundary - visible // 2 + self._scroll
+        first = max(0, min(first, len(prices) - visible))
+        rows = []
+        for price in prices[first:first + visible]:
+            buy, sell = self._traded.get(price, (0, 0))
+            rows.append((price, self._bids.get(price, 0), self._asks.get(price, 0), buy, sell,
+                         price == self._last_price))
+        return rows
+
+    def _flush(self):
+        rows = self._build_rows()
+        size_scale = _scale_for(max((max(r[1], r[2]) for r in rows), default=0), self._size_scale)
+        traded_scale = _scale_for(max((max(r[3], r[4]) for r in rows), default=0), self._traded_scale)
+        full = (
+            self._full_repaint
+            or len(rows) != len(self._rows)
+            or (rows and rows[0][0] != self._rows[0][0])
+            or size_scale != self._size_scale
+            or traded_scale != self._traded_scale
+        )
+        previous = self._rows
+        self._rows = rows
+        self._size_scale = size_scale
+        self._traded_scale = traded_scale
+        self._full_repaint = False
+        if full:
+            self.update()
+            self._heatmap_dirty = False
+            return
+        ladder_left = self._ladder_left()
+        for index, (old, new) in enumerate(zip(previous, rows)):
+            if old != new:
+                self.update(QRect(ladder_left, (index + 1) * ROW_HEIGHT, self.width() - ladder_left, ROW_HEIGHT))
+        self.update(self._totals_rect())
+        if self._heatmap_dirty:
+            self.update(QRect(0, ROW_HEIGHT, ladder_left, len(rows) * ROW_HEIGHT))
+            self._heatmap_dirty = False
+
+    # --- отрисовка ---
+
+    def _ladder_left(self) -> int:
+        return HEATMAP_WIDTH if self._heatmap_enabled else 0
+
+    def _columns(self) -> List[Tuple[int, int]]:
+        left = self._ladder_left()
+        width = (self.width() - left) / len(COLUMN_TITLES)
+        return [(int(left + i * width), int(width)) for i in range(len(COLUMN_TITLES))]
+
+    def _totals_rect(self) -> QRect:
+        return QRect(self._ladder_left(), (self._visible_count() + 1) * ROW_HEIGHT,
+                     self.width() - self._ladder_left(), ROW_HEIGHT)
+
+    def resizeEvent(self, event):
+        self._full_repaint = True
+        self._schedule()
+        super().resizeEvent(event)
+
+    def wheelEvent(self, event):
+        self._scroll -= event.angleDelta().y() // 120
+        self._full_repaint = True
+        self._schedule()
+
+    def mouseDoubleClickEvent(self, event):
+        # Двойной щелчок возвращает спред в центр
+        self._scroll = 0
+        self._full_repaint = True
+        self._schedule()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        dirty = event.rect()
+        painter.fillRect(dirty, BACKGROUND)
+        columns = self._columns()
+
+        if dirty.top() < ROW_HEIGHT:
+            self._paint_header(painter, columns)
+
+        first = max(0, dirty.top() // ROW_HEIGHT - 1)
+        last = min(len(self._rows), dirty.bottom() // ROW_HEIGHT)
+        if self._heatmap_enabled and dirty.left() < self._ladder_left() and self._rows:
+            self._paint_heatmap(painter)
+        painter.setFont(self._font)
+        for index in range(first, last):
+            self._paint_row(painter, columns, index, self._rows[index])
+
+        if dirty.intersects(self._totals_rect()):
+            self._paint_totals(painter, columns)
+        painter.end()
+
+    def _paint_header(self, painter: QPainter, columns):
+        painter.fillRect(QRect(0, 0, self.width(), ROW_HEIGHT), HEADER_BACKGROUND)
+        painter.setPen(TEXT)
+        painter.setFont(self._bold_font)
+        for (x, width), title in zip(columns, COLUMN_TITLES):
+            painter.drawText(QRect(x, 0, width, ROW_HEIGHT), Qt.AlignCenter, title)
+        if self._heatmap_enabled:
+            painter.drawText(QRect(0, 0, self._ladder_left(), ROW_HEIGHT), Qt.AlignCenter, "Ликвидность")
+
+    def _paint_row(self, painter: QPainter, columns, index: int, row: Row):
+        price, bid, ask, buy, sell, is_last = row
+        y = (index + 1) * ROW_HEIGHT
+        left = self._ladder_left()
+        if is_last:
+            painter.fillRect(QRect(left, y, self.width() - left, ROW_HEIGHT), LAST_PRICE_BACKGROUND)
+        painter.setPen(GRID)
+        painter.drawLine(left, y + ROW_HEIGHT - 1, self.width(), y + ROW_HEIGHT - 1)
+
+        (buy_x, buy_w), (bid_x, bid_w), (price_x, price_w), (ask_x, ask_w), (sell_x, sell_w) = columns
+        # Полосы: bid и куплено растут влево к цене, ask и продано - вправо от нее
+        if buy:
+            bar = buy_w * buy // self._traded_scale
+            painter.fillRect(QRect(buy_x + buy_w - bar, y + 2, bar, ROW_HEIGHT - 4), BUY_TRADED_BAR)
+        if bid:
+            bar = bid_w * bid // self._size_scale
+            painter.fillRect(QRect(bid_x + bid_w - bar, y + 2, bar, ROW_HEIGHT - 4), BID_BAR)
+        if ask:
+            bar = ask_w * ask // self._size_scale
+            painter.fillRect(QRect(ask_x, y + 2, bar, ROW_HEIGHT - 4), ASK_BAR)
+        if sell:
+            bar = sell_w * sell // self._traded_scale
+            painter.fillRect(QRect(sell_x, y + 2, bar, ROW_HEIGHT - 4), SELL_TRADED_BAR)
+
+        cells = (
+            (buy_x, buy_w, Qt.AlignRight | Qt.AlignVCenter, BUY_TRADED_TEXT, buy),
+            (bid_x, bid_w, Qt.AlignRight | Qt.AlignVCenter, BID_TEXT, bid),
+            (ask_x, ask_w, Qt.AlignLeft | Qt.AlignVCenter, ASK_TEXT, ask),
+            (sell_x, sell_w, Qt.AlignLeft | Qt.AlignVCenter, SELL_TRADED_TEXT, sell),
+        )
+        for x, width, align, color, value in cells:
+            if value:
+                painter.setPen(color)
+                painter.drawText(QRect(x + 4, y, width - 8, ROW_HEIGHT), align, str(value))
+        painter.setPen(TEXT)
+        painter.drawText(QRect(price_x, y, price_w, ROW_HEIGHT), Qt.AlignCenter, _format_price(price))
+
+    def _paint_totals(self, painter: QPainter, columns):
+        rect = self._totals_rect()
+        painter.fillRect(rect, HEADER_BACKGROUND)
+        painter.setFont(self._bold_font)
+        (buy_x, buy_w), _, (price_x, price_w), _, (sell_x, sell_w) = columns
+        painter.setPen(BUY_TRADED_TEXT)
+        painter.drawText(QRect(buy_x + 4, rect.y(), buy_w - 8, ROW_HEIGHT), Qt.AlignRight | Qt.AlignVCenter,
+                         str(self._totals[0]))
+        painter.setPen(TEXT)
+        painter.drawText(QRect(price_x, rect.y(), price_w, ROW_HEIGHT), Qt.AlignCenter, "ИТОГО")
+        painter.setPen(SELL_TRADED_TEXT)
+        painter.drawText(QRect(sell_x + 4, rect.y(), sell_w - 8, ROW_HEIGHT), Qt.AlignLeft | Qt.AlignVCenter,
+                         str(self._totals[1]))
+
+    def _paint_heatmap(self, painter: QPainter):
+        """Картинка строк x снимков собирается байтами и растягивается на область за один drawImage."""
+        columns = list(self._heatmap)
+        if not columns:
+            return
+        palette = self._heat_palette
+        blank = palette[0]
+        scale = self._size_scale
+        lines = []
+        for price, *_ in self._rows:
+            lines.append(b"".join(
+                palette[min(255, column[price] * 255 // scale)] if price in column else blank
+                for column in columns
+            ))
+        image = QImage(b"".join(lines), len(columns), len(lines), len(columns) * 4, QImage.Format_RGB32)
+        target = QRect(0, ROW_HEIGHT, self._ladder_left(), len(lines) * ROW_HEIGHT)
+        painter.drawImage(target, image)
@@ -0,0 +1,269 @@
+# engine.py
+import asyncio
+import logging
+import threading
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+
+import grpc
+from tinkoff.invest import MarketDataRequest
+
+from analytics_engine import AnalyticsEngine
+from bar_builder import BarBuilder
+from market_events import (
+    ORDER_BOOK_DEPTH, BookSnapshot, LastPrice, MarketEvent, Trade, TradingStatus, decode_response,
+    nano_to_float, subscription_requests
+)
+from session_pool import get_pool
+from stream_shards import ShardedIngestion
+
+logger = logging.getLogger(__name__)
+
+BUY = 1
+SELL = 2
+
+
+class MarketStream:
+    """Стрим рыночных данных без Qt: подписка, декодирование, раздача событий.
+
+    События - объекты MarketEvent (BookSnapshot, Trade, LastPrice, TradingStatus)
+    из decode_response. Потребители подключаются колбэками
+    (on_event, on_raw, on_status, on_error, on_metrics) или читают
+    асинхронный итератор events(). При shards > 0 прием делится между
+    процессами (ShardedIngestion), иначе стрим идет в текущем event loop.
+    """
+
+    def __init__(self, token: str, instruments: Iterable[str], depth: int = ORDER_BOOK_DEPTH, shards: int = 0,
+                 on_event: Optional[Callable[[MarketEvent], None]] = None,
+                 on_raw: Optional[Callable[[object], None]] = None,
+                 on_status: Optional[Callable[[bool], None]] = None,
+                 on_error: Optional[Callable[[str], None]] = None,
+                 on_metrics: Optional[Callable[[dict], None]] = None):
+        self.token = token
+        self.instruments = list(instruments)
+        self.depth = depth
+        self.shards = shards
+        self.on_event = on_event
+        self.on_raw = on_raw
+        self.on_status = on_status
+        self.on_error = on_error
+        self.on_metrics = on_metrics
+        self.running = False
+        self._queues: List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]] = []
+        self._queues_lock = threading.Lock()
+
+    def _emit(self, event: MarketEvent):
+        if self.on_event:
+            self.on_event(event)
+        with self._queues_lock:
+            queues = list(self._queues)
+        for loop, queue in queues:
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+
+    def _status(self, connected: bool):
+        if self.on_status:
+            self.on_status(connected)
+
+    def _error(self, message: str):
+        logger.error(message)
+        if self.on_error:
+            self.on_error(message)
+
+    async def events(self) -> AsyncIterator[MarketEvent]:
+        """События стрима до его остановки: async for event in stream.events(): ..."""
+        queue: asyncio.Queue = asyncio.Queue()
+        entry = (asyncio.get_running_loop(), queue)
+        with self._queues_lock:
+            self._queues.append(entry)
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    return
+                yield event
+        finally:
+            with self._queues_lock:
+                self._queues.remove(entry)
+
+    async def run(self):
+        """Работает до stop() или ошибки стрима."""
+        self.running = True
+        try:
+            if self.shards > 0:
+                await self._run_sharded()
+            else:
+                await self._run_stream()
+        finally:
+            self.running = False
+            with self._queues_lock:
+                queues = list(self._queues)
+            for loop, queue in queues:
+                loop.call_soon_threadsafe(queue.put_nowait, None)
+
+    def stop(self):
+        self.running = False
+
+    async def _run_sharded(self):
+        ingestion = ShardedIngestion(self.token, self.instruments, self.shards, self.depth)
+
+        def on_events(batch):
+            for event in batch:
+                self._emit(event)
+
+        ingestion.start(on_events, self.on_metrics, self._error)
+        self._status(True)
+        try:
+            while self.running:
+                await asyncio.sleep(0.1)
+        finally:
+            ingestion.stop()
+            self._status(False)
+
+    async def _run_stream(self):
+        try:
+            async with get_pool(self.token).async_session() as client:
+                logger.info("Client created, setting up stream...")
+                self._status(True)
+
+                async def request_iterator():
+                    try:
+                        for request in subscription_requests(self.instruments, self.depth):
+                            yield request
+
+                        while self.running:
+                            await asyncio.sleep(0.1)
+                            yield MarketDataRequest()
+
+                    except Exception as e:
+                        logger.error(f"Request iterator error: {e}")
+                        raise
+
+                stream = client.market_data_stream.market_data_stream(request_iterator())
+
+                async for response in stream:
+                    if not self.running:
+                        break
+
+                    if self.on_raw:
+                        self.on_raw(response)
+
+                    try:
+                        event = decode_response(response)
+                        if event is not None:
+                            self._emit(event)
+
+                    except Exception as e:
+                        logger.error(f"Error processing market data: {e}")
+                        if self.on_raw:
+                            self.on_raw(f"Error processing data: {e}")
+
+        except asyncio.CancelledError:
+            logger.info("Stream was cancelled")
+        except grpc.RpcError as e:
+            self._error(f"gRPC error: {e.code().name} - {e.details()}")
+        except Exception as e:
+            self._error(f"Stream error: {str(e)}")
+        finally:
+            logger.info("Stream stopped")
+            self._status(False)
+
+
+class VolumeByPrice:
+    """Объем сделок покупок и продаж по ценам (цены - целые нано-единицы, как в событиях)."""
+
+    def __init__(self):
+        self.levels: Dict[int, List[int]] = {}  # цена -> [куплено, продано]
+        self.totals = [0, 0]
+
+    def add(self, price: int, quantity: int, direction: int):
+        volumes = self.levels.setdefault(price, [0, 0])
+        if direction == BUY:
+            volumes[0] += quantity
+            self.totals[0] += quantity
+        elif direction == SELL:
+            volumes[1] += quantity
+            self.totals[1] += quantity
+
+    def top(self, count: int = 10) -> List[Tuple[float, int, int]]:
+        """Уровни с наибольшим суммарным объемом."""
+        levels = sorted(self.levels.items(), key=lambda item: -(item[1][0] + item[1][1]))
+        return [(nano_to_float(price), buy, sell) for price, (buy, sell) in levels[:count]]
+
+    def clear(self):
+        self.levels.clear()
+        self.totals = [0, 0]
+
+
+class InstrumentAnalytics:
+    """Аналитика одного инструмента: движок сделок и стакана, объем по ценам, последняя цена."""
+
+    def __init__(self, instrument: str, threshold: int):
+        self.instrument = instrument
+        self.analytics = AnalyticsEngine(threshold)
+        self.analytics.set_instrument(instrument)
+        self.volume = VolumeByPrice()
+        self.last_price: Optional[float] = None
+        self.trading_status: Optional[int] = None
+        self.events = 0
+
+    def close(self):
+        self.analytics.close()
+
+
+class MarketEngine:
+    """Потребитель событий MarketStream без Qt: аналитика, бары и объем по ценам по инструментам.
+
+    engine.on_event подключается к MarketStream как колбэк; snapshot()
+    возвращает текущие результаты всех инструментов.
+    """
+
+    def __init__(self, threshold: int = 1000, bar_builder: Optional[BarBuilder] = None):
+        self.threshold = threshold
+        self.bars = bar_builder or BarBuilder()
+        self.instruments: Dict[str, InstrumentAnalytics] = {}
+        self._lock = threading.Lock()
+
+    def _state(self, instrument: str) -> InstrumentAnalytics:
+        state = self.instruments.get(instrument)
+        if state is None:
+            state = self.instruments[instrument] = InstrumentAnalytics(instrument, self.threshold)
+        return state
+
+    def on_event(self, event: MarketEvent):
+        instrument = event.instrument
+        if not instrument:
+            return
+        with self._lock:
+            state = self._state(instrument)
+            state.events += 1
+            if isinstance(event, Trade):
+                ts, price = event.ts, event.price_float
+                state.analytics.on_trade(ts, price, event.quantity, event.direction)
+                state.volume.add(event.price, event.quantity, event.direction)
+                self.bars.add_trade(instrument, ts, price, event.quantity, event.direction)
+            elif isinstance(event, BookSnapshot):
+                state.analytics.on_book(event.ts, *event.float_arrays())
+                self.bars.advance(instrument, event.ts)
+            elif isinstance(event, LastPrice):
+                state.last_price = event.price_float
+            elif isinstance(event, TradingStatus):
+                state.trading_status = event.status
+
+    def snapshot(self) -> Dict[str, dict]:
+        result = {}
+        with self._lock:
+            for instrument, state in self.instruments.items():
+                snapshot = state.analytics.snapshot()
+                snapshot["events"] = state.events
+                snapshot["last_price"] = state.last_price
+                snapshot["trading_status"] = state.trading_status
+                snapshot["volume_totals"] = list(state.volume.totals)
+                snapshot["volume_top"] = state.volume.top()
+                bar = self.bars.current(instrument, 60)
+                snapshot["bar_1m"] = bar.as_dict() if bar else None
+                result[instrument] = snapshot
+        return result
+
+    def close(self):
+        with self._lock:
+            for state in self.instruments.values():
+                state.close()
@@ -0,0 +1,155 @@
+# headless.py
+import argparse
+import asyncio
+import enum
+import json
+import logging
+import os
+import signal
+import time
+from array import array
+
+from engine import MarketEngine, MarketStream
+from market_events import ORDER_BOOK_DEPTH, MarketEvent
+from tick_db import get_tick_db, shutdown as shutdown_tick_db
+
+logger = logging.getLogger(__name__)
+
+
+def _jsonable(value):
+    """Событие/снимок -> значения, которые понимает json (события, array, enum, кортежи)."""
+    if isinstance(value, MarketEvent):
+        return _jsonable(value.as_dict())
+    if isinstance(value, dict):
+        return {("session" if key is None else str(key)): _jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, array)):
+        return [_jsonable(item) for item in value]
+    if isinstance(value, enum.Enum):
+        return value.value
+    return value
+
+
+class JsonLinesWriter:
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, record: dict):
+        self._file.write(json.dumps(_jsonable(record), ensure_ascii=False) + "\n")
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+async def run(args) -> int:
+    os.makedirs(args.out, exist_ok=True)
+    analytics_out = JsonLinesWriter(os.path.join(args.out, "analytics.jsonl"))
+    metrics_out = JsonLinesWriter(os.path.join(args.out, "metrics.jsonl"))
+    capture_out = JsonLinesWriter(os.path.join(args.out, "capture.jsonl")) if args.capture else None
+
+    engine = MarketEngine(threshold=args.threshold)
+    counters = {"events": 0, "errors": 0}
+
+    tick_db = get_tick_db() if args.record else None
+
+    def on_event(event):
+        counters["events"] += 1
+        engine.on_event(event)
+        if capture_out:
+            capture_out.write(event)
+        if tick_db:
+            tick_db.add(event)
+
+    def on_error(message):
+        counters["errors"] += 1
+        metrics_out.write({"ts": time.time(), "error": message})
+
+    stream = MarketStream(
+        args.token, args.instruments, depth=args.depth, shards=args.shards,
+        on_event=on_event, on_error=on_error,
+        on_metrics=lambda metrics: metrics_out.write(dict(metrics, ts=time.time())),
+    )
+
+    stream_task = asyncio.create_task(stream.run())
+
+    def shutdown():
+        # Отмена прерывает ожидание следующего сообщения, а не ждет его
+        stream.stop()
+        stream_task.cancel()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, shutdown)
+        except NotImplementedError:  # Windows
+            pass
+
+    started = time.monotonic()
+
+    def write_snapshot():
+        now = time.time()
+        for instrument, snapshot in engine.snapshot().items():
+            analytics_out.write(dict(snapshot, instrument=instrument))
+        metrics_out.write({
+            "ts": now,
+            "events": counters["events"],
+            "errors": counters["errors"],
+            "events_per_second": counters["events"] / max(time.monotonic() - started, 1e-9),
+        })
+
+    async def report():
+        while True:
+            await asyncio.sleep(args.interval)
+            write_snapshot()
+            for writer in (analytics_out, metrics_out, capture_out):
+                if writer:
+                    writer.flush()
+            if args.duration and time.monotonic() - started >= args.duration:
+                shutdown()
+
+    reporter = asyncio.create_task(report())
+    try:
+        await stream_task
+    except asyncio.CancelledError:
+        pass
+    finally:
+        reporter.cancel()
+        write_snapshot()
+        engine.close()
+        for writer in (analytics_out, metrics_out, capture_out):
+            if writer:
+                writer.close()
+        shutdown_tick_db()
+        from session_pool import close_all, get_pool
+        await get_pool(args.token).close_async()
+        close_all()
+    return 1 if counters["errors"] and not counters["events"] else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Стрим и аналитика рыночных данных без графического интерфейса")
+    parser.add_argument("instruments", nargs="+", help="UID или FIGI инструментов")
+    parser.add_argument("--token", help="API-токен T-Invest, если не задан T_INVEST_TOKEN "
+                                         "(флаг виден другим пользователям в списке процессов)")
+    parser.add_argument("--out", default="headless_out", help="Каталог для analytics/metrics/capture .jsonl")
+    parser.add_argument("--shards", type=int, default=0, help="Число процессов приема (0 - в этом процессе)")
+    parser.add_argument("--depth", type=int, default=ORDER_BOOK_DEPTH, help="Глубина стакана")
+    parser.add_argument("--threshold", type=int, default=1000, help="Порог крупной сделки, лотов")
+    parser.add_argument("--interval", type=float, default=5.0, help="Период записи аналитики, секунды")
+    parser.add_argument("--duration", type=float, default=0, help="Остановиться через N секунд (0 - до Ctrl+C)")
+    parser.add_argument("--capture", action="store_true", help="Писать все события стрима в capture.jsonl")
+    parser.add_argument("--record", action="store_true", help="Сохранять сделки, цены и вершину стакана в базу тиков")
+    args = parser.parse_args(argv)
+    args.token = os.environ.get("T_INVEST_TOKEN") or args.token
+    if not args.token:
+        parser.error("задайте токен переменной окружения T_INVEST_TOKEN или флагом --token")
+
+    logging.basicConfig(level=logging.INFO)
+    raise SystemExit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
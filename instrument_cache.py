@@ -0,0 +1,164 @@
+# instrument_cache.py
+import json
+import logging
+import os
+import threading
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from tinkoff.invest import InstrumentIdType
+
+from app_paths import data_dir
+from request_scheduler import PRIORITY_BACKGROUND
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ("uid", "figi", "ticker", "name", "class_code", "instrument_type", "currency", "lot")
+
+
+def display_name(info: Optional[dict]) -> Optional[str]:
+    """Тикер инструмента, а если его нет - название."""
+    if not info:
+        return None
+    return info.get("ticker") or info.get("name") or None
+
+
+class InstrumentCache:
+    """Постоянный кэш UID -> сведения об инструменте.
+
+    Хранится в JSON в каталоге данных приложения, поэтому при следующем запуске
+    названия позиций известны сразу, а в API уходят запросы только по новым UID.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.path.join(data_dir(), "instruments.json")
+        self._items: Dict[str, dict] = {}
+        self._by_figi: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                items = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Instrument cache is unreadable, starting empty: {e}")
+            return
+        for info in items.values():
+            self._index(info)
+
+    def _index(self, info: dict):
+        self._items[info["uid"]] = info
+        if info.get("figi"):
+            self._by_figi[info["figi"]] = info["uid"]
+
+    def get(self, uid: str = "", figi: str = "") -> Optional[dict]:
+        with self._lock:
+            info = self._items.get(uid)
+            if info is None and figi:
+                info = self._items.get(self._by_figi.get(figi, ""))
+            return info
+
+    def put(self, instrument) -> dict:
+        """Добавляет инструмент SDK (Instrument, Share, Future, ...)."""
+        info = {field: getattr(instrument, field, None) for field in FIELDS}
+        with self._lock:
+            if self._items.get(info["uid"]) != info:
+                self._index(info)
+                self._dirty = True
+        return info
+
+    def put_many(self, instruments: Iterable):
+        for instrument in instruments:
+            self.put(instrument)
+        self.save()
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            items = dict(self._items)
+            self._dirty = False
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(items, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Failed to save instrument cache: {e}")
+
+    def resolve(self, scheduler, keys: Iterable[Tuple[str, str]],
+                on_resolved: Callable[[str, Optional[dict]], None]) -> Dict[str, Optional[dict]]:
+        """Возвращает сразу известные инструменты по парам (uid, figi).
+
+        Для промахов параллельно запрашивает GetInstrumentBy (по UID, затем по FIGI)
+        в фоновой очереди планировщика и вызывает on_resolved(uid, info) по мере ответов;
+        info равен None, если инструмент найти не удалось.
+        """
+        known = {}
+        misses = []
+        for uid, figi in keys:
+            info = self.get(uid, figi)
+            known[uid] = info
+            if info is None:
+                misses.append((uid, figi))
+        if not misses:
+            return known
+
+        remaining = [len(misses)]
+        remaining_lock = threading.Lock()
+
+        def finish(uid, info):
+            on_resolved(uid, info)
+            with remaining_lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                self.save()
+
+        def lookup(id_type, value):
+            return scheduler.submit(
+                "instruments",
+                lambda client: client.instruments.get_instrument_by(id_type=id_type, id=value).instrument,
+                PRIORITY_BACKGROUND,
+                key=("instrument", id_type, value)
+            )
+
+        def on_figi(uid, future):
+            if future.cancelled() or future.exception() is not None:
+                finish(uid, None)
+            else:
+                finish(uid, self.put(future.result()))
+
+        def on_uid(uid, figi, future):
+            if not future.cancelled() and future.exception() is None:
+                finish(uid, self.put(future.result()))
+            elif figi and not future.cancelled():
+                lookup(InstrumentIdType.INSTRUMENT_ID_TYPE_FIGI, figi).add_done_callback(
+                    lambda f: on_figi(uid, f))
+            else:
+                finish(uid, None)
+
+        for uid, figi in misses:
+            if uid:
+                lookup(InstrumentIdType.INSTRUMENT_ID_TYPE_UID, uid).add_done_callback(
+                    lambda f, uid=uid, figi=figi: on_uid(uid, figi, f))
+            else:
+                lookup(InstrumentIdType.INSTRUMENT_ID_TYPE_FIGI, figi).add_done_callback(
+                    lambda f, uid=uid: on_figi(uid, f))
+        return known
+
+
+_cache: Optional[InstrumentCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_instrument_cache() -> InstrumentCache:
+    """Общий кэш инструментов приложения."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = InstrumentCache()
+        return _cache
@@ -0,0 +1,190 @@
+# main_window.py
+import startup_trace
+
+import importlib
+import logging
+import os
+import sys
+from datetime import datetime
+from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
+                            QHBoxLayout, QLabel, QSplitter, QFrame, QSizePolicy,
+                            QGroupBox, QScrollArea)
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtGui import QFont
+
+from styles import setup_palette
+from connection_window import ConnectionWindow
+import workers
+
+logger = logging.getLogger(__name__)
+
+# SDK, grpc и окна после авторизации не нужны для экрана входа: они догружаются в фоне после первого кадра
+WARM_UP_MODULES = ("session_pool", "request_scheduler", "account_info_window", "ticker_window", "market_data_window")
+
+class TinkoffInvestApp(QMainWindow):
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("T-Invest API")
+        self.setGeometry(100, 100, 1400, 900)
+        self.token = None
+        self.scheduler = None  # RequestScheduler, создается после авторизации
+        # Окна инструментов и стакана создаются при первой успешной авторизации
+        self.ticker_window = None
+        self.market_data_window = None
+        self._first_frame_shown = False
+        self.init_ui()
+        
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.update_time)
+        self.timer.start(1000)
+        
+    def init_ui(self):
+        main_widget = QWidget()
+        self.setCentralWidget(main_widget)
+        main_layout = QVBoxLayout(main_widget)
+        main_layout.setContentsMargins(0, 0, 0, 0)
+        main_layout.setSpacing(0)
+        
+        # Header
+        header_frame = QFrame()
+        header_frame.setObjectName("headerFrame")
+        header_frame.setFixedHeight(80)
+        header_layout = QHBoxLayout(header_frame)
+        header_layout.setContentsMargins(20, 0, 20, 0)
+        
+        self.title_label = QLabel("T-INVEST API")
+        self.title_label.setFont(QFont("Arial", 20, QFont.Bold))
+        self.title_label.setStyleSheet("color: #4CAF50;")
+        
+        self.status_label = QLabel("Не авторизован")
+        self.status_label.setFont(QFont("Arial", 12))
+        self.status_label.setStyleSheet("color: #FF5252;")
+        
+        self.time_label = QLabel()
+        self.time_label.setFont(QFont("Arial", 14))
+        self.update_time()
+        
+        header_layout.addWidget(self.title_label)
+        header_layout.addWidget(self.status_label)
+        header_layout.addStretch()
+        header_layout.addWidget(self.time_label)
+        main_layout.addWidget(header_frame)
+        
+        # Main content
+        content_widget = QWidget()
+        content_layout = QHBoxLayout(content_widget)
+        content_layout.setContentsMargins(15, 15, 15, 15)
+        content_layout.setSpacing(15)
+        
+        # Left panel (connection and account info)
+        self.connection_window = ConnectionWindow(self)
+        self.connection_window.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        
+        # Right panel (info and instruments)
+        right_panel = QWidget()
+        right_layout = QVBoxLayout(right_panel)
+        right_layout.setContentsMargins(0, 0, 0, 0)
+        right_layout.setSpacing(15)
+        right_panel.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        
+        # Info group
+        self.info_group = QGroupBox("ИНФОРМАЦИЯ")
+        self.info_label = QLabel("Введите API токен для начала работы")
+        self.info_label.setWordWrap(True)
+        info_layout = QVBoxLayout()
+        info_layout.addWidget(self.info_label)
+        self.info_group.setLayout(info_layout)
+        
+        self.right_layout = right_layout
+        right_layout.addWidget(self.info_group)
+        right_layout.addStretch()
+        
+        splitter = QSplitter(Qt.Horizontal)
+        splitter.addWidget(self.connection_window)
+        splitter.addWidget(right_panel)
+        splitter.setSizes([400, 600])
+        splitter.setStretchFactor(0, 1)
+        splitter.setStretchFactor(1, 2)
+        
+        content_layout.addWidget(splitter)
+        main_layout.addWidget(content_widget)
+        
+    def _ensure_data_windows(self):
+        """Создает окна инструментов и стакана при первом обращении"""
+        if self.market_data_window is not None:
+            return
+        from ticker_window import TickerWindow
+        from market_data_window import MarketDataWindow
+
+        self.ticker_window = TickerWindow(self)
+        self.market_data_window = MarketDataWindow(self)
+        self.right_layout.insertWidget(1, self.ticker_window)
+        self.right_layout.insertWidget(2, self.market_data_window)
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self._first_frame_shown:
+            self._first_frame_shown = True
+            QTimer.singleShot(0, self._on_first_frame)
+
+    def _on_first_frame(self):
+        startup_trace.finish("first frame")
+        workers.get_worker_pool().submit(self._warm_up, name="warm up imports")
+
+    @staticmethod
+    def _warm_up():
+        for name in WARM_UP_MODULES:
+            try:
+                importlib.import_module(name)
+            except Exception as e:
+                logger.warning(f"Failed to preload {name}: {e}")
+
+    def update_time(self):
+        current_time = datetime.now().strftime("%H:%M:%S")
+        current_date = datetime.now().strftime("%d.%m.%Y")
+        self.time_label.setText(f"{current_date} | {current_time}")
+        
+    def show_info(self, message):
+        self.info_label.setText(message)
+        
+    def update_status(self, authenticated, message=""):
+        if authenticated:
+            self.status_label.setText("Авторизован")
+            self.status_label.setStyleSheet("color: #4CAF50;")
+            self._ensure_data_windows()
+            self.ticker_window.setVisible(True)
+            self.market_data_window.setVisible(True)  # Изменено: показываем новое окно
+            self.market_data_window.set_token(self.token)  # Передаем токен
+        else:
+            self.status_label.setText("Не авторизован")
+            self.status_label.setStyleSheet("color: #FF5252;")
+            if self.market_data_window is not None:
+                self.ticker_window.setVisible(False)
+                self.market_data_window.setVisible(False)  # Изменено: скрываем новое окно
+        if message:
+            self.show_info(message)
+
+    def closeEvent(self, event):
+        if self.scheduler:
+            self.scheduler.stop()
+        if self.market_data_window is not None:
+            self.market_data_window.shutdown()  # останавливает стрим и процесс аналитики
+        tick_db = sys.modules.get("tick_db")
+        if tick_db is not None:
+            tick_db.shutdown()  # дописывает очередь до остановки пула задач
+        # Без авторизации SDK мог так и не загрузиться
+        session_pool = sys.modules.get("session_pool")
+        if session_pool is not None:
+            session_pool.close_all()
+        workers.shutdown()
+        super().closeEvent(event)
+
+def run() -> int:
+    """Запускает приложение (из main.py) и возвращает код выхода цикла событий."""
+    logging.basicConfig(level=os.environ.get("T_INVEST_LOG_LEVEL", "INFO").upper())
+    app = QApplication(sys.argv)
+    app.setStyle("Fusion")
+    setup_palette(app)
+    window = TinkoffInvestApp()
+    window.show()
+    return app.exec_()
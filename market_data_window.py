@@ -1,55 +1,76 @@
 # market_data_window.py
-import asyncio
-import threading
-import grpc
 import logging
+import os
+import threading
 from typing import Optional, Dict, Any, List
 from PyQt5.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QComboBox,
-    QTableWidget, QTableWidgetItem, QHeaderView, QMessageBox, QGroupBox,
-    QScrollArea, QTextEdit, QSplitter
+    QMessageBox, QGroupBox, QScrollArea, QTextEdit, QSplitter, QCheckBox
 )
 from PyQt5.QtCore import Qt, pyqtSignal, QObject, QMetaObject, Q_ARG, QTimer, pyqtSlot
-from PyQt5.QtGui import QColor, QFont
+from PyQt5.QtGui import QFont
 from tinkoff.invest import (
-    AsyncClient, Client,
-    MarketDataRequest, SubscribeOrderBookRequest, SubscribeTradesRequest,
-    SubscribeLastPriceRequest, SubscriptionAction, OrderBookInstrument,
-    TradeInstrument, LastPriceInstrument, MarketDataResponse, Quotation,
-    SecurityTradingStatus, InstrumentIdType, TradeDirection
+    SecurityTradingStatus, InstrumentIdType, CandleInterval
 )
 from tinkoff.invest.exceptions import AioRequestError
-from datetime import datetime
-import pytz
+from datetime import datetime, timezone
 import traceback
 from analytics_window import AnalyticsWindow  # Добавлен импорт
+from bar_builder import candles_to_rows, get_bar_builder
+from dom_widget import DomWidget
+from tick_chart import TickChart
+from candle_store import get_candle_store
+from engine import MarketStream
+from market_events import MOSCOW_TZ, BookSnapshot, LastPrice, MarketEvent, Trade, TradingStatus
+from request_scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+from session_pool import get_pool
+from tick_db import get_tick_db
+from workers import TaskHandle, get_worker_pool
+from instrument_cache import get_instrument_cache
 
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-MOSCOW_TZ = pytz.timezone('Europe/Moscow')
-
-def quotation_to_float(quotation: Quotation) -> float:
-    return float(f"{quotation.units}.{abs(quotation.nano):09d}")
+# Число процессов приема рыночных данных; 0 - стрим в процессе приложения
+INGEST_SHARDS = int(os.environ.get("T_INVEST_INGEST_SHARDS", "0"))
 
 class MarketDataStreamer(QObject):
+    """Qt-обертка над MarketStream: колбэки стрима превращаются в сигналы для окна.
+
+    События копятся в список, и в окно уходит один сигнал на пачку: список
+    передается по ссылке (pyqtSignal(object) не конвертирует его), а пока
+    окно не забрало пачку, новые события дописываются в нее же.
+    """
+
     raw_data_received = pyqtSignal(str)
-    data_updated = pyqtSignal(dict)
+    data_updated = pyqtSignal(object)  # List[MarketEvent]
     stream_error = pyqtSignal(str)
     connection_status = pyqtSignal(bool)
+    shard_metrics = pyqtSignal(dict)
 
-    def __init__(self, token: str, figi: str):
+    def __init__(self, token: str, figi: str, instruments: Optional[List[str]] = None, shards: int = 0):
         super().__init__()
         self.token = token
         self.figi = figi
-        self.client: Optional[AsyncClient] = None
-        self.stream_thread: Optional[threading.Thread] = None
-        self.running = False
+        self.stream = MarketStream(
+            token, instruments or [figi], shards=shards,
+            on_event=self._on_event,
+            on_raw=self._on_raw,
+            on_status=self.connection_status.emit,
+            on_error=self.stream_error.emit,
+            on_metrics=self.shard_metrics.emit,
+        )
+        self.stream_task: Optional[TaskHandle] = None
         self.last_update_time: Optional[datetime] = None
+        self._pending: List[MarketEvent] = []
+        self._pending_lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self.stream.running
 
     async def check_instrument_status(self):
         try:
-            async with AsyncClient(self.token) as client:
+            async with get_pool(self.token).async_session() as client:
                 status = await client.market_data.get_trading_status(instrument_id=self.figi)
                 if status.trading_status != SecurityTradingStatus.SECURITY_TRADING_STATUS_NORMAL_TRADING:
                     raise Exception(f"Instrument not available for trading. Status: {status.trading_status.name}")
@@ -58,162 +79,60 @@ class MarketDataStreamer(QObject):
             logger.error(f"Instrument status check failed: {e}")
             raise
 
-    async def _run_stream(self):
-        try:
-            async with AsyncClient(self.token) as client:
-                self.client = client
-                logger.info("Client created, setting up stream...")
-                self.connection_status.emit(True)
-
-                async def request_iterator():
-                    try:
-                        yield MarketDataRequest(
-                            subscribe_order_book_request=SubscribeOrderBookRequest(
-                                subscription_action=SubscriptionAction.SUBSCRIPTION_ACTION_SUBSCRIBE,
-                                instruments=[OrderBookInstrument(
-                                    instrument_id=self.figi,
-                                    depth=50
-                                )],
-                            )
-                        )
-                        yield MarketDataRequest(
-                            subscribe_trades_request=SubscribeTradesRequest(
-                                subscription_action=SubscriptionAction.SUBSCRIPTION_ACTION_SUBSCRIBE,
-                                instruments=[TradeInstrument(
-                                    instrument_id=self.figi,
-                                )],
-                            )
-                        )
-                        yield MarketDataRequest(
-                            subscribe_last_price_request=SubscribeLastPriceRequest(
-                                subscription_action=SubscriptionAction.SUBSCRIPTION_ACTION_SUBSCRIBE,
-                                instruments=[LastPriceInstrument(
-                                    instrument_id=self.figi,
-                                )],
-                            )
-                        )
-
-                        while self.running:
-                            await asyncio.sleep(0.1)
-                            yield MarketDataRequest()
-
-                    except Exception as e:
-                        logger.error(f"Request iterator error: {e}")
-                        raise
-
-                stream = client.market_data_stream.market_data_stream(request_iterator())
-
-                async for response in stream:
-                    if not self.running:
-                        break
-
-                    raw_data = f"--- Raw Market Data Response ---\n{response}\n\n"
-                    self.raw_data_received.emit(raw_data)
-
-                    try:
-                        data = {}
-
-                        if hasattr(response, 'orderbook') and response.orderbook is not None:
-                            order_book = response.orderbook
-                            asks = []
-                            for ask in order_book.asks:
-                                if ask.price is not None:
-                                    asks.append({
-                                        "price": quotation_to_float(ask.price),
-                                        "quantity": ask.quantity
-                                    })
-                            bids = []
-                            for bid in order_book.bids:
-                                if bid.price is not None:
-                                    bids.append({
-                                        "price": quotation_to_float(bid.price),
-                                        "quantity": bid.quantity
-                                    })
-
-                            data["order_book"] = {
-                                "figi": order_book.figi,
-                                "depth": order_book.depth,
-                                "is_consistent": order_book.is_consistent,
-                                "asks": sorted(asks, key=lambda x: x["price"]),
-                                "bids": sorted(bids, key=lambda x: x["price"], reverse=True),
-                                "time": order_book.time.astimezone(MOSCOW_TZ).strftime("%H:%M:%S.%f")[:-3]
-                            }
-
-                        if hasattr(response, 'trade') and response.trade is not None:
-                            trade = response.trade
-                            if trade.price is not None:
-                                trade_time = trade.time.astimezone(MOSCOW_TZ)
-                                trade_data = {
-                                    "price": quotation_to_float(trade.price),
-                                    "quantity": trade.quantity,
-                                    "direction": trade.direction,
-                                    "time": trade_time.strftime("%H:%M:%S.%f")[:-3]  # Формат: 10:34:38.634
-                                }
-                                data["trade"] = trade_data
-
-                        if hasattr(response, 'last_price') and response.last_price is not None:
-                            last_price = response.last_price
-                            if last_price.price is not None:
-                                data["last_price"] = {
-                                    "price": quotation_to_float(last_price.price),
-                                    "time": last_price.time.astimezone(MOSCOW_TZ).strftime("%H:%M:%S.%f")[:-3]
-                                }
-
-                        if data:
-                            self.data_updated.emit(data)
-
-                    except Exception as e:
-                        logger.error(f"Error processing market data: {e}")
-                        self.raw_data_received.emit(f"Error processing data: {e}\n")
-
-        except asyncio.CancelledError:
-            logger.info("Stream was cancelled")
-        except grpc.RpcError as e:
-            error_msg = f"gRPC error: {e.code().name} - {e.details()}"
-            logger.error(error_msg)
-            self.stream_error.emit(error_msg)
-        except Exception as e:
-            error_msg = f"Stream error: {str(e)}"
-            logger.error(error_msg)
-            self.stream_error.emit(error_msg)
-        finally:
-            logger.info("Stream stopped")
-            self.connection_status.emit(False)
+    def _on_event(self, event: MarketEvent):
+        with self._pending_lock:
+            self._pending.append(event)
+            if len(self._pending) > 1:
+                return  # пачка уже отправлена и еще не забрана окном
+            batch = self._pending
+        self.data_updated.emit(batch)
+
+    def take_batch(self, batch: List[MarketEvent]) -> List[MarketEvent]:
+        """Забирает пачку из сигнала: после этого события пойдут в новую пачку."""
+        with self._pending_lock:
+            if self._pending is batch:
+                self._pending = []
+        return batch
+
+    def _on_raw(self, response):
+        if isinstance(response, str):
+            self.raw_data_received.emit(f"{response}\n")
+        else:
+            self.raw_data_received.emit(f"--- Raw Market Data Response ---\n{response}\n\n")
 
     def start_stream(self):
         if not self.running:
-            self.running = True
+            self.stream.running = True
             self.last_update_time = None
 
-            def run_async_loop(loop):
-                asyncio.set_event_loop(loop)
-                loop.run_until_complete(self._run_stream())
-
-            loop = asyncio.new_event_loop()
-            self.stream_thread = threading.Thread(target=run_async_loop, args=(loop,))
-            self.stream_thread.daemon = True
-            self.stream_thread.start()
+            # Стрим работает в общем event loop пула задач и переиспользует его канал
+            self.stream_task = get_worker_pool().run_coroutine(self.stream.run, name=f"stream {self.figi}")
 
     def stop_stream(self):
         if self.running:
-            self.running = False
+            self.stream.stop()
             logger.info("Stopping stream...")
+            # Отмена прерывает ожидание следующего сообщения, а не ждет его
+            if self.stream_task:
+                self.stream_task.cancel()
 
 class MarketDataWindow(QGroupBox):
+    # Статус торгов перед стартом стрима приходит из потока планировщика: (instrument_id, ticker, class_code, Future)
+    trading_status_checked = pyqtSignal(str, str, str, object)
+
     def __init__(self, parent=None):
         super().__init__("СТАКАН И СДЕЛКИ (DEBUG MODE)")
         self.parent = parent
         self.token = None
         self.selected_figi = None
         self.streamer = None
-        self.trade_volumes_by_price: Dict[float, Dict[str, int]] = {}
-        self.current_asks: List[Dict[str, Any]] = []
-        self.current_bids: List[Dict[str, Any]] = []
+        self.stream_instrument_id = None
         self.last_price_value: Optional[float] = None
         self.class_codes = []
         self.ticker_map = {}
         self.analytics_window = AnalyticsWindow(self)  # Создаем окно аналитики
         self.init_ui()
+        self.trading_status_checked.connect(self._on_trading_status_checked)
 
     def init_ui(self):
         main_layout = QVBoxLayout(self)
@@ -273,21 +192,22 @@ class MarketDataWindow(QGroupBox):
 
         order_book_group = QGroupBox("Стакан и Сделки")
         order_book_layout = QVBoxLayout(order_book_group)
-        self.order_book_table = QTableWidget()
-        self.order_book_table.setColumnCount(5)
-        self.order_book_table.setHorizontalHeaderLabels([
-            "Объем Покупок",
-            "Заявки Покупка",
-            "Цена",
-            "Заявки Продажа",
-            "Объем Продаж"
-        ])
-        self.order_book_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
-        self.order_book_table.verticalHeader().setVisible(False)
-        self.order_book_table.setEditTriggers(QTableWidget.NoEditTriggers)
-        self.order_book_table.setSelectionMode(QTableWidget.NoSelection)
-        order_book_layout.addWidget(self.order_book_table)
-        splitter.addWidget(order_book_group)
+        # Стакан рисуется QPainter по массивам уровней; колесо мыши листает, двойной щелчок центрирует
+        self.dom_widget = DomWidget()
+        self.heatmap_checkbox = QCheckBox("Тепловая карта ликвидности")
+        self.heatmap_checkbox.toggled.connect(self.dom_widget.set_heatmap_enabled)
+        order_book_layout.addWidget(self.heatmap_checkbox)
+        order_book_layout.addWidget(self.dom_widget)
+        # График цены сделок рядом со стаканом
+        chart_group = QGroupBox("График сделок")
+        chart_layout = QVBoxLayout(chart_group)
+        self.tick_chart = TickChart()
+        chart_layout.addWidget(self.tick_chart)
+
+        book_splitter = QSplitter(Qt.Horizontal)
+        book_splitter.addWidget(order_book_group)
+        book_splitter.addWidget(chart_group)
+        splitter.addWidget(book_splitter)
 
         raw_data_group = QGroupBox("Сырые данные (DEBUG)")
         raw_data_layout = QVBoxLayout(raw_data_group)
@@ -309,6 +229,13 @@ class MarketDataWindow(QGroupBox):
         """)
         main_layout.addWidget(self.status_label)
 
+        # Пропускная способность процессов приема (только при INGEST_SHARDS > 0)
+        self.shards_label = QLabel()
+        self.shards_label.setAlignment(Qt.AlignCenter)
+        self.shards_label.setVisible(False)
+        self.shard_metrics: Dict[int, Dict[str, Any]] = {}
+        main_layout.addWidget(self.shards_label)
+
     def open_analytics_window(self):
         """Открывает окно аналитики"""
         if self.analytics_window:
@@ -319,30 +246,33 @@ class MarketDataWindow(QGroupBox):
     def set_token(self, token):
         self.token = token
         if self.token:
-            threading.Thread(target=self._load_class_codes_in_thread, daemon=True).start()
+            get_worker_pool().submit(self._load_class_codes_in_thread)
 
     def _load_class_codes_in_thread(self):
         class_codes = []
         ticker_map = {}
         try:
-            with Client(self.token) as client:
-                all_instruments = []
-                shares_response = client.instruments.shares()
-                all_instruments.extend(shares_response.instruments)
-                futures_response = client.instruments.futures()
-                all_instruments.extend(futures_response.instruments)
-
-                codes = set()
-                for inst in all_instruments:
-                    if inst.class_code in ('TQBR', 'SPBFUT') and inst.api_trade_available_flag:
-                        codes.add(inst.class_code)
-                        ticker_map[(inst.ticker, inst.class_code)] = inst
-
-                class_codes = sorted(list(codes))
-                QMetaObject.invokeMethod(self, 'on_instruments_loaded',
-                                       Qt.QueuedConnection,
-                                       Q_ARG(list, class_codes),
-                                       Q_ARG(dict, ticker_map))
+            scheduler = self.parent.scheduler
+            all_instruments = []
+            shares_response = scheduler.call("instruments", lambda client: client.instruments.shares())
+            all_instruments.extend(shares_response.instruments)
+            futures_response = scheduler.call("instruments", lambda client: client.instruments.futures())
+            all_instruments.extend(futures_response.instruments)
+
+            # Справочник заодно наполняет кэш инструментов для названий позиций
+            get_instrument_cache().put_many(all_instruments)
+
+            codes = set()
+            for inst in all_instruments:
+                if inst.class_code in ('TQBR', 'SPBFUT') and inst.api_trade_available_flag:
+                    codes.add(inst.class_code)
+                    ticker_map[(inst.ticker, inst.class_code)] = inst
+
+            class_codes = sorted(list(codes))
+            QMetaObject.invokeMethod(self, 'on_instruments_loaded',
+                                   Qt.QueuedConnection,
+                                   Q_ARG(list, class_codes),
+                                   Q_ARG(dict, ticker_map))
 
         except Exception as e:
             self.parent.show_info(f"Ошибка загрузки площадок: {str(e)}")
@@ -397,15 +327,25 @@ class MarketDataWindow(QGroupBox):
             self.parent.show_info(f"Не удалось получить instrument_id/FIGI для инструмента {ticker}.")
             return
 
+        # Проверка статуса не блокирует GUI: при исчерпанном лимите ответ может ждать сброса
+        self.stream_button.setEnabled(False)
+        future = self.parent.scheduler.submit(
+            "market_data",
+            lambda client: client.market_data.get_trading_status(instrument_id=instrument_id_to_use),
+            PRIORITY_INTERACTIVE
+        )
+        future.add_done_callback(
+            lambda f: self.trading_status_checked.emit(instrument_id_to_use, ticker, class_code, f)
+        )
+
+    def _on_trading_status_checked(self, instrument_id_to_use, ticker, class_code, future):
+        self.stream_button.setEnabled(True)
         try:
-            with Client(self.token) as client:
-                trading_status_response = client.market_data.get_trading_status(
-                    instrument_id=instrument_id_to_use
-                )
-                if trading_status_response.trading_status != SecurityTradingStatus.SECURITY_TRADING_STATUS_NORMAL_TRADING:
-                    status_name = SecurityTradingStatus(trading_status_response.trading_status).name
-                    self.parent.show_info(f"Инструмент {ticker} ({class_code}) в статусе: {status_name}. Стриминг невозможен.")
-                    return
+            trading_status_response = future.result()
+            if trading_status_response.trading_status != SecurityTradingStatus.SECURITY_TRADING_STATUS_NORMAL_TRADING:
+                status_name = SecurityTradingStatus(trading_status_response.trading_status).name
+                self.parent.show_info(f"Инструмент {ticker} ({class_code}) в статусе: {status_name}. Стриминг невозможен.")
+                return
         except Exception as e:
             self.parent.show_info(f"Ошибка при проверке статуса инструмента: {str(e)}")
             return
@@ -413,18 +353,20 @@ class MarketDataWindow(QGroupBox):
         if self.streamer:
             self.streamer.stop_stream()
 
-        self.streamer = MarketDataStreamer(self.token, instrument_id_to_use)
+        self.streamer = MarketDataStreamer(self.token, instrument_id_to_use, shards=INGEST_SHARDS)
         self.streamer.raw_data_received.connect(self.on_raw_data_received)
+        self.streamer.shard_metrics.connect(self.on_shard_metrics)
         self.streamer.data_updated.connect(self.on_data_updated)
         self.streamer.stream_error.connect(self.display_error)
         self.streamer.connection_status.connect(self.update_connection_status)
 
-        self.trade_volumes_by_price.clear()
-        self.current_asks = []
-        self.current_bids = []
+        self.analytics_window.set_instrument(instrument_id_to_use)
+        self.stream_instrument_id = instrument_id_to_use
+        # Чтение локальных свечей с диска и запрос остатка идут в фоне, не в потоке GUI
+        get_worker_pool().submit(self._seed_bars, instrument_id_to_use, self.parent.scheduler, name="seed bars")
         self.last_price_value = None
-        self.order_book_table.clearContents()
-        self.order_book_table.setRowCount(0)
+        self.dom_widget.clear()
+        self.tick_chart.clear()
 
         self.streamer.start_stream()
         self.stream_button.setText("Остановить стрим")
@@ -433,6 +375,44 @@ class MarketDataWindow(QGroupBox):
         self.status_label.setStyleSheet("color: #4CAF50;")
         self.raw_data_text_edit.clear()
 
+    @staticmethod
+    def _seed_bars(instrument_id, scheduler):
+        """Один запрос минутных свечей засевает бары дня; дальше они строятся из сделок.
+
+        Сохраненные локально свечи берутся с диска, из API догружается только остаток;
+        бары засеваются один раз, объединенными строками. Выполняется в пуле задач:
+        хранилище свечей читается с диска.
+        """
+        now = datetime.now(timezone.utc)
+        midnight = now.astimezone(MOSCOW_TZ).replace(hour=0, minute=0, second=0, microsecond=0)
+        store = get_candle_store()
+        stored = store.rows(instrument_id, "1m", int(midnight.timestamp()))
+        if stored:
+            midnight = datetime.fromtimestamp(stored[-1][0], timezone.utc)
+        future = scheduler.submit(
+            "market_data",
+            lambda client: client.market_data.get_candles(
+                instrument_id=instrument_id, from_=midnight, to=now,
+                interval=CandleInterval.CANDLE_INTERVAL_1_MIN
+            ),
+            PRIORITY_BACKGROUND
+        )
+
+        def on_candles(f):
+            rows = []
+            if f.cancelled() or f.exception() is not None:
+                logger.warning(f"Failed to seed bars for {instrument_id}: {f.exception() if not f.cancelled() else 'cancelled'}")
+            else:
+                rows = candles_to_rows(f.result().candles)
+                store.write(instrument_id, "1m", rows[:-1])  # последняя минута еще не закрыта
+            # Догруженные свечи свежее сохраненных с тем же началом
+            fetched_from = rows[0][0] if rows else None
+            combined = [row for row in stored if fetched_from is None or row[0] < fetched_from] + rows
+            if combined:
+                get_bar_builder().seed(instrument_id, combined, 60)
+
+        future.add_done_callback(on_candles)
+
     def stop_streaming(self):
         if self.streamer:
             self.streamer.stop_stream()
@@ -440,6 +420,8 @@ class MarketDataWindow(QGroupBox):
             self.stream_button.setStyleSheet("background-color: #4CAF50; color: white;")
             self.status_label.setText("Статус: Не активен")
             self.status_label.setStyleSheet("color: #FF5252;")
+            self.shard_metrics.clear()
+            self.shards_label.setVisible(False)
 
     @pyqtSlot(str)
     def on_raw_data_received(self, raw_data: str):
@@ -449,133 +431,73 @@ class MarketDataWindow(QGroupBox):
         self.raw_data_text_edit.setTextCursor(cursor)
 
     @pyqtSlot(dict)
-    def on_data_updated(self, data: dict):
-        logger.debug(f"on_data_updated called with data keys: {data.keys()}")
-
-        if "order_book" in data:
-            self.current_asks = data["order_book"]["asks"]
-            self.current_bids = data["order_book"]["bids"]
-            logger.debug(f"Updated current_asks (len={len(self.current_asks)}) and current_bids (len={len(self.current_bids)})")
-
-        if "trade" in data:
-            trade_data = data["trade"]
-            price = trade_data["price"]
-            quantity = trade_data["quantity"]
-            direction = trade_data["direction"]
-            
-            if price not in self.trade_volumes_by_price:
-                self.trade_volumes_by_price[price] = {"buy": 0, "sell": 0}
-            
-            if direction == TradeDirection.TRADE_DIRECTION_BUY:
-                self.trade_volumes_by_price[price]["buy"] += quantity
-            elif direction == TradeDirection.TRADE_DIRECTION_SELL:
-                self.trade_volumes_by_price[price]["sell"] += quantity
-            
-            logger.debug(f"Processed trade: price={price}, quantity={quantity}, direction={direction.name}. Total buy/sell volume for {price}: {self.trade_volumes_by_price[price]}")
-            
-            # Передаем данные о сделке в окно аналитики
-            if hasattr(self, 'analytics_window') and self.analytics_window:
-                self.analytics_window.update_trades_data(trade_data)
-
-        if "last_price" in data:
-            self.last_price_value = data["last_price"]["price"]
-            logger.debug(f"Updated last_price_value: {self.last_price_value}")
-        
-        self._update_order_book_table_display()
-
-    def _update_order_book_table_display(self):
-        self.order_book_table.clearContents()
-        
-        logger.debug(f"Redrawing table. current_asks: {self.current_asks}")
-        logger.debug(f"Redrawing table. current_bids: {self.current_bids}")
-        logger.debug(f"Redrawing table. trade_volumes_by_price: {self.trade_volumes_by_price}")
-        logger.debug(f"Redrawing table. last_price_value: {self.last_price_value}")
-
-        all_prices_set = set()
-        for ask in self.current_asks:
-            all_prices_set.add(ask["price"])
-        for bid in self.current_bids:
-            all_prices_set.add(bid["price"])
-        for price in self.trade_volumes_by_price.keys():
-            all_prices_set.add(price)
-
-        all_prices = sorted(list(all_prices_set), reverse=True) 
-
-        self.order_book_table.setRowCount(len(all_prices))
-        
-        for row_idx, price in enumerate(all_prices):
-            buy_volume = self.trade_volumes_by_price.get(price, {}).get("buy", "")
-            item_buy_volume = QTableWidgetItem(str(buy_volume) if buy_volume != "" else "")
-            item_buy_volume.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
-            item_buy_volume.setForeground(QColor(Qt.darkGreen))
-            self.order_book_table.setItem(row_idx, 0, item_buy_volume)
-
-            bid_quantity = ""
-            for bid in self.current_bids:
-                if bid["price"] == price:
-                    bid_quantity = str(bid["quantity"])
-                    break
-            item_bid_quantity = QTableWidgetItem(bid_quantity if bid_quantity != "" else "")
-            item_bid_quantity.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
-            item_bid_quantity.setForeground(QColor(Qt.green))
-            self.order_book_table.setItem(row_idx, 1, item_bid_quantity)
-            
-            price_str = f"{price:.3f}" if int(price * 1000) % 10 != 0 else f"{price:.2f}"
-            item_price = QTableWidgetItem(price_str)
-            item_price.setTextAlignment(Qt.AlignCenter)
-            self.order_book_table.setItem(row_idx, 2, item_price)
-
-            ask_quantity = ""
-            for ask in self.current_asks:
-                if ask["price"] == price:
-                    ask_quantity = str(ask["quantity"])
-                    break
-            item_ask_quantity = QTableWidgetItem(ask_quantity if ask_quantity != "" else "")
-            item_ask_quantity.setTextAlignment(Qt.AlignLeft | Qt.AlignVCenter)
-            item_ask_quantity.setForeground(QColor(Qt.red))
-            self.order_book_table.setItem(row_idx, 3, item_ask_quantity)
-
-            sell_volume = self.trade_volumes_by_price.get(price, {}).get("sell", "")
-            item_sell_volume = QTableWidgetItem(str(sell_volume) if sell_volume != "" else "")
-            item_sell_volume.setTextAlignment(Qt.AlignLeft | Qt.AlignVCenter)
-            item_sell_volume.setForeground(QColor(Qt.darkRed))
-            self.order_book_table.setItem(row_idx, 4, item_sell_volume)
-
-            if self.last_price_value is not None and self.last_price_value == price:
-                for col in range(self.order_book_table.columnCount()):
-                    item = self.order_book_table.item(row_idx, col)
-                    if item:
-                        item.setBackground(QColor("#0d1a08"))
-
-        total_buy_volume = sum(v.get("buy", 0) for v in self.trade_volumes_by_price.values())
-        total_sell_volume = sum(v.get("sell", 0) for v in self.trade_volumes_by_price.values())
-
-        current_row_count = self.order_book_table.rowCount()
-        self.order_book_table.setRowCount(current_row_count + 1)
-        
-        total_label_item = QTableWidgetItem("ИТОГО")
-        total_label_item.setTextAlignment(Qt.AlignCenter)
-        font = total_label_item.font()
-        font.setBold(True)
-        total_label_item.setFont(font)
-        self.order_book_table.setItem(current_row_count, 2, total_label_item)
-
-        total_buy_volume_item = QTableWidgetItem(str(total_buy_volume))
-        total_buy_volume_item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
-        total_buy_volume_item.setForeground(QColor(Qt.darkGreen))
-        total_buy_volume_item.setFont(font)
-        self.order_book_table.setItem(current_row_count, 0, total_buy_volume_item)
-
-        total_sell_volume_item = QTableWidgetItem(str(total_sell_volume))
-        total_sell_volume_item.setTextAlignment(Qt.AlignLeft | Qt.AlignVCenter)
-        total_sell_volume_item.setForeground(QColor(Qt.darkRed))
-        total_sell_volume_item.setFont(font)
-        self.order_book_table.setItem(current_row_count, 4, total_sell_volume_item)
-
-        self.order_book_table.setItem(current_row_count, 1, QTableWidgetItem(""))
-        self.order_book_table.setItem(current_row_count, 3, QTableWidgetItem(""))
-        
-        logger.debug(f"Table update finished. Rows: {self.order_book_table.rowCount()}")
+    def on_shard_metrics(self, metrics: dict):
+        self.shard_metrics[metrics["shard"]] = metrics
+        self.shards_label.setText("  |  ".join(
+            f"Шард {shard}: {m['messages_per_second']:.0f} сообщ/с, декодирование {m['decode_us']:.0f} мкс, "
+            f"задержка {m['lag_ms']:.1f} мс"
+            for shard, m in sorted(self.shard_metrics.items())
+        ))
+        self.shards_label.setVisible(True)
+
+    @pyqtSlot(object)
+    def on_data_updated(self, batch: list):
+        streamer = self.sender()
+        if isinstance(streamer, MarketDataStreamer):
+            streamer.take_batch(batch)
+        # Все инструменты стрима пишутся в базу тиков фоновым писателем
+        get_tick_db().add_many(batch)
+        if streamer is not self.streamer:
+            return  # пачка остановленного стрима
+
+        instrument_id = self.stream_instrument_id
+        bars = get_bar_builder()
+        trades = []
+        for event in batch:
+            if instrument_id and event.instrument != instrument_id:
+                # Стрим может нести и другие инструменты; стакан показывает выбранный,
+                # а их сделки нужны только базовым линиям всплесков в процессе аналитики
+                if isinstance(event, Trade):
+                    trades.append(event)
+                continue
+
+            if isinstance(event, Trade):
+                price = event.price_float
+                # Объем сделок по цене копит сам стакан
+                self.dom_widget.add_trade(event.price, event.quantity, event.direction)
+                self.tick_chart.add_tick(event.ts, price)
+                if instrument_id:
+                    bars.add_trade(instrument_id, event.ts, price, event.quantity, event.direction)
+                trades.append(event)
+
+            elif isinstance(event, BookSnapshot):
+                self.dom_widget.set_book(event.bid_prices, event.bid_quantities,
+                                         event.ask_prices, event.ask_quantities)
+                if instrument_id:
+                    # Время биржи из стакана закрывает бары и без новых сделок
+                    bars.advance(instrument_id, event.ts)
+                if self.analytics_window:
+                    self.analytics_window.update_book(event)
+
+            elif isinstance(event, LastPrice):
+                self.last_price_value = event.price_float
+                self.dom_widget.set_last_price(event.price)
+
+            elif isinstance(event, TradingStatus):
+                self.on_trading_status(event)
+
+        # Сделки пачки (всех инструментов стрима) уходят в окно аналитики одним вызовом
+        if trades and self.analytics_window:
+            self.analytics_window.update_trades(trades)
+
+    def on_trading_status(self, event: TradingStatus):
+        try:
+            status_name = SecurityTradingStatus(event.status).name
+        except ValueError:
+            status_name = str(event.status)
+        if event.status != SecurityTradingStatus.SECURITY_TRADING_STATUS_NORMAL_TRADING:
+            self.raw_data_text_edit.append(f"Торговый статус изменился: {status_name}\n")
+        logger.info(f"Trading status of {event.instrument}: {status_name}")
 
     @pyqtSlot(str)
     def display_error(self, message: str):
@@ -591,9 +513,14 @@ class MarketDataWindow(QGroupBox):
         else:
             self.status_label.setText(f"{current_text.split('(')[0]}(Отключено)")
 
-    def closeEvent(self, event):
+    def shutdown(self):
+        """Останавливает стрим и процесс аналитики; процесс сохраняет базовые линии всплесков.
+        Вызывается главным окном при выходе: дочерний виджет сам closeEvent не получает"""
         if self.streamer:
             self.streamer.stop_stream()
         if hasattr(self, 'analytics_window') and self.analytics_window:
-            self.analytics_window.close()
+            self.analytics_window.shutdown()
+
+    def closeEvent(self, event):
+        self.shutdown()
         super().closeEvent(event)
@@ -0,0 +1,220 @@
+# market_events.py
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional, Tuple
+
+import pytz
+from tinkoff.invest import (
+    InfoInstrument, LastPriceInstrument, MarketDataRequest, OrderBookInstrument, Quotation, SubscribeInfoRequest,
+    SubscribeLastPriceRequest, SubscribeOrderBookRequest, SubscribeTradesRequest, SubscriptionAction, TradeInstrument
+)
+
+MOSCOW_TZ = pytz.timezone('Europe/Moscow')
+
+# Глубина стакана по умолчанию (максимум API)
+ORDER_BOOK_DEPTH = 50
+
+# Цены в событиях - целые нано-единицы (units * 10^9 + nano, как в Quotation), время - наносекунды Unix
+PRICE_SCALE = 1_000_000_000
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+_set = object.__setattr__
+
+
+def quotation_to_float(quotation: Quotation) -> float:
+    return float(f"{quotation.units}.{abs(quotation.nano):09d}")
+
+
+def quotation_to_nano(quotation: Quotation) -> int:
+    # У units и nano один знак, поэтому сумма верна и для отрицательных цен
+    return quotation.units * PRICE_SCALE + quotation.nano
+
+
+def nano_to_float(price: int) -> float:
+    return price / PRICE_SCALE
+
+
+def datetime_to_ns(moment: datetime) -> int:
+    # Точность времени SDK - микросекунды; целая арифметика не теряет их, как float timestamp()
+    return (moment - _EPOCH) // _MICROSECOND * 1000
+
+
+class MarketEvent:
+    """Событие стрима: неизменяемое, со __slots__, передается между потоками по ссылке.
+
+    instrument - UID инструмента (FIGI, если UID в ответе нет), ts_ns - время
+    биржи в наносекундах Unix. Объект можно передать в другой процесс (pickle).
+    """
+
+    __slots__ = ("instrument", "ts_ns")
+    FIELDS: Tuple[str, ...] = ("instrument", "ts_ns")
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __reduce__(self):
+        return type(self), tuple(getattr(self, name) for name in self.FIELDS)
+
+    def __repr__(self):
+        values = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.FIELDS)
+        return f"{type(self).__name__}({values})"
+
+    @property
+    def ts(self) -> float:
+        """Время биржи в секундах Unix (для баров, графиков и аналитики)."""
+        return self.ts_ns / 1e9
+
+    def as_dict(self) -> dict:
+        result = {"type": type(self).__name__}
+        result.update((name, getattr(self, name)) for name in self.FIELDS)
+        return result
+
+
+class BookSnapshot(MarketEvent):
+    """Снимок стакана: цены (нано) и объемы уровней в массивах в порядке API, лучшая цена первой.
+
+    Массивы принадлежат событию и не изменяются после декодирования.
+    """
+
+    __slots__ = ("depth", "is_consistent", "bid_prices", "bid_quantities", "ask_prices", "ask_quantities")
+    FIELDS = ("instrument", "ts_ns", "depth", "is_consistent",
+              "bid_prices", "bid_quantities", "ask_prices", "ask_quantities")
+
+    def __init__(self, instrument: str, ts_ns: int, depth: int, is_consistent: bool,
+                 bid_prices: array, bid_quantities: array, ask_prices: array, ask_quantities: array):
+        _set(self, "instrument", instrument)
+        _set(self, "ts_ns", ts_ns)
+        _set(self, "depth", depth)
+        _set(self, "is_consistent", is_consistent)
+        _set(self, "bid_prices", bid_prices)
+        _set(self, "bid_quantities", bid_quantities)
+        _set(self, "ask_prices", ask_prices)
+        _set(self, "ask_quantities", ask_quantities)
+
+    def float_arrays(self) -> Tuple[array, array, array, array]:
+        """(bid_prices, bid_quantities, ask_prices, ask_quantities) с ценами в float - формат book_metrics."""
+        return (array("d", [price / PRICE_SCALE for price in self.bid_prices]), self.bid_quantities,
+                array("d", [price / PRICE_SCALE for price in self.ask_prices]), self.ask_quantities)
+
+
+class Trade(MarketEvent):
+    """Сделка: цена в нано-единицах, объем в лотах, direction - значение TradeDirection."""
+
+    __slots__ = ("price", "quantity", "direction")
+    FIELDS = ("instrument", "ts_ns", "price", "quantity", "direction")
+
+    def __init__(self, instrument: str, ts_ns: int, price: int, quantity: int, direction: int):
+        _set(self, "instrument", instrument)
+        _set(self, "ts_ns", ts_ns)
+        _set(self, "price", price)
+        _set(self, "quantity", quantity)
+        _set(self, "direction", direction)
+
+    @property
+    def price_float(self) -> float:
+        return self.price / PRICE_SCALE
+
+
+class LastPrice(MarketEvent):
+    """Последняя цена инструмента в нано-единицах."""
+
+    __slots__ = ("price",)
+    FIELDS = ("instrument", "ts_ns", "price")
+
+    def __init__(self, instrument: str, ts_ns: int, price: int):
+        _set(self, "instrument", instrument)
+        _set(self, "ts_ns", ts_ns)
+        _set(self, "price", price)
+
+    @property
+    def price_float(self) -> float:
+        return self.price / PRICE_SCALE
+
+
+class TradingStatus(MarketEvent):
+    """Смена торгового режима: status - значение SecurityTradingStatus."""
+
+    __slots__ = ("status", "limit_order_available", "market_order_available")
+    FIELDS = ("instrument", "ts_ns", "status", "limit_order_available", "market_order_available")
+
+    def __init__(self, instrument: str, ts_ns: int, status: int,
+                 limit_order_available: bool, market_order_available: bool):
+        _set(self, "instrument", instrument)
+        _set(self, "ts_ns", ts_ns)
+        _set(self, "status", status)
+        _set(self, "limit_order_available", limit_order_available)
+        _set(self, "market_order_available", market_order_available)
+
+
+def subscription_requests(instruments: Iterable[str], depth: int = ORDER_BOOK_DEPTH) -> List[MarketDataRequest]:
+    """Подписки на стакан, сделки, последнюю цену и торговый статус для набора инструментов."""
+    instruments = list(instruments)
+    subscribe = SubscriptionAction.SUBSCRIPTION_ACTION_SUBSCRIBE
+    return [
+        MarketDataRequest(
+            subscribe_order_book_request=SubscribeOrderBookRequest(
+                subscription_action=subscribe,
+                instruments=[OrderBookInstrument(instrument_id=i, depth=depth) for i in instruments],
+            )
+        ),
+        MarketDataRequest(
+            subscribe_trades_request=SubscribeTradesRequest(
+                subscription_action=subscribe,
+                instruments=[TradeInstrument(instrument_id=i) for i in instruments],
+            )
+        ),
+        MarketDataRequest(
+            subscribe_last_price_request=SubscribeLastPriceRequest(
+                subscription_action=subscribe,
+                instruments=[LastPriceInstrument(instrument_id=i) for i in instruments],
+            )
+        ),
+        MarketDataRequest(
+            subscribe_info_request=SubscribeInfoRequest(
+                subscription_action=subscribe,
+                instruments=[InfoInstrument(instrument_id=i) for i in instruments],
+            )
+        ),
+    ]
+
+
+def _instrument(message) -> str:
+    return getattr(message, "instrument_uid", None) or message.figi
+
+
+def _book_levels(levels) -> Tuple[array, array]:
+    levels = [level for level in levels if level.price is not None]
+    prices = array("q", [level.price.units * PRICE_SCALE + level.price.nano for level in levels])
+    quantities = array("q", [level.quantity for level in levels])
+    return prices, quantities
+
+
+def decode_response(response) -> Optional[MarketEvent]:
+    """MarketDataResponse -> событие стрима. None - в ответе нет рыночных данных (пинг, ответ на подписку)."""
+    order_book = getattr(response, 'orderbook', None)
+    if order_book is not None:
+        bid_prices, bid_quantities = _book_levels(order_book.bids)
+        ask_prices, ask_quantities = _book_levels(order_book.asks)
+        return BookSnapshot(_instrument(order_book), datetime_to_ns(order_book.time), order_book.depth,
+                            order_book.is_consistent, bid_prices, bid_quantities, ask_prices, ask_quantities)
+
+    trade = getattr(response, 'trade', None)
+    if trade is not None and trade.price is not None:
+        return Trade(_instrument(trade), datetime_to_ns(trade.time), quotation_to_nano(trade.price),
+                     trade.quantity, int(trade.direction))
+
+    last_price = getattr(response, 'last_price', None)
+    if last_price is not None and last_price.price is not None:
+        return LastPrice(_instrument(last_price), datetime_to_ns(last_price.time),
+                         quotation_to_nano(last_price.price))
+
+    status = getattr(response, 'trading_status', None)
+    if status is not None:
+        return TradingStatus(_instrument(status), datetime_to_ns(status.time), int(status.trading_status),
+                             status.limit_order_available_flag, status.market_order_available_flag)
+
+    return None
@@ -0,0 +1,44 @@
+# money.py
+from decimal import Decimal
+from typing import Union
+
+# Денежные значения API хранятся как units + nano (10^-9). Внутри приложения
+# они переводятся в целое число нано-единиц: сложение и вычитание точные,
+# умножение округляется ровно один раз.
+NANO = 1_000_000_000
+
+Number = Union[int, str, Decimal]
+
+
+def to_nano(value) -> int:
+    """Quotation/MoneyValue, Decimal, int или строка -> целое число нано-единиц."""
+    if value is None:
+        return 0
+    if hasattr(value, "units") and hasattr(value, "nano"):
+        return value.units * NANO + value.nano
+    return int((Decimal(value) * NANO).to_integral_value())
+
+
+def from_nano(value: int) -> Decimal:
+    return Decimal(value) / NANO
+
+
+def mul_nano(a: int, b: int) -> int:
+    """Произведение двух значений в нано-единицах с округлением до ближайшего."""
+    q, r = divmod(a * b, NANO)
+    if 2 * r >= NANO:
+        q += 1
+    return q
+
+
+def div_nano(a: int, b: int) -> int:
+    """Частное a / b в нано-единицах с округлением до ближайшего."""
+    q, r = divmod(a * NANO, b)
+    if 2 * abs(r) >= abs(b):
+        q += 1
+    return q
+
+
+def format_nano(value: int, places: int = 2) -> str:
+    """Строка для отображения: форматирование делается только здесь."""
+    return f"{from_nano(value):.{places}f}"
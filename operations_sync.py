@@ -0,0 +1,251 @@
+# operations_sync.py
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterable, List, Optional
+
+from tinkoff.invest import GetOperationsByCursorRequest
+
+from app_paths import data_dir
+from money import to_nano
+from request_scheduler import PRIORITY_BACKGROUND
+from workers import CancellationToken
+
+logger = logging.getLogger(__name__)
+
+# Размер страницы GetOperationsByCursor (максимум API)
+PAGE_SIZE = 1000
+
+# Начало истории, если дата открытия счета неизвестна
+HISTORY_START = datetime(2015, 1, 1, tzinfo=timezone.utc)
+
+# Перекрытие окна повторной синхронизации: операции могут менять статус
+# (исполнение, отмена) и появляться с опозданием
+SYNC_OVERLAP = timedelta(days=3)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS operations (
+    id TEXT PRIMARY KEY,
+    account_id TEXT NOT NULL,
+    parent_operation_id TEXT,
+    date_ms INTEGER NOT NULL,
+    type TEXT,
+    state TEXT,
+    name TEXT,
+    description TEXT,
+    instrument_uid TEXT,
+    figi TEXT,
+    instrument_type TEXT,
+    quantity INTEGER,
+    price_nano INTEGER,
+    payment_nano INTEGER,
+    commission_nano INTEGER,
+    currency TEXT
+);
+CREATE INDEX IF NOT EXISTS operations_account_date ON operations (account_id, date_ms);
+CREATE INDEX IF NOT EXISTS operations_instrument_date ON operations (account_id, instrument_uid, date_ms);
+CREATE TABLE IF NOT EXISTS sync_state (
+    account_id TEXT PRIMARY KEY,
+    synced_until_ms INTEGER,
+    window_from_ms INTEGER,
+    window_to_ms INTEGER,
+    cursor TEXT
+);
+"""
+
+COLUMNS = (
+    "id", "account_id", "parent_operation_id", "date_ms", "type", "state", "name", "description",
+    "instrument_uid", "figi", "instrument_type", "quantity", "price_nano", "payment_nano",
+    "commission_nano", "currency",
+)
+
+
+INSERT_SQL = (
+    f"INSERT OR REPLACE INTO operations ({', '.join(COLUMNS)}) "
+    f"VALUES ({', '.join('?' * len(COLUMNS))})"
+)
+
+
+def _to_ms(value: datetime) -> int:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp() * 1000)
+
+
+def _from_ms(value: int) -> datetime:
+    return datetime.fromtimestamp(value / 1000, tz=timezone.utc)
+
+
+def _enum_name(value) -> str:
+    return getattr(value, "name", None) or str(value).split('.')[-1]
+
+
+def operation_row(account_id: str, item) -> tuple:
+    """OperationItem -> строка таблицы operations."""
+    return (
+        item.id,
+        account_id,
+        item.parent_operation_id or None,
+        _to_ms(item.date),
+        _enum_name(item.type),
+        _enum_name(item.state),
+        item.name,
+        item.description,
+        item.instrument_uid or None,
+        item.figi or None,
+        item.instrument_type or None,
+        item.quantity,
+        to_nano(item.price) if item.price else None,
+        to_nano(item.payment) if item.payment else None,
+        to_nano(item.commission) if item.commission else None,
+        item.payment.currency if item.payment else None,
+    )
+
+
+class OperationsStore:
+    """Локальная история операций в SQLite с индексами по счету, инструменту и дате."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.path.join(data_dir(), "operations.sqlite3")
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.executescript(SCHEMA)
+
+    def upsert(self, rows: Iterable[tuple]) -> int:
+        rows = list(rows)
+        with self._lock, self._conn:
+            self._conn.executemany(INSERT_SQL, rows)
+        return len(rows)
+
+    def query(self, account_id: str, instrument_uid: Optional[str] = None,
+              since: Optional[datetime] = None, until: Optional[datetime] = None,
+              limit: Optional[int] = None) -> List[dict]:
+        """Операции счета по убыванию даты; фильтры идут по индексам."""
+        sql = "SELECT * FROM operations WHERE account_id = ?"
+        params: list = [account_id]
+        if instrument_uid:
+            sql += " AND instrument_uid = ?"
+            params.append(instrument_uid)
+        if since is not None:
+            sql += " AND date_ms >= ?"
+            params.append(_to_ms(since))
+        if until is not None:
+            sql += " AND date_ms < ?"
+            params.append(_to_ms(until))
+        sql += " ORDER BY date_ms DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params)]
+
+    def count(self, account_id: str) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM operations WHERE account_id = ?", (account_id,)
+            ).fetchone()[0]
+
+    def sync_state(self, account_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM sync_state WHERE account_id = ?", (account_id,)).fetchone()
+        return dict(row) if row else None
+
+    def save_page(self, account_id: str, rows: List[tuple], window_from_ms: int, window_to_ms: int,
+                  cursor: Optional[str], synced_until_ms: Optional[int]):
+        """Страница операций и позиция курсора сохраняются одной транзакцией,
+        поэтому прерванная синхронизация продолжается с той же страницы."""
+        with self._lock, self._conn:
+            self._conn.executemany(INSERT_SQL, rows)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sync_state (account_id, synced_until_ms, window_from_ms, window_to_ms, cursor) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (account_id, synced_until_ms, window_from_ms, window_to_ms, cursor),
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class OperationsSync:
+    """Фоновая догрузка истории операций через GetOperationsByCursor.
+
+    Первый запуск выкачивает историю с даты открытия счета, следующие -
+    только окно с момента прошлой синхронизации (с небольшим перекрытием).
+    Курсор сохраняется после каждой страницы.
+    """
+
+    def __init__(self, scheduler, store: OperationsStore):
+        self.scheduler = scheduler
+        self.store = store
+
+    def sync(self, token: CancellationToken, account_id: str, opened: Optional[datetime] = None,
+             on_page: Optional[Callable[[str, int], None]] = None) -> int:
+        """Синхронизирует счет. Возвращает число загруженных операций."""
+        state = self.store.sync_state(account_id) or {}
+        loaded = 0
+        # Незавершенное окно прошлого запуска дочитывается с сохраненного курсора
+        if state.get("cursor"):
+            loaded += self._sync_window(token, account_id, state["window_from_ms"], state["window_to_ms"],
+                                        state["cursor"], state.get("synced_until_ms"), on_page)
+            state = self.store.sync_state(account_id) or {}
+        if token.cancelled:
+            return loaded
+
+        if state.get("synced_until_ms"):
+            start = _from_ms(state["synced_until_ms"]) - SYNC_OVERLAP
+        elif opened is not None and _to_ms(opened) > _to_ms(HISTORY_START):
+            start = opened
+        else:
+            start = HISTORY_START
+        now = datetime.now(timezone.utc)
+        loaded += self._sync_window(token, account_id, _to_ms(start), _to_ms(now), "",
+                                    state.get("synced_until_ms"), on_page)
+        return loaded
+
+    def _sync_window(self, token: CancellationToken, account_id: str, from_ms: int, to_ms: int,
+                     cursor: str, synced_until_ms: Optional[int],
+                     on_page: Optional[Callable[[str, int], None]]) -> int:
+        loaded = 0
+        while not token.cancelled:
+            request = GetOperationsByCursorRequest(
+                account_id=account_id,
+                from_=_from_ms(from_ms),
+                to=_from_ms(to_ms),
+                cursor=cursor,
+                limit=PAGE_SIZE,
+            )
+            response = self.scheduler.submit(
+                "operations",
+                lambda client, request=request: client.operations.get_operations_by_cursor(request),
+                PRIORITY_BACKGROUND,
+            ).result()
+            rows = [operation_row(account_id, item) for item in response.items]
+            if response.has_next:
+                self.store.save_page(account_id, rows, from_ms, to_ms, response.next_cursor, synced_until_ms)
+            else:
+                # Окно дочитано: дальше синхронизируем только от его конца
+                self.store.save_page(account_id, rows, from_ms, to_ms, None, to_ms)
+            loaded += len(rows)
+            if on_page:
+                on_page(account_id, loaded)
+            if not response.has_next:
+                break
+            cursor = response.next_cursor
+        return loaded
+
+
+_store: Optional[OperationsStore] = None
+_store_lock = threading.Lock()
+
+
+def get_operations_store() -> OperationsStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = OperationsStore()
+        return _store
@@ -0,0 +1,133 @@
+# order_flow.py
+from array import array
+from typing import Dict, Optional, Sequence
+
+# Окна по умолчанию в секундах; None - вся сессия
+DEFAULT_WINDOWS = (10, 60, 300, None)
+
+BUY = 1
+SELL = 2
+
+_FIELDS = ("count", "volume", "buy", "sell", "notional")
+
+
+class _Window:
+    __slots__ = ("seconds", "tail", "count", "volume", "buy", "sell", "notional")
+
+    def __init__(self, seconds: Optional[int]):
+        self.seconds = seconds
+        self.tail: Optional[int] = None  # самая старая секунда, входящая в окно
+        self.count = 0
+        self.volume = 0
+        self.buy = 0
+        self.sell = 0
+        self.notional = 0.0
+
+
+class OrderFlowAggregator:
+    """Метрики потока сделок по нескольким скользящим окнам сразу.
+
+    Сделки суммируются в посекундные ячейки кольца длиной в наибольшее окно.
+    Каждое окно держит текущие суммы: новая сделка прибавляется ко всем окнам,
+    а секунды, выходящие из окна, вычитаются при сдвиге времени. Обновление
+    стоит O(1) на сделку (и амортизированно O(1) на прошедшую секунду).
+    """
+
+    def __init__(self, windows: Sequence[Optional[int]] = DEFAULT_WINDOWS):
+        self.windows = [_Window(seconds) for seconds in windows]
+        self.horizon = max((w for w in windows if w), default=1)
+        self._buckets = {
+            name: array("d" if name == "notional" else "q", bytes(8 * self.horizon)) for name in _FIELDS
+        }
+        self._head: Optional[int] = None
+        self._first_ts: Optional[float] = None
+        self._last_ts: Optional[float] = None
+
+    def clear(self):
+        self.__init__([w.seconds for w in self.windows])
+
+    def _advance(self, second: int):
+        if self._head is None:
+            self._head = second
+            # Окно сразу покрывает свою длину назад: запоздавшая сделка старше первой в него попадет
+            for window in self.windows:
+                window.tail = second - window.seconds + 1 if window.seconds is not None else None
+            return
+        if second <= self._head:
+            return
+        # Освобождаемые ячейки кольца сначала вычитаются из окон, затем обнуляются
+        for window in self.windows:
+            if window.seconds is None:
+                continue
+            new_tail = second - window.seconds + 1
+            start = max(window.tail, self._head - self.horizon + 1)
+            for s in range(start, min(new_tail, self._head + 1)):
+                self._apply(window, s % self.horizon, -1)
+            window.tail = max(window.tail, new_tail)
+        for s in range(max(self._head + 1, second - self.horizon + 1), second + 1):
+            slot = s % self.horizon
+            for name in _FIELDS:
+                self._buckets[name][slot] = 0
+        self._head = second
+
+    def _apply(self, window: _Window, slot: int, sign: int):
+        buckets = self._buckets
+        window.count += sign * buckets["count"][slot]
+        window.volume += sign * buckets["volume"][slot]
+        window.buy += sign * buckets["buy"][slot]
+        window.sell += sign * buckets["sell"][slot]
+        window.notional += sign * buckets["notional"][slot]
+
+    def advance(self, ts: float):
+        """Сдвигает окна к моменту ts без новых сделок."""
+        self._advance(int(ts))
+
+    def add(self, ts: float, price: float, quantity: int, direction: int):
+        """Учитывает сделку: ts - секунды эпохи, direction - значение TradeDirection."""
+        second = int(ts)
+        self._advance(second)
+        self._first_ts = ts if self._first_ts is None else min(self._first_ts, ts)
+        self._last_ts = ts if self._last_ts is None else max(self._last_ts, ts)
+        notional = price * quantity
+        buy = quantity if direction == BUY else 0
+        sell = quantity if direction == SELL else 0
+        if second > self._head - self.horizon:
+            slot = second % self.horizon
+            buckets = self._buckets
+            buckets["count"][slot] += 1
+            buckets["volume"][slot] += quantity
+            buckets["buy"][slot] += buy
+            buckets["sell"][slot] += sell
+            buckets["notional"][slot] += notional
+        for window in self.windows:
+            # Запоздавшая сделка попадает только в окна, которые ее еще покрывают
+            if window.seconds is not None and second < window.tail:
+                continue
+            window.count += 1
+            window.volume += quantity
+            window.buy += buy
+            window.sell += sell
+            window.notional += notional
+
+    def metrics(self, now: Optional[float] = None) -> Dict[Optional[int], dict]:
+        """Метрики по окнам: VWAP, дельта объема, соотношение покупок/продаж, средний размер, сделок/с."""
+        if now is not None:
+            self.advance(now)
+        result = {}
+        for window in self.windows:
+            if window.seconds is not None:
+                duration = window.seconds
+            elif self._first_ts is not None:
+                duration = max((now or self._last_ts) - self._first_ts, 1.0)
+            else:
+                duration = 1.0
+            result[window.seconds] = {
+                'trades': window.count,
+                'volume': window.volume,
+                'vwap': window.notional / window.volume if window.volume else None,
+                'delta': window.buy - window.sell,
+                'buy_sell_ratio': window.buy / window.sell if window.sell else None,
+                'avg_size': window.volume / window.count if window.count else None,
+                'rate': window.count / duration,
+            }
+        return result
@@ -0,0 +1,215 @@
+# portfolio_analytics.py
+from array import array
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from money import NANO, div_nano, mul_nano, to_nano
+
+# Валюта, в которой считаются итоги и веса
+BASE_CURRENCY = "rub"
+
+
+class PortfolioBook:
+    """Позиции портфеля в столбцах точных чисел (нано-единицы в array('q')).
+
+    Экспозиция по классам активов и валютам, нереализованный P&L и сумма
+    квадратов стоимостей (для индекса концентрации) поддерживаются как
+    агрегаты: при изменении цены или количества из них вычитается вклад
+    одной строки и добавляется новый, без прохода по всему портфелю.
+    Полный проход recompute() нужен только при смене курсов валют.
+    """
+
+    def __init__(self, fx_rates: Optional[Mapping[str, int]] = None):
+        self.uids: List[str] = []
+        self.instrument_types: List[str] = []
+        self.currencies: List[str] = []
+        self.quantity = array("q")
+        self.average_price = array("q")
+        self.price = array("q")
+        # Вклад строки в базовой валюте; None - нет курса для валюты инструмента
+        self._value: List[Optional[int]] = []
+        self._pnl: List[Optional[int]] = []
+        self._rows: Dict[str, int] = {}
+        self.fx_rates: Dict[str, int] = {BASE_CURRENCY: NANO}
+        if fx_rates:
+            self.fx_rates.update(fx_rates)
+        self._reset_totals()
+
+    def _reset_totals(self):
+        self.total = 0
+        self.pnl = 0
+        self.by_class: Dict[str, int] = {}
+        self.by_currency: Dict[str, int] = {}  # в валюте инструмента
+        self._sum_sq = 0
+
+    def __len__(self) -> int:
+        return len(self.uids)
+
+    def __contains__(self, uid: str) -> bool:
+        return uid in self._rows
+
+    # --- Изменение строк ---
+
+    def upsert(self, uid: str, instrument_type: str, currency: str,
+               quantity: int, average_price: int, price: int):
+        """Добавляет или заменяет позицию. Значения в нано-единицах."""
+        row = self._rows.get(uid)
+        if row is None:
+            row = self._rows[uid] = len(self.uids)
+            self.uids.append(uid)
+            self.instrument_types.append(instrument_type)
+            self.currencies.append(currency)
+            self.quantity.append(quantity)
+            self.average_price.append(average_price)
+            self.price.append(price)
+            self._value.append(None)
+            self._pnl.append(None)
+        else:
+            self._apply(row, -1)
+            self.instrument_types[row] = instrument_type
+            self.currencies[row] = currency
+            self.quantity[row] = quantity
+            self.average_price[row] = average_price
+            self.price[row] = price
+        self._evaluate(row)
+        self._apply(row, 1)
+
+    def set_price(self, uid: str, price: int) -> bool:
+        return self._set(uid, self.price, price)
+
+    def set_quantity(self, uid: str, quantity: int) -> bool:
+        return self._set(uid, self.quantity, quantity)
+
+    def _set(self, uid: str, column: array, value: int) -> bool:
+        row = self._rows.get(uid)
+        if row is None or column[row] == value:
+            return False
+        self._apply(row, -1)
+        column[row] = value
+        self._evaluate(row)
+        self._apply(row, 1)
+        return True
+
+    def remove(self, uid: str):
+        """Удаляет позицию: на ее место переносится последняя строка."""
+        row = self._rows.pop(uid, None)
+        if row is None:
+            return
+        self._apply(row, -1)
+        last = len(self.uids) - 1
+        if row != last:
+            for column in self._columns():
+                column[row] = column[last]
+            self._rows[self.uids[row]] = row
+        for column in self._columns():
+            column.pop()
+
+    def sync(self, positions: Mapping[str, dict]):
+        """Приводит книгу к набору позиций счета; пересчитываются только изменившиеся строки.
+
+        positions: instrument_uid -> {'instrument_type', 'currency', 'quantity',
+        'average_price', 'current_price'} (Decimal или Quotation).
+        """
+        for uid in [uid for uid in self.uids if uid not in positions]:
+            self.remove(uid)
+        for uid, position in positions.items():
+            values = (
+                position.get('instrument_type', ""),
+                position['currency'],
+                to_nano(position['quantity']),
+                to_nano(position['average_price']),
+                to_nano(position['current_price']) if position['current_price'] is not None
+                else to_nano(position['average_price']),
+            )
+            row = self._rows.get(uid)
+            if row is not None and values == (
+                self.instrument_types[row], self.currencies[row],
+                self.quantity[row], self.average_price[row], self.price[row],
+            ):
+                continue
+            self.upsert(uid, *values)
+
+    def set_fx_rates(self, fx_rates: Mapping[str, int]):
+        """Курсы валют к базовой (нано-единицы за единицу валюты). Пересчитывает всю книгу."""
+        rates = {BASE_CURRENCY: NANO}
+        rates.update(fx_rates)
+        if rates != self.fx_rates:
+            self.fx_rates = rates
+            self.recompute()
+
+    def recompute(self):
+        """Полный пересчет агрегатов за один проход по столбцам."""
+        self._reset_totals()
+        for row in range(len(self.uids)):
+            self._evaluate(row)
+            self._apply(row, 1)
+
+    def _columns(self):
+        return (self.uids, self.instrument_types, self.currencies,
+                self.quantity, self.average_price, self.price, self._value, self._pnl)
+
+    def _evaluate(self, row: int):
+        rate = self.fx_rates.get(self.currencies[row])
+        if rate is None:
+            self._value[row] = self._pnl[row] = None
+            return
+        quantity = self.quantity[row]
+        price = self.price[row]
+        self._value[row] = mul_nano(mul_nano(quantity, price), rate)
+        self._pnl[row] = mul_nano(mul_nano(quantity, price - self.average_price[row]), rate)
+
+    def _apply(self, row: int, sign: int):
+        currency = self.currencies[row]
+        native = mul_nano(self.quantity[row], self.price[row])
+        self.by_currency[currency] = self.by_currency.get(currency, 0) + sign * native
+        value = self._value[row]
+        if value is None:
+            return
+        instrument_type = self.instrument_types[row]
+        self.by_class[instrument_type] = self.by_class.get(instrument_type, 0) + sign * value
+        self.total += sign * value
+        self.pnl += sign * self._pnl[row]
+        self._sum_sq += sign * value * value
+
+    # --- Результаты ---
+
+    def value(self, uid: str) -> Optional[int]:
+        row = self._rows.get(uid)
+        return self._value[row] if row is not None else None
+
+    def weights(self) -> Dict[str, int]:
+        """Доли позиций в портфеле (нано-единицы, NANO = 100%)."""
+        if not self.total:
+            return {}
+        return {
+            uid: div_nano(value, self.total)
+            for uid, value in zip(self.uids, self._value)
+            if value is not None
+        }
+
+    def concentration(self) -> Tuple[int, Optional[str], int]:
+        """Индекс Херфиндаля (сумма квадратов долей) и самая крупная позиция с ее долей."""
+        if not self.total:
+            return 0, None, 0
+        hhi = div_nano(self._sum_sq, self.total * self.total) if self._sum_sq else 0
+        top_uid, top_value = None, 0
+        for uid, value in zip(self.uids, self._value):
+            if value is not None and abs(value) > abs(top_value):
+                top_uid, top_value = uid, value
+        return hhi, top_uid, div_nano(top_value, self.total)
+
+    def unpriced_currencies(self) -> List[str]:
+        """Валюты позиций без курса: они есть в by_currency, но не в итогах и весах."""
+        return sorted({c for c in self.currencies if c not in self.fx_rates})
+
+    def summary(self) -> dict:
+        hhi, top_uid, top_weight = self.concentration()
+        return {
+            'total': self.total,
+            'pnl': self.pnl,
+            'by_class': {k: v for k, v in self.by_class.items() if v},
+            'by_currency': {k: v for k, v in self.by_currency.items() if v},
+            'hhi': hhi,
+            'top_uid': top_uid,
+            'top_weight': top_weight,
+            'unpriced_currencies': self.unpriced_currencies(),
+        }
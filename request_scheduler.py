@@ -0,0 +1,289 @@
+# request_scheduler.py
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import grpc
+
+from session_pool import error_code, get_pool
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+# Лимиты unary-запросов T-Invest API на один токен (запросов в минуту)
+SERVICE_LIMITS = {
+    "users": 100,
+    "instruments": 200,
+    "market_data": 600,
+    "operations": 200,
+}
+
+# Доля бюджета, которую фоновые запросы не трогают: резерв под действия пользователя
+INTERACTIVE_RESERVE = 0.2
+
+# Сколько раз повторять запрос, упершийся в RESOURCE_EXHAUSTED
+MAX_RATE_LIMIT_RETRIES = 3
+
+# Максимум инструментов в одном GetLastPrices
+LAST_PRICES_BATCH_SIZE = 1000
+
+
+class TokenBucket:
+    """Токен-бакет с пополнением по лимиту "запросов в минуту"."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.refill_rate = per_minute / 60.0
+        self.blocked_until = 0.0
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_rate)
+        self.updated = now
+
+    def try_acquire(self, reserve: float = 0.0) -> float:
+        """Забирает токен. Возвращает 0 при успехе или сколько секунд ждать."""
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        floor = self.capacity * reserve
+        if self.tokens - 1 >= floor:
+            self.tokens -= 1
+            return 0.0
+        return (floor + 1 - self.tokens) / self.refill_rate
+
+    def drain(self, seconds: float):
+        """Обнуляет бюджет до сброса лимита на стороне сервера."""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens = 0.0
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+
+class _Request:
+    __slots__ = ("service", "fn", "priority", "key", "future", "retries", "price_batch", "waiters")
+
+    def __init__(self, service, fn, priority, key=None, price_batch=False):
+        self.service = service
+        self.fn = fn
+        self.priority = priority
+        self.key = key
+        self.future = Future()
+        self.retries = 0
+        self.price_batch = price_batch
+        self.waiters: List[tuple] = []  # склеенный GetLastPrices: (future, uids), забранные при отправке
+
+
+class RequestScheduler:
+    """Единая очередь unary-запросов к API.
+
+    Держит токен-бакеты по сервисам, обслуживает интерактивные запросы раньше
+    фоновых и склеивает GetLastPrices по многим инструментам в один вызов.
+    Фоновые запросы с одинаковым ключом не копятся: новый заменяет ожидающий,
+    поэтому при исчерпании бюджета фоновые обновления просто становятся реже.
+    """
+
+    def __init__(self, token: str, limits: Optional[Dict[str, int]] = None, max_workers: int = 4):
+        self.token = token
+        self._pool = get_pool(token)
+        limits = dict(SERVICE_LIMITS, **(limits or {}))
+        self._buckets = {service: TokenBucket(rate) for service, rate in limits.items()}
+        self._lanes = {PRIORITY_INTERACTIVE: deque(), PRIORITY_BACKGROUND: deque()}
+        self._keyed: Dict[Any, _Request] = {}
+        self._price_waiters: List[tuple] = []  # (future, uids)
+        self._price_request: Optional[_Request] = None
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="api")
+        self._running = True
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="api-scheduler")
+        self._dispatcher.start()
+
+    def submit(self, service: str, fn: Callable[[Any], Any],
+               priority: int = PRIORITY_BACKGROUND, key: Any = None) -> Future:
+        """Ставит запрос в очередь. fn получает services клиента и делает один вызов."""
+        with self._cond:
+            if key is not None and key in self._keyed:
+                pending = self._keyed[key]
+                pending.fn = fn
+                if priority < pending.priority:
+                    self._lanes[pending.priority].remove(pending)
+                    pending.priority = priority
+                    self._lanes[priority].append(pending)
+                return pending.future
+            request = _Request(service, fn, priority, key)
+            if key is not None:
+                self._keyed[key] = request
+            self._lanes[priority].append(request)
+            self._cond.notify()
+            return request.future
+
+    def call(self, service: str, fn: Callable[[Any], Any],
+             priority: int = PRIORITY_INTERACTIVE, timeout: Optional[float] = None) -> Any:
+        """Блокирующий вариант submit."""
+        return self.submit(service, fn, priority).result(timeout)
+
+    def get_last_prices(self, uids: Iterable[str], priority: int = PRIORITY_BACKGROUND) -> Future:
+        """Последние цены по списку UID. Future возвращает {uid: LastPrice}.
+
+        Все вызовы до отправки запроса объединяются в один GetLastPrices.
+        Пока _price_request задан, он лежит в очереди: диспетчер сбрасывает
+        его под той же блокировкой, под которой вынимает из очереди.
+        """
+        uids = list(uids)
+        future = Future()
+        with self._cond:
+            self._price_waiters.append((future, uids))
+            request = self._price_request
+            if request is None:
+                request = _Request("market_data", None, priority, price_batch=True)
+                request.fn = partial(self._fetch_last_prices, request)
+                self._price_request = request
+                self._lanes[priority].append(request)
+                self._cond.notify()
+            elif priority < request.priority:
+                self._lanes[request.priority].remove(request)
+                request.priority = priority
+                self._lanes[priority].append(request)
+                self._cond.notify()
+        return future
+
+    def _fetch_last_prices(self, request: _Request, client):
+        """Ошибки не перехватываются: их для всех ожидающих разбирает _execute."""
+        wanted = sorted({uid for _, uids in request.waiters for uid in uids})
+        prices = {}
+        for start in range(0, len(wanted), LAST_PRICES_BATCH_SIZE):
+            response = client.market_data.get_last_prices(
+                instrument_id=wanted[start:start + LAST_PRICES_BATCH_SIZE]
+            )
+            for last_price in response.last_prices:
+                prices[last_price.instrument_uid] = last_price
+        for future, uids in request.waiters:
+            if not future.done():
+                future.set_result({uid: prices[uid] for uid in uids if uid in prices})
+        return None
+
+    def _dispatch_loop(self):
+        while True:
+            with self._cond:
+                request = None
+                while self._running:
+                    request, wait = self._pick_request()
+                    if request is not None:
+                        break
+                    self._cond.wait(wait)
+                if not self._running:
+                    return
+                if request.key is not None:
+                    self._keyed.pop(request.key, None)
+                if request.price_batch:
+                    # Ожидающие уходят с этим запросом, новые вызовы собирают следующий
+                    request.waiters.extend(self._price_waiters)
+                    self._price_waiters = []
+                    self._price_request = None
+            self._executor.submit(self._execute, request)
+
+    def _pick_request(self):
+        """Первый запрос, на который хватает бюджета, и время ожидания иначе."""
+        min_wait = None
+        for priority in (PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND):
+            reserve = 0.0 if priority == PRIORITY_INTERACTIVE else INTERACTIVE_RESERVE
+            lane = self._lanes[priority]
+            blocked = set()
+            for request in lane:
+                if request.service in blocked:
+                    continue
+                bucket = self._buckets.get(request.service)
+                wait = bucket.try_acquire(reserve) if bucket else 0.0
+                if wait == 0.0:
+                    lane.remove(request)
+                    return request, None
+                blocked.add(request.service)
+                min_wait = wait if min_wait is None else min(min_wait, wait)
+        return None, min_wait
+
+    def _execute(self, request: _Request):
+        if request.future.cancelled():
+            return
+        try:
+            with self._pool.session() as client:
+                result = request.fn(client)
+        except Exception as e:
+            # Склеенный GetLastPrices повторяем без ограничения: его ждут другие запросы
+            if is_rate_limited(e) and (request.price_batch or request.retries < MAX_RATE_LIMIT_RETRIES):
+                self._requeue_rate_limited(request, e)
+                return
+            # Любая другая ошибка (в том числе при получении канала) достается всем ожидающим
+            for future, _ in request.waiters:
+                if not future.done():
+                    future.set_exception(e)
+            request.waiters = []
+            if not request.future.done():
+                request.future.set_exception(e)
+            return
+        if not request.future.done():
+            request.future.set_result(result)
+
+    def _requeue_rate_limited(self, request: _Request, error: Exception):
+        reset = _ratelimit_reset(error)
+        logger.warning(f"Rate limit for {request.service}, retry in {reset:.1f}s")
+        with self._cond:
+            bucket = self._buckets.get(request.service)
+            if bucket:
+                bucket.drain(reset)
+            request.retries += 1
+            if not request.price_batch:
+                self._lanes[request.priority].appendleft(request)
+            else:
+                # Ожидающие возвращаются в начало общего списка; если за это время уже
+                # собран новый запрос, он заберет и их, иначе в очередь встает этот же
+                self._price_waiters[:0] = request.waiters
+                request.waiters = []
+                if self._price_request is None:
+                    self._price_request = request
+                    self._lanes[request.priority].appendleft(request)
+                elif request.priority < self._price_request.priority:
+                    pending = self._price_request
+                    self._lanes[pending.priority].remove(pending)
+                    pending.priority = request.priority
+                    self._lanes[pending.priority].appendleft(pending)
+            self._cond.notify()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            pending = [r for lane in self._lanes.values() for r in lane]
+            for lane in self._lanes.values():
+                lane.clear()
+            self._keyed.clear()
+            waiters = self._price_waiters + [w for r in pending if r.price_batch for w in r.waiters]
+            self._price_waiters = []
+            self._price_request = None
+            self._cond.notify_all()
+        for request in pending:
+            request.future.cancel()
+        for future, _ in waiters:
+            future.cancel()
+        self._dispatcher.join()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+def is_rate_limited(error: Exception) -> bool:
+    return error_code(error) == grpc.StatusCode.RESOURCE_EXHAUSTED
+
+
+def _ratelimit_reset(error: Exception) -> float:
+    """Секунды до сброса лимита из метаданных ответа (x-ratelimit-reset)."""
+    metadata = getattr(error, "metadata", None)
+    reset = getattr(metadata, "ratelimit_reset", None)
+    try:
+        return max(float(reset), 1.0)
+    except (TypeError, ValueError):
+        return 5.0
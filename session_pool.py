@@ -0,0 +1,215 @@
+# session_pool.py
+import asyncio
+import itertools
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, List, Optional
+
+import grpc
+from tinkoff.invest import AsyncClient, Client
+
+logger = logging.getLogger(__name__)
+
+# Keepalive для долгоживущих каналов: соединение не рвется прокси и NAT между запросами
+CHANNEL_OPTIONS = [
+    ("grpc.keepalive_time_ms", 30000),
+    ("grpc.keepalive_timeout_ms", 10000),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+]
+
+# Как часто проверять канал перед выдачей и сколько ждать его готовности
+HEALTH_CHECK_INTERVAL = 30.0
+HEALTH_CHECK_TIMEOUT = 5.0
+
+# Ошибки, после которых канал пересоздается
+RECONNECT_CODES = {grpc.StatusCode.UNAVAILABLE}
+
+
+def error_code(error: Exception) -> Optional[grpc.StatusCode]:
+    """gRPC-код ошибки SDK (RequestError/AioRequestError) или grpc.RpcError."""
+    code = getattr(error, "code", None)
+    if callable(code):
+        code = code()
+    return code if isinstance(code, grpc.StatusCode) else None
+
+
+class _SyncSession:
+    def __init__(self, token: str):
+        self._client = Client(token, options=CHANNEL_OPTIONS)
+        self.services = self._client.__enter__()
+        self.checked_at = time.monotonic()
+
+    def is_healthy(self) -> bool:
+        channel = getattr(self._client, "_channel", None)
+        if channel is None:
+            return True
+        try:
+            grpc.channel_ready_future(channel).result(timeout=HEALTH_CHECK_TIMEOUT)
+        except grpc.FutureTimeoutError:
+            return False
+        self.checked_at = time.monotonic()
+        return True
+
+    def close(self):
+        try:
+            self._client.__exit__(None, None, None)
+        except Exception as e:
+            logger.debug(f"Error closing channel: {e}")
+
+
+class _AsyncSession:
+    """Асинхронный клиент одного event loop со счетчиком пользователей."""
+
+    def __init__(self, client, services):
+        self.client = client
+        self.services = services
+        self.users = 0
+        self.retired = False  # заменен новым или пул закрывается: закрыть после последнего пользователя
+        self.closed = False
+
+    async def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            await self.client.__aexit__(None, None, None)
+        except Exception as e:
+            logger.debug(f"Error closing async channel: {e}")
+
+
+class SessionPool:
+    """Небольшой пул долгоживущих каналов к API для одного токена.
+
+    Синхронные каналы потокобезопасны и выдаются по кругу. Асинхронный канал
+    привязан к event loop, поэтому на каждый loop создается свой; его делят
+    все корутины loop (стрим рынка, стримы портфеля). После ошибки соединения
+    канал не закрывается под остальными: следующий вход получает новый, а
+    старый закрывает последний вышедший из него пользователь.
+    """
+
+    def __init__(self, token: str, size: int = 2):
+        self.token = token
+        self.size = size
+        self._sessions: List[Optional[_SyncSession]] = [None] * size
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+        self._async_sessions: Dict[asyncio.AbstractEventLoop, _AsyncSession] = {}
+        self._async_locks: Dict[asyncio.AbstractEventLoop, asyncio.Lock] = {}
+        self._closed = False
+
+    def _get_session(self, index: int) -> _SyncSession:
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Session pool is closed")
+            session = self._sessions[index]
+            if session is None:
+                session = self._sessions[index] = _SyncSession(self.token)
+                return session
+        if time.monotonic() - session.checked_at > HEALTH_CHECK_INTERVAL and not session.is_healthy():
+            logger.warning("Channel is not ready, reconnecting")
+            self._recycle(index, session)
+            return self._get_session(index)
+        return session
+
+    def _recycle(self, index: int, session: _SyncSession):
+        with self._lock:
+            if self._sessions[index] is session:
+                self._sessions[index] = None
+        session.close()
+
+    @contextmanager
+    def session(self):
+        """Отдает services клиента из пула: with pool.session() as client: ..."""
+        index = next(self._next) % self.size
+        session = self._get_session(index)
+        try:
+            yield session.services
+        except Exception as e:
+            if error_code(e) in RECONNECT_CODES:
+                self._recycle(index, session)
+            raise
+
+    @asynccontextmanager
+    async def async_session(self):
+        """Асинхронный клиент для текущего event loop: async with pool.async_session() as client: ..."""
+        loop = asyncio.get_running_loop()
+        lock = self._async_locks.get(loop)
+        if lock is None:
+            lock = self._async_locks[loop] = asyncio.Lock()
+        # Блокировка: пока первый вход ждет __aenter__, второй не создаст еще один клиент
+        async with lock:
+            entry = self._async_sessions.get(loop)
+            if entry is None:
+                if self._closed:
+                    raise RuntimeError("Session pool is closed")
+                client = AsyncClient(self.token, options=CHANNEL_OPTIONS)
+                entry = _AsyncSession(client, await client.__aenter__())
+                self._async_sessions[loop] = entry
+            entry.users += 1
+        try:
+            yield entry.services
+        except Exception as e:
+            if error_code(e) in RECONNECT_CODES:
+                self._retire_async(loop, entry)
+            raise
+        finally:
+            entry.users -= 1
+            if entry.retired and not entry.users:
+                await entry.close()
+
+    def _retire_async(self, loop: asyncio.AbstractEventLoop, entry: _AsyncSession):
+        """Убирает клиент из выдачи; закроет его последний пользователь."""
+        entry.retired = True
+        if self._async_sessions.get(loop) is entry:
+            del self._async_sessions[loop]
+
+    async def close_async(self):
+        """Закрывает асинхронный канал текущего event loop (сразу, если им никто не пользуется)."""
+        loop = asyncio.get_running_loop()
+        entry = self._async_sessions.get(loop)
+        if entry is not None:
+            self._retire_async(loop, entry)
+            if not entry.users:
+                await entry.close()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            sessions = [s for s in self._sessions if s is not None]
+            self._sessions = [None] * self.size
+        for session in sessions:
+            session.close()
+        # Асинхронные каналы закрываются в своих event loop
+        for loop, entry in list(self._async_sessions.items()):
+            entry.retired = True
+            if loop.is_running():
+                closing = asyncio.run_coroutine_threadsafe(entry.close(), loop)
+                try:
+                    closing.result(HEALTH_CHECK_TIMEOUT)
+                except Exception as e:
+                    logger.debug(f"Error closing async channel: {e}")
+        self._async_sessions.clear()
+
+
+_pools: Dict[str, SessionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(token: str) -> SessionPool:
+    """Общий пул каналов для токена."""
+    with _pools_lock:
+        pool = _pools.get(token)
+        if pool is None or pool._closed:
+            pool = _pools[token] = SessionPool(token)
+        return pool
+
+
+def close_all():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
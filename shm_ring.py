@@ -0,0 +1,88 @@
+# shm_ring.py
+import struct
+from multiprocessing import shared_memory
+from typing import List, Optional, Tuple
+
+# Заголовок: индекс записи и индекс чтения (uint64, выровнены по 8 байт)
+_HEADER = struct.Struct("QQ")
+_INDEX = struct.Struct("Q")
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    # Подключившийся процесс не владеет сегментом: resource_tracker не должен удалять его при выходе.
+    # До Python 3.13 отключить учет нельзя, но читатель запускается владельцем и делит с ним
+    # resource_tracker, так что повторная регистрация того же имени ничего не меняет
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedRing:
+    """Кольцевой буфер записей фиксированного размера в разделяемой памяти.
+
+    Один писатель и один читатель, без блокировок: писатель сначала кладет
+    запись в слот, затем публикует новый индекс записи; читатель сдвигает
+    индекс чтения только после того, как забрал записи. Индексы - выровненные
+    8-байтовые слова, которые обновляются одной записью. Если читатель отстал
+    и буфер полон, новая запись отбрасывается (push возвращает False).
+    """
+
+    def __init__(self, record: struct.Struct, capacity: int, name: Optional[str] = None, create: bool = True):
+        self.record = record
+        self.capacity = capacity
+        size = _HEADER.size + record.size * capacity
+        if create:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            _HEADER.pack_into(self._shm.buf, 0, 0, 0)
+        else:
+            self._shm = _attach(name)
+        self._owner = create
+        self.dropped = 0  # счетчик писателя: записи, не поместившиеся в буфер
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    @classmethod
+    def attach(cls, record: struct.Struct, capacity: int, name: str) -> "SharedRing":
+        return cls(record, capacity, name=name, create=False)
+
+    def _indexes(self) -> Tuple[int, int]:
+        return _HEADER.unpack_from(self._shm.buf, 0)
+
+    def push(self, *values) -> bool:
+        buf = self._shm.buf
+        write, read = _HEADER.unpack_from(buf, 0)
+        if write - read >= self.capacity:
+            self.dropped += 1
+            return False
+        self.record.pack_into(buf, _HEADER.size + (write % self.capacity) * self.record.size, *values)
+        _INDEX.pack_into(buf, 0, write + 1)
+        return True
+
+    def pop_all(self, limit: Optional[int] = None) -> List[tuple]:
+        """Забирает накопившиеся записи (не больше limit) в порядке записи."""
+        buf = self._shm.buf
+        write, read = _HEADER.unpack_from(buf, 0)
+        if limit is not None:
+            write = min(write, read + limit)
+        record = self.record
+        records = [
+            record.unpack_from(buf, _HEADER.size + (index % self.capacity) * record.size)
+            for index in range(read, write)
+        ]
+        _INDEX.pack_into(buf, _INDEX.size, write)
+        return records
+
+    def __len__(self) -> int:
+        write, read = self._indexes()
+        return write - read
+
+    def close(self):
+        self._shm.close()
+        if self._owner:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
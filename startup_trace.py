@@ -0,0 +1,107 @@
+# startup_trace.py
+import importlib.abc
+import logging
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Трассировка включается переменной окружения или флагом командной строки
+ENV_FLAG = "T_INVEST_STARTUP_TRACE"
+ARG_FLAG = "--startup-trace"
+
+# Сколько самых долгих импортов показывать
+TOP_IMPORTS = 25
+
+_started = time.perf_counter()
+_marks: List[Tuple[str, float]] = []
+_imports: Dict[str, List[float]] = {}  # модуль -> [суммарное время, собственное время]
+_stack: List[List[float]] = []  # время вложенных импортов текущего импорта
+_finder: Optional["_TimingFinder"] = None
+
+
+def enabled() -> bool:
+    return bool(os.environ.get(ENV_FLAG)) or ARG_FLAG in sys.argv
+
+
+def mark(label: str):
+    """Отметка времени от старта процесса (точнее - от импорта этого модуля)."""
+    if _finder is not None:
+        _marks.append((label, time.perf_counter() - _started))
+
+
+class _TimingLoader(importlib.abc.Loader):
+    def __init__(self, name: str, loader):
+        self._name = name
+        self._loader = loader
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        _stack.append([0.0])
+        started = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            total = time.perf_counter() - started
+            children = _stack.pop()[0]
+            _imports[self._name] = [total, total - children]
+            if _stack:
+                _stack[-1][0] += total
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+class _TimingFinder(importlib.abc.MetaPathFinder):
+    """Оборачивает загрузчики остальных finder'ов и меряет exec_module, как -X importtime."""
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimingLoader(fullname, spec.loader)
+                return spec
+        return None
+
+
+def install():
+    """Начинает трассировку, если она включена. Вызывается до остальных импортов приложения."""
+    global _finder
+    if _finder is not None or not enabled():
+        return
+    _finder = _TimingFinder()
+    sys.meta_path.insert(0, _finder)
+    mark("trace installed")
+
+
+def report() -> str:
+    lines = [f"Startup trace ({len(_imports)} modules imported while tracing)"]
+    for label, seconds in _marks:
+        lines.append(f"  {seconds * 1000:9.1f} ms  {label}")
+    lines.append("  cumulative ms      self ms  module")
+    top = sorted(_imports.items(), key=lambda item: -item[1][0])[:TOP_IMPORTS]
+    for name, (total, own) in top:
+        lines.append(f"  {total * 1000:13.1f} {own * 1000:12.1f}  {name}")
+    return "\n".join(lines)
+
+
+def finish(label: str = "first frame"):
+    """Последняя отметка (обычно первый кадр окна): снимает перехват импортов и пишет отчет."""
+    global _finder
+    if _finder is None:
+        return
+    mark(label)
+    try:
+        sys.meta_path.remove(_finder)
+    except ValueError:
+        pass
+    _finder = None
+    text = report()
+    logger.info(text)
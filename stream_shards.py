@@ -0,0 +1,184 @@
+# stream_shards.py
+import asyncio
+import logging
+import multiprocessing
+import queue
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+from market_events import ORDER_BOOK_DEPTH, MarketEvent, decode_response, subscription_requests
+
+logger = logging.getLogger(__name__)
+
+# Шард копит события и отправляет их пачкой: не реже чем раз в SHARD_FLUSH_INTERVAL секунд
+SHARD_FLUSH_INTERVAL = 0.02
+SHARD_BATCH_SIZE = 256
+
+# Как часто шард отчитывается о пропускной способности, секунды
+METRICS_INTERVAL = 1.0
+
+
+def split_instruments(instruments: Sequence[str], shards: int) -> List[List[str]]:
+    """Раскладывает инструменты по шардам по кругу; пустых шардов не бывает."""
+    shards = max(1, min(shards, len(instruments)))
+    return [list(instruments[index::shards]) for index in range(shards)]
+
+
+async def _stream_shard(shard: int, token: str, instruments: List[str], depth: int, events, stop):
+    from session_pool import get_pool
+
+    batch: List[MarketEvent] = []
+    counters = {"messages": 0, "events": 0, "errors": 0, "decode_seconds": 0.0}
+    window = dict(counters, start=time.monotonic())  # значения счетчиков на начало окна метрик
+
+    def flush():
+        if batch:
+            events.put(("events", shard, time.time(), batch[:]))
+            batch.clear()
+
+    def report():
+        now = time.monotonic()
+        elapsed = max(now - window["start"], 1e-9)
+        messages = counters["messages"] - window["messages"]
+        events.put(("metrics", shard, {
+            "shard": shard,
+            "instruments": len(instruments),
+            "messages": counters["messages"],
+            "events": counters["events"],
+            "errors": counters["errors"],
+            "messages_per_second": messages / elapsed,
+            "events_per_second": (counters["events"] - window["events"]) / elapsed,
+            "decode_us": (counters["decode_seconds"] - window["decode_seconds"]) / messages * 1e6 if messages else 0.0,
+        }))
+        window.update(counters, start=now)
+
+    async def flush_loop():
+        while True:
+            await asyncio.sleep(SHARD_FLUSH_INTERVAL)
+            flush()
+            if time.monotonic() - window["start"] >= METRICS_INTERVAL:
+                report()
+
+    async def request_iterator():
+        for request in subscription_requests(instruments, depth):
+            yield request
+        while not stop.is_set():
+            await asyncio.sleep(0.1)
+
+    flusher = asyncio.create_task(flush_loop())
+    pool = get_pool(token)
+    try:
+        async with pool.async_session() as client:
+            async for response in client.market_data_stream.market_data_stream(request_iterator()):
+                if stop.is_set():
+                    break
+                started = time.perf_counter()
+                try:
+                    data = decode_response(response)
+                except Exception as e:
+                    counters["errors"] += 1
+                    logger.error(f"Shard {shard}: error decoding market data: {e}")
+                    continue
+                counters["decode_seconds"] += time.perf_counter() - started
+                counters["messages"] += 1
+                if data:
+                    counters["events"] += 1
+                    batch.append(data)
+                    if len(batch) >= SHARD_BATCH_SIZE:
+                        flush()
+    finally:
+        flusher.cancel()
+        flush()
+        report()
+        await pool.close_async()
+
+
+def run_shard(shard: int, token: str, instruments: List[str], depth: int, events, stop):
+    """Точка входа процесса шарда: свой стрим, свой event loop и свой декодер."""
+    try:
+        asyncio.run(_stream_shard(shard, token, instruments, depth, events, stop))
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        events.put(("error", shard, f"Shard {shard} stream error: {e}"))
+    finally:
+        events.put(("stopped", shard, None))
+
+
+class ShardedIngestion:
+    """Прием рыночных данных в N процессах с общей очередью событий.
+
+    Инструменты раскладываются по шардам, каждый шард - отдельный процесс со
+    своим стримом и декодированием. События (MarketEvent) приходят пачками
+    в одну очередь; порядок событий одного инструмента сохраняется, так как
+    инструмент принадлежит одному шарду. Пачки и метрики шардов отдаются
+    колбэкам из потока пула задач.
+    """
+
+    def __init__(self, token: str, instruments: Sequence[str], shards: int, depth: int = ORDER_BOOK_DEPTH):
+        self.token = token
+        self.depth = depth
+        self.assignment = split_instruments(list(instruments), shards)
+        self.metrics: Dict[int, dict] = {}
+        self._context = multiprocessing.get_context("spawn")
+        self._events = self._context.Queue()
+        self._stop = self._context.Event()
+        self._processes = []
+        self._reader = None
+
+    def start(self, on_events: Callable[[List[MarketEvent]], None],
+              on_metrics: Optional[Callable[[dict], None]] = None,
+              on_error: Optional[Callable[[str], None]] = None):
+        from workers import get_worker_pool
+
+        for shard, instruments in enumerate(self.assignment):
+            process = self._context.Process(
+                target=run_shard,
+                args=(shard, self.token, instruments, self.depth, self._events, self._stop),
+                name=f"ingest-{shard}",
+                daemon=True,
+            )
+            process.start()
+            self._processes.append(process)
+        self._reader = get_worker_pool().spawn(
+            self._read_events, on_events, on_metrics, on_error, name="ingest reader"
+        )
+
+    def _read_events(self, token, on_events, on_metrics, on_error):
+        running = len(self._processes)
+        lag: Dict[int, float] = {}
+        while running and not token.cancelled:
+            try:
+                kind, shard, *payload = self._events.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            if kind == "events":
+                sent, batch = payload
+                # Задержка доставки пачки из процесса шарда (сглаженная)
+                delay = (time.time() - sent) * 1000
+                lag[shard] = delay if shard not in lag else lag[shard] * 0.9 + delay * 0.1
+                on_events(batch)
+            elif kind == "metrics":
+                metrics = payload[0]
+                metrics["lag_ms"] = lag.get(shard, 0.0)
+                self.metrics[shard] = metrics
+                if on_metrics:
+                    on_metrics(metrics)
+            elif kind == "error":
+                logger.error(payload[0])
+                if on_error:
+                    on_error(payload[0])
+            elif kind == "stopped":
+                running -= 1
+
+    def stop(self, timeout: float = 2.0):
+        self._stop.set()
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join(timeout)
+        self._processes = []
+        if self._reader is not None:
+            self._reader.cancel()
+            self._reader = None
@@ -0,0 +1,98 @@
+# tests/test_bar_builder.py
+from bar_builder import BUY, SELL, BarBuilder
+
+
+def _rows(builder, interval=60):
+    return [(bar.start, bar.open, bar.high, bar.low, bar.close, bar.volume)
+            for bar in builder.bars("x", interval)]
+
+
+def test_trades_close_bars_in_order():
+    builder = BarBuilder(intervals=(60,))
+    builder.add_trade("x", 10, 100, 1, BUY)
+    builder.add_trade("x", 30, 102, 2, SELL)
+    closed = builder.add_trade("x", 65, 101, 3, BUY)
+    assert [(interval, bar.start) for interval, bar in closed] == [(60, 0)]
+    assert _rows(builder) == [(0, 100, 102, 100, 102, 3), (60, 101, 101, 101, 101, 3)]
+
+
+def test_late_trade_after_advance_joins_closed_bar():
+    builder = BarBuilder(intervals=(60,))
+    builder.add_trade("x", 10, 100, 1, BUY)
+    builder.advance("x", 61)
+    builder.add_trade("x", 59, 101, 5, BUY)
+    # Новый бар с тем же началом не появляется, цена закрытия не меняется
+    assert _rows(builder) == [(0, 100, 101, 100, 100, 6)]
+    builder.add_trade("x", 70, 103, 1, SELL)
+    assert _rows(builder) == [(0, 100, 101, 100, 100, 6), (60, 103, 103, 103, 103, 1)]
+
+
+def test_late_trade_before_current_bar():
+    builder = BarBuilder(intervals=(60,))
+    builder.add_trade("x", 10, 100, 1, BUY)
+    builder.add_trade("x", 70, 105, 1, BUY)
+    builder.add_trade("x", 50, 99, 2, SELL)
+    assert _rows(builder) == [(0, 100, 100, 99, 100, 3), (60, 105, 105, 105, 105, 1)]
+
+
+def test_advance_without_bars_is_noop():
+    builder = BarBuilder(intervals=(60,))
+    assert builder.advance("x", 100) == []
+    assert builder.bars("x", 60) == []
+
+
+def test_seed_builds_multiples_and_current_bar():
+    builder = BarBuilder(intervals=(60, 300))
+    builder.seed("x", [(0, 1, 2, 0.5, 1.5, 10), (60, 1.5, 3, 1, 2, 20), (300, 2, 2, 2, 2, 5)], 60)
+    assert _rows(builder) == [(0, 1, 2, 0.5, 1.5, 10), (60, 1.5, 3, 1, 2, 20), (300, 2, 2, 2, 2, 5)]
+    assert _rows(builder, 300) == [(0, 1, 3, 0.5, 2, 30), (300, 2, 2, 2, 2, 5)]
+    assert builder.current("x", 60).start == 300
+
+
+def test_seed_after_live_trades_keeps_newer_bars():
+    builder = BarBuilder(intervals=(60,))
+    builder.add_trade("x", 130, 10, 1, BUY)
+    builder.add_trade("x", 190, 11, 1, BUY)
+    # Свечи запроса заканчиваются раньше первых сделок стрима
+    builder.seed("x", [(0, 1, 1, 1, 1, 1), (60, 2, 2, 2, 2, 2)], 60)
+    assert [row[0] for row in _rows(builder)] == [0, 60, 120, 180]
+    assert builder.current("x", 60).start == 180
+
+
+def test_seed_after_advance_keeps_closed_live_bars():
+    builder = BarBuilder(intervals=(60,))
+    builder.add_trade("x", 130, 10, 1, BUY)
+    builder.advance("x", 200)
+    builder.seed("x", [(0, 1, 1, 1, 1, 1), (60, 2, 2, 2, 2, 2)], 60)
+    assert [row[0] for row in _rows(builder)] == [0, 60, 120]
+    builder.add_trade("x", 150, 12, 1, SELL)
+    assert [row[0] for row in _rows(builder)] == [0, 60, 120]
+
+
+def test_seed_replaces_bars_with_same_start():
+    builder = BarBuilder(intervals=(60,))
+    builder.add_trade("x", 70, 10, 1, BUY)
+    builder.seed("x", [(0, 1, 1, 1, 1, 1), (60, 2, 2, 2, 2, 2)], 60)
+    assert _rows(builder) == [(0, 1, 1, 1, 1, 1), (60, 2, 2, 2, 2, 2)]
+
+
+def test_partial_seed_merges_into_larger_bars():
+    builder = BarBuilder(intervals=(60, 300))
+    builder.seed("x", [(start, 1, 1, 1, 1, 10) for start in range(0, 300, 60)], 60)
+    assert _rows(builder, 300) == [(0, 1, 1, 1, 1, 50)]
+    # Досев только последней минуты меняет ее, остальные минуты пятиминутки остаются
+    builder.seed("x", [(240, 1, 2, 1, 2, 12)], 60)
+    assert _rows(builder, 300) == [(0, 1, 2, 1, 2, 52)]
+    assert [row[5] for row in _rows(builder)] == [10, 10, 10, 10, 12]
+
+
+def test_overlapping_seeds_and_live_trades():
+    builder = BarBuilder(intervals=(60, 300))
+    builder.seed("x", [(0, 1, 1, 1, 1, 10), (60, 1, 1, 1, 1, 10)], 60)
+    builder.add_trade("x", 130, 3, 5, BUY)
+    builder.seed("x", [(60, 1, 1, 1, 1, 11), (120, 1, 3, 1, 3, 6)], 60)
+    assert _rows(builder, 300) == [(0, 1, 3, 1, 3, 27)]
+    builder.add_trade("x", 310, 4, 1, SELL)
+    assert _rows(builder, 300) == [(0, 1, 3, 1, 3, 27), (300, 4, 4, 4, 4, 1)]
+    builder.seed("x", [(300, 4, 4, 4, 4, 2)], 60)
+    assert _rows(builder, 300) == [(0, 1, 3, 1, 3, 27), (300, 4, 4, 4, 4, 2)]
@@ -0,0 +1,41 @@
+from array import array
+
+from book_metrics import BookMetricsSeries, compute_metrics
+
+
+def book(bids, asks):
+    return (array("d", [p for p, _ in bids]), array("q", [q for _, q in bids]),
+            array("d", [p for p, _ in asks]), array("q", [q for _, q in asks]))
+
+
+def test_metrics_and_walls():
+    metrics = compute_metrics(*book([(99.0, 10), (98.0, 100), (97.0, 10)], [(101.0, 10), (102.0, 10)]),
+                              wall_factor=5)
+    assert metrics["mid"] == 100.0
+    assert metrics["spread"] == 2.0
+    assert list(metrics["bid_depth"]) == [10, 110, 120]
+    assert metrics["walls"] == [("bid", 98.0, 100)]
+
+
+def test_no_walls_on_flat_book():
+    metrics = compute_metrics(*book([(99.0, 10), (98.0, 10)], [(101.0, 10), (102.0, 10)]))
+    assert metrics["walls"] == []
+    assert metrics["imbalance"] == 0.0
+
+
+def test_empty_side():
+    assert compute_metrics(*book([], [(101.0, 10)])) is None
+
+
+def test_series_tail_and_downsample():
+    series = BookMetricsSeries(capacity=100)
+    for i in range(250):
+        series.append(1000 + i, {"mid": i, "spread": 1, "microprice": i, "imbalance": 0.5})
+    # В кольце остались последние 100 снимков
+    assert list(series.tail(0)["ts"]) == [float(ts) for ts in range(1150, 1250)]
+    assert list(series.tail(1240)["ts"]) == [float(ts) for ts in range(1240, 1250)]
+    sampled = series.downsample(1240, 5)
+    assert sampled["ts"] == [1240.0, 1245.0]
+    assert sampled["mid"] == [242.0, 247.0]
+    assert sampled["spread"] == [1.0, 1.0]
+    assert series.downsample(2000, 5)["ts"] == []
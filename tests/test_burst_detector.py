@@ -0,0 +1,82 @@
+# tests/test_burst_detector.py
+import json
+
+from burst_detector import MAX_IDLE_BUCKETS, MIN_SAMPLES, BurstDetector, BurstMonitor
+
+
+def read(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def warm_up(add, buckets=MIN_SAMPLES + 10):
+    """Ровный фон: 2-4 сделки по 1 лоту в каждом 10-секундном интервале."""
+    for bucket in range(buckets):
+        for i in range(2 + bucket % 3):
+            add(bucket * 10 + i, 1)
+    return buckets * 10
+
+
+def test_burst_needs_warm_baseline():
+    detector = BurstDetector()
+    for i in range(50):
+        assert not detector.add(i * 0.1, 10)
+    assert not detector.warm
+
+    end = warm_up(detector.add)
+    assert detector.warm
+    assert not detector.add(end, 1)
+    bursts = [detector.add(end + 1 + i * 0.1, 1) for i in range(20)]
+    assert bursts[-1]
+    assert detector.state()["trades_z"] >= detector.z_threshold
+
+
+def test_long_pause_is_not_learned_as_silence():
+    detector = BurstDetector()
+    end = warm_up(detector.add)
+    samples, mean = detector.samples, detector.trades.mean
+    detector.add(end + (MAX_IDLE_BUCKETS + 5) * 10, 1)
+    # Закрывается только последний интервал с торгами, пустые интервалы паузы пропущены
+    assert detector.samples == samples + 1
+    assert detector.trades.mean > mean / 2
+
+
+def test_baselines_survive_restart(tmp_path):
+    path = str(tmp_path / "burst_baselines.json")
+    monitor = BurstMonitor(path)
+    warm_up(lambda ts, q: monitor.add("uid", ts, q))
+    monitor.detector("idle")  # без закрытых интервалов не сохраняется
+    monitor.save()
+    saved = read(path)
+    assert list(saved) == ["uid"]
+    assert saved["uid"] == monitor.detector("uid").baseline()
+
+    restarted = BurstMonitor(path)
+    detector = restarted.detector("uid")
+    assert detector.warm
+    assert detector.baseline() == saved["uid"]
+    # Всплеск виден с первых секунд новой сессии, без повторного прогрева
+    bursts = [restarted.add("uid", 100000 + i * 0.1, 1) for i in range(20)]
+    assert bursts[-1]
+
+
+def test_save_keeps_baselines_of_unused_instruments(tmp_path):
+    path = str(tmp_path / "burst_baselines.json")
+    monitor = BurstMonitor(path)
+    warm_up(lambda ts, q: monitor.add("a", ts, q))
+    monitor.save()
+    restarted = BurstMonitor(path)
+    warm_up(lambda ts, q: restarted.add("b", ts, q), buckets=5)
+    restarted.save()
+    assert sorted(read(path)) == ["a", "b"]
+
+
+def test_unreadable_file_starts_cold(tmp_path):
+    path = tmp_path / "burst_baselines.json"
+    path.write_text("{broken", encoding="utf-8")
+    monitor = BurstMonitor(str(path))
+    assert not monitor.detector("uid").warm
+    monitor.add("uid", 0, 1)
+    monitor.add("uid", 10, 1)
+    monitor.save()
+    assert json.loads(path.read_text(encoding="utf-8"))["uid"]["samples"] == 1
@@ -0,0 +1,81 @@
+# tests/test_instrument_cache.py
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("grpc")
+invest = pytest.importorskip("tinkoff.invest")
+
+from instrument_cache import InstrumentCache, display_name  # noqa: E402
+
+UID = invest.InstrumentIdType.INSTRUMENT_ID_TYPE_UID
+
+
+def instrument(uid, figi, ticker):
+    return SimpleNamespace(uid=uid, figi=figi, ticker=ticker, name=f"{ticker} name", class_code="TQBR",
+                           instrument_type="share", currency="rub", lot=1)
+
+
+class FakeScheduler:
+    """Справочник по UID и FIGI; запросы выполняются сразу и записываются."""
+
+    def __init__(self, instruments):
+        self.by_uid = {i.uid: i for i in instruments}
+        self.by_figi = {i.figi: i for i in instruments}
+        self.requests = []
+
+    def submit(self, service, fn, priority=None, key=None):
+        self.requests.append(key)
+        _, id_type, value = key
+        future = Future()
+        found = (self.by_uid if id_type == UID else self.by_figi).get(value)
+        if found is None:
+            future.set_exception(LookupError(value))
+        else:
+            future.set_result(found)
+        return future
+
+
+def test_misses_are_resolved_and_persisted(tmp_path):
+    path = str(tmp_path / "instruments.json")
+    cache = InstrumentCache(path)
+    scheduler = FakeScheduler([instrument("u1", "f1", "SBER"), instrument("u2", "f2", "GAZP")])
+    resolved = {}
+    known = cache.resolve(scheduler, [("u1", "f1"), ("", "f2"), ("u3", "f3")], resolved.__setitem__)
+    assert known == {"u1": None, "": None, "u3": None}
+    assert display_name(resolved["u1"]) == "SBER"
+    assert display_name(resolved[""]) == "GAZP"
+    assert resolved["u3"] is None
+    # UID не найден: второй запрос идет по FIGI
+    assert [value for _, _, value in scheduler.requests] == ["u1", "f2", "u3", "f3"]
+
+    # После перезапуска известные инструменты берутся из файла без запросов
+    restarted = InstrumentCache(path)
+    scheduler = FakeScheduler([])
+    known = restarted.resolve(scheduler, [("u1", "f1"), ("u-new", "f2")], resolved.__setitem__)
+    assert display_name(known["u1"]) == "SBER"
+    assert display_name(known["u-new"]) == "GAZP"  # найден по FIGI
+    assert scheduler.requests == []
+
+
+def test_unchanged_instruments_do_not_rewrite_file(tmp_path):
+    path = tmp_path / "instruments.json"
+    cache = InstrumentCache(str(path))
+    cache.put_many([instrument("u1", "f1", "SBER")])
+    path.unlink()
+    cache.put_many([instrument("u1", "f1", "SBER")])
+    assert not path.exists()
+    cache.put_many([instrument("u1", "f1", "SBERP")])
+    assert InstrumentCache(str(path)).get("u1")["ticker"] == "SBERP"
+
+
+def test_unreadable_file_starts_empty(tmp_path):
+    path = tmp_path / "instruments.json"
+    path.write_text("[broken", encoding="utf-8")
+    cache = InstrumentCache(str(path))
+    assert cache.get("u1") is None
+    cache.put_many([instrument("u1", "f1", "SBER")])
+    assert InstrumentCache(str(path)).get(figi="f1")["ticker"] == "SBER"
+    assert display_name({"ticker": "", "name": "Сбербанк"}) == "Сбербанк"
+    assert display_name(None) is None
@@ -0,0 +1,77 @@
+# tests/test_market_events.py
+import pickle
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("pytz")
+pytest.importorskip("tinkoff.invest")
+
+from market_events import (  # noqa: E402
+    PRICE_SCALE, BookSnapshot, LastPrice, Trade, TradingStatus, datetime_to_ns, decode_response, quotation_to_nano
+)
+
+TIME = datetime(2024, 3, 1, 10, 0, 0, 123456, tzinfo=timezone.utc)
+TIME_NS = 1709287200_123456_000
+
+
+def q(units, nano=0):
+    return SimpleNamespace(units=units, nano=nano)
+
+
+def response(**fields):
+    message = dict(orderbook=None, trade=None, last_price=None, trading_status=None)
+    message.update(fields)
+    return SimpleNamespace(**message)
+
+
+def test_time_and_price_are_exact_integers():
+    assert datetime_to_ns(TIME) == TIME_NS
+    assert quotation_to_nano(q(-1, -500_000_000)) == -1_500_000_000
+
+
+def test_decode_trade_and_last_price():
+    trade = decode_response(response(trade=SimpleNamespace(
+        instrument_uid="uid", figi="FIGI", time=TIME, price=q(250, 10), quantity=7, direction=2)))
+    assert isinstance(trade, Trade)
+    assert (trade.instrument, trade.ts_ns, trade.price, trade.quantity, trade.direction) == (
+        "uid", TIME_NS, 250 * PRICE_SCALE + 10, 7, 2)
+    last_price = decode_response(response(last_price=SimpleNamespace(
+        instrument_uid="", figi="FIGI", time=TIME, price=q(1))))
+    # Без UID событие адресуется по FIGI
+    assert isinstance(last_price, LastPrice) and last_price.instrument == "FIGI"
+    assert last_price.price_float == 1.0
+
+
+def test_decode_book_and_status():
+    level = lambda price, quantity: SimpleNamespace(price=price, quantity=quantity)  # noqa: E731
+    book = decode_response(response(orderbook=SimpleNamespace(
+        instrument_uid="uid", time=TIME, depth=2, is_consistent=True,
+        bids=[level(q(10), 5), level(q(9, 500_000_000), 3)], asks=[level(q(11), 1), level(None, 0)])))
+    assert isinstance(book, BookSnapshot)
+    assert list(book.bid_prices) == [10 * PRICE_SCALE, 9_500_000_000]
+    assert list(book.ask_quantities) == [1]  # уровень без цены пропускается
+    bid_prices, _, ask_prices, _ = book.float_arrays()
+    assert (list(bid_prices), list(ask_prices)) == ([10.0, 9.5], [11.0])
+
+    status = decode_response(response(trading_status=SimpleNamespace(
+        instrument_uid="uid", time=TIME, trading_status=5,
+        limit_order_available_flag=True, market_order_available_flag=False)))
+    assert isinstance(status, TradingStatus)
+    assert (status.status, status.limit_order_available, status.market_order_available) == (5, True, False)
+    assert decode_response(response()) is None
+
+
+def test_events_are_immutable_and_picklable():
+    trade = Trade("uid", TIME_NS, 100, 1, 1)
+    with pytest.raises(AttributeError):
+        trade.price = 0
+    with pytest.raises(AttributeError):
+        del trade.price
+    with pytest.raises(AttributeError):
+        trade.extra = 1
+    copy = pickle.loads(pickle.dumps(trade))
+    assert copy.as_dict() == trade.as_dict() == {
+        "type": "Trade", "instrument": "uid", "ts_ns": TIME_NS, "price": 100, "quantity": 1, "direction": 1}
+    assert copy.ts == TIME_NS / 1e9
@@ -0,0 +1,105 @@
+# tests/test_operations_sync.py
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("grpc")
+pytest.importorskip("tinkoff.invest")
+
+from operations_sync import SYNC_OVERLAP, OperationsStore, OperationsSync, _to_ms  # noqa: E402
+from workers import CancellationToken  # noqa: E402
+
+OPENED = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def item(op_id, day):
+    return SimpleNamespace(
+        id=op_id, parent_operation_id="", date=datetime(2024, 1, day, tzinfo=timezone.utc),
+        type=SimpleNamespace(name="OPERATION_TYPE_BUY"), state=SimpleNamespace(name="OPERATION_STATE_EXECUTED"),
+        name="Покупка", description="", instrument_uid="uid", figi="", instrument_type="share",
+        quantity=1, price=None, commission=None,
+        payment=SimpleNamespace(units=-100, nano=0, currency="rub"),
+    )
+
+
+class FakeOperations:
+    """Страницы по курсору: cursor -> (операции, следующий курсор или "")."""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = []
+
+    def get_operations_by_cursor(self, request):
+        self.requests.append(request)
+        items, next_cursor = self.pages[request.cursor]
+        return SimpleNamespace(items=items, has_next=bool(next_cursor), next_cursor=next_cursor)
+
+
+class FakeScheduler:
+    def __init__(self, operations):
+        self.client = SimpleNamespace(operations=operations)
+
+    def submit(self, service, fn, priority=None):
+        future = Future()
+        future.set_result(fn(self.client))
+        return future
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = OperationsStore(str(tmp_path / "operations.sqlite3"))
+    yield store
+    store.close()
+
+
+def test_pages_until_cursor_ends(store):
+    operations = FakeOperations({
+        "": ([item("1", 2), item("2", 3)], "c1"),
+        "c1": ([item("3", 4)], "c2"),
+        "c2": ([item("4", 5)], ""),
+    })
+    loaded = OperationsSync(FakeScheduler(operations), store).sync(CancellationToken(), "acc", OPENED)
+    assert loaded == 4
+    assert [r.cursor for r in operations.requests] == ["", "c1", "c2"]
+    assert operations.requests[0].from_ == OPENED
+    assert [op['id'] for op in store.query("acc")] == ["4", "3", "2", "1"]
+    state = store.sync_state("acc")
+    assert state['cursor'] is None
+    assert state['synced_until_ms'] == _to_ms(operations.requests[0].to)
+
+
+def test_interrupted_sync_resumes_from_saved_cursor(store):
+    pages = {
+        "": ([item("1", 2)], "c1"),
+        "c1": ([item("2", 3)], ""),
+    }
+    first = FakeOperations(pages)
+    token = CancellationToken()
+    # Отмена после первой страницы: курсор остается в sync_state
+    OperationsSync(FakeScheduler(first), store).sync(token, "acc", OPENED, on_page=lambda *_: token.cancel())
+    state = store.sync_state("acc")
+    assert state['cursor'] == "c1"
+    assert state['synced_until_ms'] is None
+    window_to = first.requests[0].to
+
+    second = FakeOperations(dict(pages, **{"": ([], "")}))
+    loaded = OperationsSync(FakeScheduler(second), store).sync(CancellationToken(), "acc", OPENED)
+    assert loaded == 1
+    # Сначала дочитывается старое окно с того же курсора, затем новое окно с перекрытием
+    assert second.requests[0].cursor == "c1"
+    assert second.requests[0].to == window_to
+    assert second.requests[1].cursor == ""
+    assert second.requests[1].from_ == window_to - SYNC_OVERLAP
+    assert store.count("acc") == 2
+    assert store.sync_state("acc")['cursor'] is None
+
+
+def test_repeated_operations_are_replaced(store):
+    operations = FakeOperations({"": ([item("1", 2), item("2", 3)], "")})
+    sync = OperationsSync(FakeScheduler(operations), store)
+    sync.sync(CancellationToken(), "acc", OPENED)
+    sync.sync(CancellationToken(), "acc", OPENED)
+    assert store.count("acc") == 2
+    assert store.query("acc", limit=1)[0]['payment_nano'] == -100 * 10 ** 9
@@ -0,0 +1,50 @@
+# tests/test_order_flow.py
+from order_flow import BUY, SELL, OrderFlowAggregator
+
+
+def test_windows_and_session():
+    flow = OrderFlowAggregator((10, None))
+    flow.add(100.5, 10.0, 2, BUY)
+    flow.add(105.0, 12.0, 1, SELL)
+    flow.add(112.0, 11.0, 3, BUY)
+    metrics = flow.metrics(now=112.0)
+    # Сделка в 100.5 вышла из 10-секундного окна, сессия помнит все
+    assert metrics[10]["trades"] == 2
+    assert metrics[10]["delta"] == 2
+    assert metrics[10]["vwap"] == (12.0 + 33.0) / 4
+    assert metrics[None]["trades"] == 3
+    assert metrics[None]["volume"] == 6
+    assert metrics[None]["buy_sell_ratio"] == 5
+
+
+def test_out_of_order_trade_older_than_first():
+    flow = OrderFlowAggregator((10, 60, None))
+    flow.add(100.0, 10.0, 1, BUY)
+    flow.add(95.0, 10.0, 4, SELL)  # пришла позже, но еще в окне 10 с
+    metrics = flow.metrics()
+    assert metrics[10]["volume"] == 5
+    assert metrics[60]["volume"] == 5
+    assert metrics[None]["volume"] == 5
+    assert metrics[None]["rate"] == 2 / 5
+    # И вычитается, когда окно ее покидает
+    assert flow.metrics(now=105.0)[10]["volume"] == 1
+    assert flow.metrics(now=110.0)[10]["volume"] == 0
+    assert flow.metrics(now=110.0)[60]["volume"] == 5
+
+
+def test_trade_older_than_window_counts_only_for_session():
+    flow = OrderFlowAggregator((10, None))
+    flow.add(100.0, 10.0, 1, BUY)
+    flow.add(80.0, 10.0, 7, BUY)
+    metrics = flow.metrics()
+    assert metrics[10]["volume"] == 1
+    assert metrics[None]["volume"] == 8
+
+
+def test_gap_longer_than_horizon_resets_windows():
+    flow = OrderFlowAggregator((10, 60, None))
+    flow.add(100.0, 10.0, 1, BUY)
+    flow.add(1000.0, 20.0, 2, SELL)
+    metrics = flow.metrics()
+    assert metrics[10]["volume"] == metrics[60]["volume"] == 2
+    assert metrics[None]["volume"] == 3
@@ -0,0 +1,111 @@
+# tests/test_portfolio_analytics.py
+from decimal import Decimal
+from types import SimpleNamespace
+
+from money import NANO, div_nano, format_nano, from_nano, mul_nano, to_nano
+from portfolio_analytics import PortfolioBook
+
+
+def n(value) -> int:
+    return to_nano(value)
+
+
+def test_money_conversions_are_exact():
+    assert to_nano(SimpleNamespace(units=12, nano=340_000_000)) == n("12.34")
+    assert to_nano(Decimal("0.1")) + to_nano(Decimal("0.2")) == n("0.3")
+    assert to_nano(None) == 0
+    assert from_nano(n("-1.5")) == Decimal("-1.5")
+    assert format_nano(n("2.005"), 3) == "2.005"
+
+
+def test_mul_and_div_round_once_to_nearest():
+    assert mul_nano(n(3), n("1.1")) == n("3.3")
+    assert mul_nano(n("0.000000001"), n("0.5")) == 1
+    assert mul_nano(n("0.000000001"), n("0.4")) == 0
+    assert div_nano(n(1), n(3)) == 333_333_333
+    assert div_nano(n(2), n(3)) == 666_666_667
+    assert div_nano(n(-1), n(3)) == -333_333_333
+
+
+def test_totals_follow_price_and_quantity_changes():
+    book = PortfolioBook()
+    book.upsert("a", "share", "rub", n(10), n(100), n(110))
+    book.upsert("b", "bond", "rub", n(2), n(1000), n("990.5"))
+    assert book.total == n(1100 + 1981)
+    assert book.pnl == n(100 - 19)
+    assert book.by_class == {"share": n(1100), "bond": n(1981)}
+
+    assert book.set_price("a", n(120))
+    assert not book.set_price("a", n(120))
+    assert book.set_quantity("b", n(3))
+    assert book.total == n(1200 + Decimal("2971.5"))
+    assert book.pnl == n(200 - Decimal("28.5"))
+
+    book.remove("a")
+    assert "a" not in book and len(book) == 1
+    assert book.total == n("2971.5")
+    assert book.by_class["share"] == 0
+    # После переноса последней строки на место удаленной индекс остается верным
+    assert book.value("b") == n("2971.5")
+
+
+def test_incremental_totals_match_recompute():
+    book = PortfolioBook(fx_rates={"usd": n(90)})
+    book.upsert("a", "share", "rub", n(7), n("10.01"), n("10.03"))
+    book.upsert("b", "share", "usd", n(3), n("15.5"), n("16.25"))
+    book.upsert("c", "etf", "rub", n(100), n("1.111"), n("1.113"))
+    book.set_price("b", n("16.75"))
+    book.remove("a")
+    book.set_quantity("c", n(50))
+    incremental = book.summary()
+    book.recompute()
+    assert book.summary() == incremental
+    assert book.total == n(3 * Decimal("16.75") * 90 + 50 * Decimal("1.113"))
+
+
+def test_fx_rates_and_unpriced_currencies():
+    book = PortfolioBook()
+    book.upsert("r", "share", "rub", n(1), n(100), n(100))
+    book.upsert("u", "share", "usd", n(2), n(10), n(11))
+    # Без курса позиция видна только в разбивке по валютам
+    assert book.total == n(100)
+    assert book.by_currency == {"rub": n(100), "usd": n(22)}
+    assert book.unpriced_currencies() == ["usd"]
+    assert book.value("u") is None
+
+    book.set_fx_rates({"usd": n(90)})
+    assert book.total == n(100 + 22 * 90)
+    assert book.pnl == n(2 * 90)
+    assert book.unpriced_currencies() == []
+
+
+def test_weights_and_concentration():
+    book = PortfolioBook()
+    book.upsert("a", "share", "rub", n(1), n(300), n(300))
+    book.upsert("b", "share", "rub", n(1), n(100), n(100))
+    assert book.weights() == {"a": n("0.75"), "b": n("0.25")}
+    hhi, top_uid, top_weight = book.concentration()
+    assert hhi == n("0.625")
+    assert (top_uid, top_weight) == ("a", n("0.75"))
+    assert PortfolioBook().concentration() == (0, None, 0)
+
+
+def test_sync_updates_only_changed_rows():
+    book = PortfolioBook()
+    positions = {
+        "a": {'instrument_type': "share", 'currency': "rub", 'quantity': Decimal(2),
+              'average_price': Decimal(10), 'current_price': Decimal(12)},
+        "b": {'instrument_type': "bond", 'currency': "rub", 'quantity': Decimal(1),
+              'average_price': Decimal(1000), 'current_price': None},
+    }
+    book.sync(positions)
+    # Нет текущей цены: позиция оценивается по средней
+    assert book.total == n(24 + 1000)
+    assert book.pnl == n(4)
+
+    del positions["b"]
+    positions["a"] = dict(positions["a"], current_price=Decimal(15))
+    book.sync(positions)
+    assert book.uids == ["a"]
+    assert book.total == n(30)
+    assert book.summary()['by_class'] == {"share": n(30)}
@@ -0,0 +1,173 @@
+# tests/test_request_scheduler.py
+import threading
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+grpc = pytest.importorskip("grpc")
+pytest.importorskip("tinkoff.invest")
+
+import request_scheduler  # noqa: E402
+from request_scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, RequestScheduler  # noqa: E402
+
+TIMEOUT = 5
+
+
+class RateLimited(Exception):
+    metadata = SimpleNamespace(ratelimit_reset="0")
+
+    def code(self):
+        return grpc.StatusCode.RESOURCE_EXHAUSTED
+
+
+class FakeMarketData:
+    """GetLastPrices: каждый вызов берет следующее поведение из behaviours (None - ответ)."""
+
+    def __init__(self, behaviours=()):
+        self.calls = []
+        self.behaviours = list(behaviours)
+
+    def get_last_prices(self, instrument_id):
+        self.calls.append(list(instrument_id))
+        behaviour = self.behaviours.pop(0) if self.behaviours else None
+        if callable(behaviour):
+            behaviour = behaviour()
+        if isinstance(behaviour, Exception):
+            raise behaviour
+        return SimpleNamespace(last_prices=[SimpleNamespace(instrument_uid=uid, price=uid) for uid in instrument_id])
+
+
+class FakePool:
+    def __init__(self, market_data):
+        self.client = SimpleNamespace(market_data=market_data)
+        self.session_error = None
+
+    @contextmanager
+    def session(self):
+        if self.session_error is not None:
+            error, self.session_error = self.session_error, None
+            raise error
+        yield self.client
+
+
+def prices(future):
+    return {uid: last_price.price for uid, last_price in future.result(TIMEOUT).items()}
+
+
+@pytest.fixture
+def make_scheduler(monkeypatch):
+    monkeypatch.setattr(request_scheduler, "_ratelimit_reset", lambda error: 0.01)
+    schedulers = []
+
+    def make(market_data):
+        pool = FakePool(market_data)
+        monkeypatch.setattr(request_scheduler, "get_pool", lambda token: pool)
+        scheduler = RequestScheduler("token")
+        schedulers.append(scheduler)
+        return scheduler, pool
+
+    yield make
+    for scheduler in schedulers:
+        scheduler.stop()
+
+
+def test_concurrent_calls_are_coalesced(make_scheduler):
+    market_data = FakeMarketData()
+    scheduler, _ = make_scheduler(market_data)
+    # Пока диспетчер не может взять блокировку, вызовы копятся в один запрос
+    with scheduler._cond:
+        first = scheduler.get_last_prices(["a"])
+        second = scheduler.get_last_prices(["b", "a"], PRIORITY_INTERACTIVE)
+    assert prices(first) == {"a": "a"}
+    assert prices(second) == {"b": "b", "a": "a"}
+    assert market_data.calls == [["a", "b"]]
+
+
+def test_interactive_call_while_batch_is_in_flight(make_scheduler):
+    started, release = threading.Event(), threading.Event()
+
+    def blocked():
+        started.set()
+        release.wait(TIMEOUT)
+
+    market_data = FakeMarketData([blocked])
+    scheduler, _ = make_scheduler(market_data)
+    first = scheduler.get_last_prices(["a"], PRIORITY_BACKGROUND)
+    assert started.wait(TIMEOUT)
+    # Запрос уже вынут из очереди: повышение приоритета не должно искать его там
+    second = scheduler.get_last_prices(["b"], PRIORITY_INTERACTIVE)
+    release.set()
+    assert prices(first) == {"a": "a"}
+    assert prices(second) == {"b": "b"}
+    assert market_data.calls == [["a"], ["b"]]
+
+
+def test_session_failure_reaches_waiters(make_scheduler):
+    scheduler, pool = make_scheduler(FakeMarketData())
+    pool.session_error = RuntimeError("Session pool is closed")
+    with pytest.raises(RuntimeError):
+        scheduler.get_last_prices(["a"]).result(TIMEOUT)
+    # Следующий вызов собирает новый запрос, а не ждет застрявший
+    assert prices(scheduler.get_last_prices(["a"])) == {"a": "a"}
+
+
+def test_call_error_reaches_all_waiters(make_scheduler):
+    scheduler, _ = make_scheduler(FakeMarketData([ValueError("bad uid")]))
+    with scheduler._cond:
+        first = scheduler.get_last_prices(["a"])
+        second = scheduler.get_last_prices(["b"])
+    for future in (first, second):
+        with pytest.raises(ValueError):
+            future.result(TIMEOUT)
+    assert prices(scheduler.get_last_prices(["c"])) == {"c": "c"}
+
+
+def test_rate_limited_batch_is_retried(make_scheduler):
+    market_data = FakeMarketData([RateLimited()])
+    scheduler, _ = make_scheduler(market_data)
+    # Интерактивный запрос не ждет восстановления резерва бюджета после сброса лимита
+    assert prices(scheduler.get_last_prices(["a"], PRIORITY_INTERACTIVE)) == {"a": "a"}
+    assert market_data.calls == [["a"], ["a"]]
+
+
+def test_rate_limit_after_new_batch_was_collected(make_scheduler):
+    started, release = threading.Event(), threading.Event()
+
+    def limited():
+        started.set()
+        release.wait(TIMEOUT)
+        return RateLimited()
+
+    market_data = FakeMarketData([limited])
+    scheduler, _ = make_scheduler(market_data)
+    first = scheduler.get_last_prices(["a"], PRIORITY_INTERACTIVE)
+    assert started.wait(TIMEOUT)
+    # Новый склеенный запрос уже собран, когда первый упирается в лимит:
+    # ожидающие первого не теряются, даже если новый успел уйти раньше
+    with scheduler._cond:
+        second = scheduler.get_last_prices(["b"])
+        release.set()
+    assert prices(first) == {"a": "a"}
+    assert prices(second) == {"b": "b"}
+
+
+def test_keyed_background_requests_replace_each_other(make_scheduler):
+    scheduler, _ = make_scheduler(FakeMarketData())
+    with scheduler._cond:
+        first = scheduler.submit("market_data", lambda client: 1, key="volume")
+        second = scheduler.submit("market_data", lambda client: 2, PRIORITY_INTERACTIVE, key="volume")
+    assert first is second
+    assert second.result(TIMEOUT) == 2
+
+
+def test_stop_cancels_waiters(make_scheduler):
+    scheduler, _ = make_scheduler(FakeMarketData())
+    with scheduler._cond:
+        scheduler._running = False  # диспетчер выходит, не забрав запрос
+        scheduler._cond.notify_all()
+    scheduler._dispatcher.join(TIMEOUT)
+    future = scheduler.get_last_prices(["a"])
+    scheduler._running = True
+    scheduler.stop()
+    assert future.cancelled()
@@ -0,0 +1,122 @@
+# tests/test_session_pool.py
+import asyncio
+
+import pytest
+
+grpc = pytest.importorskip("grpc")
+pytest.importorskip("tinkoff.invest")
+
+import session_pool  # noqa: E402
+from session_pool import SessionPool  # noqa: E402
+
+
+class Unavailable(Exception):
+    def code(self):
+        return grpc.StatusCode.UNAVAILABLE
+
+
+class FakeAsyncClient:
+    created = []
+
+    def __init__(self, token, options=None):
+        self.closed = False
+        FakeAsyncClient.created.append(self)
+
+    async def __aenter__(self):
+        await asyncio.sleep(0.01)  # вход в клиент уступает loop другим корутинам
+        return self
+
+    async def __aexit__(self, *exc):
+        self.closed = True
+
+
+class FakeClient:
+    created = []
+
+    def __init__(self, token, options=None):
+        self.closed = False
+        FakeClient.created.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.closed = True
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    FakeAsyncClient.created = []
+    FakeClient.created = []
+    monkeypatch.setattr(session_pool, "AsyncClient", FakeAsyncClient)
+    monkeypatch.setattr(session_pool, "Client", FakeClient)
+    return SessionPool("token", size=1)
+
+
+def test_concurrent_first_entry_creates_one_client(pool):
+    async def use():
+        async with pool.async_session() as client:
+            await asyncio.sleep(0.01)
+            return client
+
+    async def main():
+        return await asyncio.gather(use(), use(), use())
+
+    clients = asyncio.run(main())
+    assert len(FakeAsyncClient.created) == 1
+    assert clients[0] is clients[1] is clients[2]
+    assert not clients[0].closed
+
+
+def test_reconnect_error_does_not_close_client_under_other_users(pool):
+    async def main():
+        inside = asyncio.Event()
+        release = asyncio.Event()
+
+        async def long_stream():
+            async with pool.async_session() as client:
+                inside.set()
+                await release.wait()
+                # Канал не закрыт под этим пользователем, пока он из него не вышел
+                assert not client.closed
+                return client
+
+        stream = asyncio.create_task(long_stream())
+        await inside.wait()
+        with pytest.raises(Unavailable):
+            async with pool.async_session():
+                raise Unavailable()
+        async with pool.async_session() as fresh:
+            pass
+        release.set()
+        old = await stream
+        return old, fresh
+
+    old, fresh = asyncio.run(main())
+    assert old is not fresh
+    assert old.closed  # закрыт последним пользователем
+    assert not fresh.closed
+
+
+def test_close_async_waits_for_users(pool):
+    async def main():
+        async with pool.async_session() as client:
+            await pool.close_async()
+            assert not client.closed
+        return client
+
+    assert asyncio.run(main()).closed
+
+
+def test_sync_session_is_recycled_after_unavailable(pool):
+    with pytest.raises(Unavailable):
+        with pool.session():
+            raise Unavailable()
+    assert FakeClient.created[0].closed
+    with pool.session() as client:
+        assert client is FakeClient.created[1]
+    pool.close()
+    assert FakeClient.created[1].closed
+    with pytest.raises(RuntimeError):
+        with pool.session():
+            pass
@@ -0,0 +1,58 @@
+# tests/test_shm_ring.py
+import struct
+
+import pytest
+
+from shm_ring import SharedRing
+
+RECORD = struct.Struct("qd")
+
+
+@pytest.fixture
+def ring():
+    ring = SharedRing(RECORD, capacity=4)
+    yield ring
+    ring.close()
+
+
+def test_full_ring_drops_and_counts(ring):
+    assert all(ring.push(i, i / 2) for i in range(4))
+    assert not ring.push(4, 2.0)
+    assert not ring.push(5, 2.5)
+    assert ring.dropped == 2
+    assert len(ring) == 4
+    # Отброшенные записи не вытесняют ранние: читатель получает первые четыре
+    assert ring.pop_all() == [(i, i / 2) for i in range(4)]
+    assert ring.push(6, 3.0)
+    assert ring.dropped == 2
+
+
+def test_pop_limit_and_wraparound(ring):
+    for i in range(3):
+        ring.push(i, float(i))
+    assert ring.pop_all(limit=2) == [(0, 0.0), (1, 1.0)]
+    # Индексы уходят за capacity: слоты переиспользуются по кругу
+    for i in range(3, 6):
+        assert ring.push(i, float(i))
+    assert ring.pop_all(limit=2) == [(2, 2.0), (3, 3.0)]
+    for i in range(6, 8):
+        assert ring.push(i, float(i))
+    assert ring.pop_all() == [(i, float(i)) for i in range(4, 8)]
+    assert len(ring) == 0
+    assert ring.pop_all() == []
+    assert ring.dropped == 0
+
+
+def test_attached_reader_shares_indexes(ring):
+    reader = SharedRing.attach(RECORD, 4, ring.name)
+    try:
+        ring.push(1, 1.5)
+        ring.push(2, 2.5)
+        assert reader.pop_all() == [(1, 1.5), (2, 2.5)]
+        # Чтение освобождает место для писателя
+        assert all(ring.push(i, 0.0) for i in range(4))
+        assert not ring.push(9, 0.0)
+        assert (ring.dropped, reader.dropped) == (1, 0)
+        assert len(reader.pop_all()) == 4
+    finally:
+        reader.close()
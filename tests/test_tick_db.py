@@ -0,0 +1,111 @@
+# tests/test_tick_db.py
+from array import array
+
+import pytest
+
+pytest.importorskip("pytz")
+pytest.importorskip("tinkoff.invest")
+
+import analytics_engine  # noqa: E402
+import tick_db  # noqa: E402
+from analytics_engine import AnalyticsEngine  # noqa: E402
+from burst_detector import BurstMonitor  # noqa: E402
+from market_events import PRICE_SCALE, BookSnapshot, LastPrice, Trade  # noqa: E402
+from tick_db import TickDatabase  # noqa: E402
+
+SECOND = 1_000_000_000
+
+
+def trade(ts, quantity=1, direction=1, instrument="uid"):
+    return Trade(instrument, int(ts * SECOND), (100 + int(ts)) * PRICE_SCALE, quantity, direction)
+
+
+def book(ts, bid, ask):
+    return BookSnapshot("uid", int(ts * SECOND), 1, True, array("q", [bid]), array("q", [1]),
+                        array("q", [ask]), array("q", [1]))
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = TickDatabase(str(tmp_path / "ticks.sqlite3"))
+    yield db
+    db.close()
+
+
+def test_events_are_written_in_batches(db, monkeypatch):
+    batches = []
+    write_batch = db._write_batch
+    monkeypatch.setattr(db, "_write_batch", lambda connection, batch: (batches.append(len(batch)),
+                                                                        write_batch(connection, batch)))
+    for i in range(200):
+        db.add(trade(1000 + i * 0.01, quantity=i))
+    db.add_many([LastPrice("uid", 1001 * SECOND, 5), book(1001, 10, 11), book(1002, 10, 11), book(1003, 9, 11)])
+    assert db.flush()
+    # Пока писатель ждет интервал, события копятся: транзакций намного меньше, чем событий
+    assert sum(batches) == 204
+    assert len(batches) <= 2
+    assert len(db.trades("uid")) == 200
+    assert db.last_prices("uid") == [(1001 * SECOND, 5)]
+    # Снимок с той же вершиной стакана не сохраняется
+    assert [row[0] for row in db.book_tops("uid")] == [1001 * SECOND, 1003 * SECOND]
+
+
+def test_trade_queries_use_time_range_and_filters(db):
+    db.add_many([trade(100, 5, 1), trade(101, 50, 2), trade(102, 500, 1), trade(103, 1, 2), trade(100, 9, 1, "other")])
+    assert db.flush()
+    assert [row[2] for row in db.trades("uid", 101, 103)] == [50, 500]
+    assert [row[2] for row in db.trades("uid", min_quantity=50)] == [50, 500]
+    assert [row[2] for row in db.trades("uid", direction=2)] == [50, 1]
+    assert len(db.trades("uid", limit=2)) == 2
+    assert db.time_range("uid") == (100 * SECOND, 103 * SECOND)
+    assert db.time_range("missing") is None
+    assert db.instruments() == ["other", "uid"]
+
+
+def test_overflow_is_counted(db, monkeypatch):
+    monkeypatch.setattr(tick_db, "MAX_PENDING", 3)
+    db.add_many([trade(100 + i) for i in range(5)])
+    assert db.dropped == 2
+    assert db.flush()
+    assert len(db.trades("uid")) == 3
+
+
+def make_engine(tmp_path, db, monkeypatch):
+    monkeypatch.setattr(tick_db, "_db", db)
+    engine = AnalyticsEngine(burst_monitor=BurstMonitor(str(tmp_path / "burst.json")))
+    engine.instrument_key = "uid"
+    return engine
+
+
+def tape_ts(engine):
+    return [ts // 1_000_000 for ts in engine.trade_tape.columns()["ts"]]
+
+
+def test_warm_start_stitches_history_to_held_live_trades(tmp_path, db, monkeypatch):
+    db.add_many([trade(ts) for ts in range(100, 106)])
+    assert db.flush()
+    engine = make_engine(tmp_path, db, monkeypatch)
+    engine.warm_start("uid", 0)
+    assert engine._warm_start is not None  # живых сделок еще нет: ждем, пока они появятся в базе
+    # Живые сделки во время теплого старта придерживаются; 104 и 105 уже есть в базе
+    for ts in (104, 105, 106, 107):
+        engine.on_trade(ts, 100.0 + ts, 1, 1)
+    assert len(engine.trade_tape) == 0
+    engine._next_warm_check = 0.0
+    engine.poll_warm_start()
+    assert engine._warm_start is None
+    assert tape_ts(engine) == [100, 101, 102, 103, 104, 105, 106, 107]
+    assert engine.trade_tape.row(0)[1] == 200.0
+    # История не учится базовой линией всплесков повторно, живые сделки учатся
+    detector = engine.burst_monitor.detector("uid")
+    assert detector.samples == 0 and detector.state()["trades"] == 2
+
+
+def test_warm_start_times_out_without_live_trades(tmp_path, db, monkeypatch):
+    db.add_many([trade(ts) for ts in range(100, 103)])
+    assert db.flush()
+    monkeypatch.setattr(analytics_engine, "WARM_START_WAIT", 0.0)
+    engine = make_engine(tmp_path, db, monkeypatch)
+    engine.warm_start("uid", 101)
+    assert engine._warm_start is None
+    assert tape_ts(engine) == [101, 102]
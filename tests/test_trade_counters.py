@@ -0,0 +1,53 @@
+from trade_counters import RollingCounter
+
+
+def test_windows_inside_horizon():
+    counter = RollingCounter(horizon=10)
+    for ts in range(100, 110):
+        counter.add(ts + 0.5)
+    assert counter.since(100) == 10
+    assert counter.since(105) == 5
+    assert counter.between(102, 104) == 2
+    assert counter.last(3, now=109.5) == 3
+
+
+def test_full_horizon_is_usable():
+    counter = RollingCounter(horizon=10)
+    for ts in range(100, 120):
+        counter.add(ts)
+    # Ровно горизонт: 10 последних секунд, а не 9
+    assert counter.last(10, now=119) == 10
+    assert counter.since(110) == 10
+
+
+def test_window_longer_than_horizon_is_clipped():
+    counter = RollingCounter(horizon=10)
+    for ts in range(100, 130):
+        counter.add(ts, 2)
+    assert counter.total == 60
+    # Начало сессии давно вышло за горизонт: считаются только последние 10 секунд
+    assert counter.since(0) == 20
+    assert counter.since(100) == 20
+    assert counter.last(3600, now=129) == 20
+    assert counter.between(50, 125) == 10
+
+
+def test_gap_longer_than_horizon():
+    counter = RollingCounter(horizon=10)
+    counter.add(100, 5)
+    counter.add(200, 1)
+    assert counter.since(0) == 1
+    assert counter.last(10, now=205) == 1
+    assert counter.last(10, now=215) == 0
+
+
+def test_late_and_stale_events():
+    counter = RollingCounter(horizon=10)
+    counter.add(100)
+    counter.add(105)
+    counter.add(103)  # запоздавшая внутри горизонта
+    assert counter.since(103) == 2
+    counter.add(120)
+    counter.add(105)  # старше горизонта - отбрасывается
+    assert counter.total == 4
+    assert counter.since(0) == 1
@@ -0,0 +1,28 @@
+import random
+from collections import deque
+
+from trade_index import FANOUT, LargeTradeIndex, _QuantityIndex
+
+
+def test_latest_matches_full_scan():
+    rng = random.Random(7)
+    index = _QuantityIndex()
+    quantities = [int(rng.paretovariate(1.2)) for _ in range(FANOUT ** 2 * 3 + 17)]
+    for seq, quantity in enumerate(quantities):
+        index.add(seq * 2, quantity)
+    assert len(index.levels) == 3
+    for threshold in (0, 1, 3, 20, 500, 10 ** 9):
+        expected = [seq * 2 for seq, quantity in enumerate(quantities) if quantity >= threshold][-50:]
+        assert index.latest(threshold, 50) == expected
+
+
+def test_set_threshold_returns_latest_per_direction():
+    index = LargeTradeIndex(threshold=100, max_entries=3)
+    for seq, (quantity, direction) in enumerate([(10, 1), (200, 1), (50, 2), (150, 1), (60, 2), (5, 1), (90, 2)]):
+        index.add(seq, quantity, direction)
+    assert index.recent[1] == deque([1, 3])
+    recent = index.set_threshold(50)
+    assert recent == {1: [1, 3], 2: [2, 4, 6]}
+    assert index.set_threshold(1) == {1: [1, 3, 5], 2: [2, 4, 6]}
+    assert index.add(7, 1, 1)
+
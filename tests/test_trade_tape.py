@@ -0,0 +1,69 @@
+# tests/test_trade_tape.py
+import os
+
+import pytest
+
+from trade_tape import ROW_SIZE, TradeTape
+
+
+def fill(tape, count):
+    for i in range(count):
+        tape.append(1000 + 10 * i, 100.0 + i, i + 1, 1 + i % 2)
+
+
+@pytest.fixture
+def tape(tmp_path):
+    # Блоки по 4 сделки, в памяти помещается два полных блока
+    tape = TradeTape(chunk_size=4, memory_budget=2 * 4 * ROW_SIZE, spill_dir=str(tmp_path))
+    yield tape
+    tape.close()
+
+
+def test_old_chunks_spill_within_budget(tape, tmp_path):
+    fill(tape, 20)
+    assert len(tape) == 20
+    # Бюджет проверяется при открытии нового блока: в нем закрытые блоки, текущий сверх него
+    assert tape.spilled_chunks == 2
+    assert tape.memory_usage() == 3 * 4 * ROW_SIZE
+    tape.append(1200, 120.0, 21, 1)
+    assert tape.spilled_chunks == 3
+    spill_dirs = os.listdir(tmp_path)
+    assert len(spill_dirs) == 1
+    assert len(os.listdir(tmp_path / spill_dirs[0])) == 3 * 4  # по файлу на столбец блока
+
+
+def test_rows_and_slices_span_spilled_chunks(tape):
+    fill(tape, 20)
+    assert tape.row(0) == (1000, 100.0, 1, 1)
+    assert tape.row(5) == (1050, 105.0, 6, 2)
+    assert tape.row(-1) == (1190, 119.0, 20, 2)
+    with pytest.raises(IndexError):
+        tape.row(20)
+
+    columns = tape.columns(1030, 1130)
+    assert list(columns["ts"]) == list(range(1030, 1130, 10))
+    assert list(columns["quantity"]) == list(range(4, 14))
+    assert list(columns["price"]) == [100.0 + i for i in range(3, 13)]
+    # Срезы выгруженных блоков отдаются как memoryview поверх mmap
+    segments = list(tape.segments(1000, 1040))
+    assert isinstance(segments[0]["ts"], memoryview)
+    assert list(tape.columns()["ts"]) == list(range(1000, 1200, 10))
+
+
+def test_close_removes_spill_files(tmp_path):
+    tape = TradeTape(chunk_size=2, memory_budget=0, spill_dir=str(tmp_path))
+    fill(tape, 6)
+    assert tape.spilled_chunks == 2
+    # Срез выгруженного блока остается валидным, пока на него есть ссылка
+    segment = next(tape.segments())
+    tape.close()
+    assert os.listdir(tmp_path) == []
+    assert list(segment["ts"]) == [1000, 1010]
+
+
+def test_clear_starts_a_new_tape(tape):
+    fill(tape, 12)
+    tape.clear()
+    assert len(tape) == 0 and tape.spilled_chunks == 0
+    assert tape.append(5, 1.0, 1, 1) == 0
+    assert list(tape.columns()["ts"]) == [5]
@@ -0,0 +1,56 @@
+# tests/test_watchlist_model.py
+import pytest
+
+pytest.importorskip("PyQt5")
+pytest.importorskip("pytz")
+pytest.importorskip("tinkoff.invest")
+
+from PyQt5.QtCore import Qt  # noqa: E402
+
+from ticker_window import WatchlistModel  # noqa: E402
+
+
+@pytest.fixture
+def model():
+    model = WatchlistModel()
+    changes = []
+    model.dataChanged.connect(lambda top_left, bottom_right, roles: changes.append(
+        (top_left.row(), top_left.column(), bottom_right.column())))
+    model.changes = changes
+    for uid in ("a", "b", "c"):
+        model.add_instrument(uid, uid.upper())
+    return model
+
+
+def text(model, row, column):
+    return model.data(model.index(row, column), Qt.DisplayRole)
+
+
+def test_updates_repaint_only_changed_cells(model):
+    model.update_instruments({"b": {'price': 10, 'time': "10:00:00", 'timestamp': 1.0}})
+    assert model.changes == [(1, 1, 3)]
+    model.update_instruments({"b": {'price': 10, 'time': "10:00:00", 'timestamp': 1.0}, "x": {'price': 1}})
+    assert model.changes == [(1, 1, 3)]
+    model.update_instruments({"b": {'volume': 500}})
+    assert model.changes[-1] == (1, 2, 2)
+    assert text(model, 1, 1) == "10"
+
+
+def test_error_replaces_price_until_next_quote(model):
+    model.update_instruments({"a": {'error': "нет данных"}})
+    assert model.changes == [(0, 1, 1)]
+    assert text(model, 0, 1) == "Ошибка: нет данных"
+    model.update_instruments({"a": {'price': 5, 'time': None, 'timestamp': None}})
+    assert model.changes[-1] == (0, 1, 1)
+    assert text(model, 0, 1) == "5"
+
+
+def test_remove_keeps_uid_index(model):
+    model.remove_instrument("a")
+    model.remove_instrument("missing")
+    assert [model.uid_at(row) for row in range(model.rowCount())] == ["b", "c"]
+    model.update_instruments({"c": {'price': 7, 'time': "10:00:01", 'timestamp': 2.0}})
+    assert model.changes == [(1, 1, 3)]
+    # Пустые значения сортируются ниже любых чисел
+    assert model.data(model.index(0, 1), WatchlistModel.SORT_ROLE) == float("-inf")
+    assert model.data(model.index(1, 1), WatchlistModel.SORT_ROLE) == 7
@@ -0,0 +1,90 @@
+# tests/test_workers.py
+import asyncio
+import threading
+import time
+
+import pytest
+
+from workers import WorkerPool
+
+
+def wait_idle(pool, timeout=1.0):
+    # Задача снимается с учета в done-колбэке, уже после пробуждения wait()
+    deadline = time.monotonic() + timeout
+    while pool.stats() != {"threads": 0, "async": 0} and time.monotonic() < deadline:
+        time.sleep(0.001)
+    return pool.stats()
+
+
+@pytest.fixture
+def pool():
+    pool = WorkerPool(max_workers=2)
+    yield pool
+    pool.shutdown(timeout=2)
+
+
+def test_spawn_stops_on_cancel(pool):
+    started = threading.Event()
+    ticks = []
+
+    def loop(token):
+        started.set()
+        while not token.sleep(0.01):
+            ticks.append(1)
+        return "stopped"
+
+    handle = pool.spawn(loop, name="loop")
+    assert started.wait(1)
+    handle.cancel()
+    assert handle.wait(1)
+    assert handle.future.result() == "stopped"
+    assert wait_idle(pool) == {"threads": 0, "async": 0}
+
+
+def test_cancel_before_start_skips_task(pool):
+    release = threading.Event()
+    ran = []
+    # Оба потока пула заняты, третья задача ждет в очереди
+    busy = [pool.submit(release.wait, 1) for _ in range(2)]
+    queued = pool.submit(ran.append, 1)
+    queued.cancel()
+    release.set()
+    for handle in busy:
+        assert handle.wait(1)
+    assert queued.wait(1)
+    assert queued.future.cancelled()
+    assert ran == []
+
+
+def test_coroutine_cancel(pool):
+    started = threading.Event()
+
+    async def forever():
+        started.set()
+        await asyncio.sleep(60)
+
+    handle = pool.run_coroutine(forever)
+    assert started.wait(1)
+    assert pool.stats()["async"] == 1
+    handle.cancel()
+    assert handle.wait(1)
+    assert handle.future.cancelled()
+    assert wait_idle(pool)["async"] == 0
+
+
+def test_shutdown_cancels_running_tasks():
+    pool = WorkerPool(max_workers=2)
+    started = threading.Event()
+    stopped = []
+
+    def loop(token):
+        started.set()
+        token.sleep(60)
+        stopped.append(token.cancelled)
+
+    pool.spawn(loop)
+    assert started.wait(1)
+    pool.shutdown(timeout=1)
+    assert stopped == [True]
+    with pytest.raises(RuntimeError):
+        pool.submit(print)
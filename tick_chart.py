@@ -0,0 +1,194 @@
+# tick_chart.py
+from datetime import datetime
+from typing import Optional
+
+import pytz
+from PyQt5.QtCore import QLineF, QPointF, QRectF, Qt, QTimer
+from PyQt5.QtGui import QColor, QPainter, QPen, QPolygonF
+from PyQt5.QtWidgets import QWidget
+
+from tick_lod import TickPyramid
+
+MOSCOW_TZ = pytz.timezone('Europe/Moscow')
+
+# Окно по умолчанию в режиме слежения за последней сделкой, секунды
+FOLLOW_WINDOW = 300.0
+
+# Перерисовка не чаще ~30 раз в секунду
+FRAME_INTERVAL_MS = 33
+
+# Поля под шкалы цены (справа) и времени (снизу), пиксели
+PRICE_AXIS_WIDTH = 70
+TIME_AXIS_HEIGHT = 18
+
+BACKGROUND = QColor(25, 25, 25)
+AXIS_TEXT = QColor(180, 180, 180)
+GRID = QColor(45, 45, 45)
+LINE = QColor(42, 130, 218)
+LAST_PRICE = QColor(Qt.yellow)
+
+
+class TickChart(QWidget):
+    """График цены сделок на QPainter поверх TickPyramid.
+
+    По умолчанию показывает последние FOLLOW_WINDOW секунд и сдвигается за
+    новыми сделками. Колесо мыши меняет масштаб вокруг курсора, перетаскивание
+    сдвигает окно, двойной щелчок возвращает слежение.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setMinimumSize(300, 200)
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
+        self.ticks = TickPyramid()
+        self._follow = True
+        self._span = FOLLOW_WINDOW
+        self._view_end: Optional[float] = None  # правый край окна вне режима слежения
+        self._drag_x: Optional[int] = None
+        self._frame_timer = QTimer(self)
+        self._frame_timer.setSingleShot(True)
+        self._frame_timer.setInterval(FRAME_INTERVAL_MS)
+        self._frame_timer.timeout.connect(self.update)
+
+    def add_tick(self, ts: float, price: float):
+        self.ticks.append(ts, price)
+        # Вне режима слежения новая точка видна, только если попадает в окно
+        if self._follow or (self._view_end is not None and ts <= self._view_end):
+            self._schedule()
+
+    def clear(self):
+        self.ticks.clear()
+        self._follow = True
+        self._span = FOLLOW_WINDOW
+        self._view_end = None
+        self._schedule()
+
+    def _schedule(self):
+        if not self._frame_timer.isActive():
+            self._frame_timer.start()
+
+    def _view(self):
+        end = self.ticks.time_range()[1] if self._follow or self._view_end is None else self._view_end
+        return end - self._span, end
+
+    def _plot_rect(self) -> QRectF:
+        return QRectF(0, 0, max(1, self.width() - PRICE_AXIS_WIDTH), max(1, self.height() - TIME_AXIS_HEIGHT))
+
+    # --- мышь ---
+
+    def wheelEvent(self, event):
+        if not len(self.ticks):
+            return
+        start, end = self._view()
+        plot = self._plot_rect()
+        anchor = start + (end - start) * min(1.0, event.pos().x() / plot.width())
+        factor = 0.8 if event.angleDelta().y() > 0 else 1.25
+        first, last = self.ticks.time_range()
+        self._span = min(max(self._span * factor, 1.0), max(last - first, FOLLOW_WINDOW) * 1.1)
+        self._view_end = anchor + (end - anchor) * self._span / (end - start)
+        self._follow = False
+        self._schedule()
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            self._drag_x = event.pos().x()
+            if self._follow:
+                self._view_end = self._view()[1]
+                self._follow = False
+
+    def mouseMoveEvent(self, event):
+        if self._drag_x is None:
+            return
+        dx = event.pos().x() - self._drag_x
+        self._drag_x = event.pos().x()
+        self._view_end -= dx * self._span / self._plot_rect().width()
+        self._schedule()
+
+    def mouseReleaseEvent(self, event):
+        self._drag_x = None
+
+    def mouseDoubleClickEvent(self, event):
+        self._follow = True
+        self._span = FOLLOW_WINDOW
+        self._schedule()
+
+    # --- отрисовка ---
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), BACKGROUND)
+        plot = self._plot_rect()
+        start, end = self._view()
+        width = int(plot.width())
+        columns = self.ticks.columns(start, end, width) if len(self.ticks) else []
+        if not columns:
+            painter.setPen(AXIS_TEXT)
+            painter.drawText(plot, Qt.AlignCenter, "Нет сделок")
+            painter.end()
+            return
+
+        low = min(column[2] for column in columns)
+        high = max(column[3] for column in columns)
+        if high - low < 1e-9:
+            low, high = low - 0.5, high + 0.5
+        margin = (high - low) * 0.05
+        low, high = low - margin, high + margin
+        x_scale = plot.width() / (end - start)
+        y_scale = plot.height() / (high - low)
+
+        def x_of(ts):
+            return (ts - start) * x_scale
+
+        def y_of(price):
+            return plot.height() - (price - low) * y_scale
+
+        self._paint_axes(painter, plot, start, end, low, high, y_of)
+
+        pen = QPen(LINE)
+        pen.setWidth(1)
+        painter.setPen(pen)
+        painter.setClipRect(plot)
+        # Линия по первой/последней цене столбца и вертикальный отрезок min-max внутри столбца
+        path = QPolygonF()
+        spikes = []
+        for ts, first, column_low, column_high, last in columns:
+            x = x_of(ts)
+            path.append(QPointF(x, y_of(first)))
+            if column_high > column_low:
+                spikes.append(QLineF(x, y_of(column_low), x, y_of(column_high)))
+            if last != first:
+                path.append(QPointF(x, y_of(last)))
+        painter.drawPolyline(path)
+        if spikes:
+            painter.drawLines(spikes)
+
+        last_price = self.ticks.price[-1]
+        if low <= last_price <= high:
+            painter.setClipping(False)
+            y = y_of(last_price)
+            painter.setPen(QPen(LAST_PRICE, 1, Qt.DashLine))
+            painter.drawLine(QLineF(0, y, plot.width(), y))
+            painter.setPen(LAST_PRICE)
+            painter.drawText(QRectF(plot.width() + 4, y - 8, PRICE_AXIS_WIDTH - 4, 16),
+                             Qt.AlignLeft | Qt.AlignVCenter, f"{last_price:.3f}")
+        painter.end()
+
+    def _paint_axes(self, painter: QPainter, plot: QRectF, start, end, low, high, y_of):
+        painter.setPen(GRID)
+        painter.drawLine(QLineF(plot.width(), 0, plot.width(), plot.height()))
+        painter.drawLine(QLineF(0, plot.height(), plot.width(), plot.height()))
+        painter.setPen(AXIS_TEXT)
+        for step in range(5):
+            price = low + (high - low) * (step + 0.5) / 5
+            y = y_of(price)
+            painter.setPen(GRID)
+            painter.drawLine(QLineF(0, y, plot.width(), y))
+            painter.setPen(AXIS_TEXT)
+            painter.drawText(QRectF(plot.width() + 4, y - 8, PRICE_AXIS_WIDTH - 4, 16),
+                             Qt.AlignLeft | Qt.AlignVCenter, f"{price:.3f}")
+        time_format = "%H:%M:%S" if end - start < 86400 else "%d.%m %H:%M"
+        for step in range(4):
+            ts = start + (end - start) * (step + 0.5) / 4
+            x = plot.width() * (step + 0.5) / 4
+            label = datetime.fromtimestamp(ts, MOSCOW_TZ).strftime(time_format)
+            painter.drawText(QRectF(x - 40, plot.height(), 80, TIME_AXIS_HEIGHT), Qt.AlignCenter, label)
@@ -0,0 +1,277 @@
+# tick_db.py
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from app_paths import data_dir
+from market_events import BookSnapshot, LastPrice, MarketEvent, Trade, datetime_to_ns
+
+logger = logging.getLogger(__name__)
+
+# Писатель копит события и пишет их одной транзакцией не реже раза в FLUSH_INTERVAL секунд
+FLUSH_INTERVAL = 0.5
+
+# Если писатель отстает от стрима, новые события сверх этого числа отбрасываются (счетчик dropped)
+MAX_PENDING = 500_000
+
+# Сколько дней хранить тики; более старые удаляются при запуске писателя
+RETENTION_DAYS = 30
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS instruments (id INTEGER PRIMARY KEY, uid TEXT NOT NULL UNIQUE)",
+    "CREATE TABLE IF NOT EXISTS trades ("
+    " instrument INTEGER NOT NULL, ts INTEGER NOT NULL, price INTEGER NOT NULL,"
+    " quantity INTEGER NOT NULL, direction INTEGER NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS trades_instrument_ts ON trades (instrument, ts)",
+    "CREATE TABLE IF NOT EXISTS last_prices (instrument INTEGER NOT NULL, ts INTEGER NOT NULL, price INTEGER NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS last_prices_instrument_ts ON last_prices (instrument, ts)",
+    "CREATE TABLE IF NOT EXISTS book_tops ("
+    " instrument INTEGER NOT NULL, ts INTEGER NOT NULL, bid_price INTEGER, bid_quantity INTEGER,"
+    " ask_price INTEGER, ask_quantity INTEGER)",
+    "CREATE INDEX IF NOT EXISTS book_tops_instrument_ts ON book_tops (instrument, ts)",
+)
+
+TABLES = ("trades", "last_prices", "book_tops")
+
+Moment = Union[datetime, float, int, None]  # datetime с часовым поясом или секунды Unix
+
+TradeRow = Tuple[int, int, int, int]  # время (нс), цена (нано), объем, направление
+LastPriceRow = Tuple[int, int]  # время (нс), цена (нано)
+BookTopRow = Tuple[int, Optional[int], Optional[int], Optional[int], Optional[int]]  # время, bid, объем, ask, объем
+
+
+def _to_ns(moment: Moment) -> Optional[int]:
+    if moment is None:
+        return None
+    if isinstance(moment, datetime):
+        return datetime_to_ns(moment)
+    return int(moment * 1_000_000_000)
+
+
+class TickDatabase:
+    """Локальная база тиков на SQLite: сделки, последние цены и лучшие цены стакана.
+
+    События из стрима (add/add_many) копятся в памяти и пишутся фоновым
+    потоком пачками, одна транзакция на пачку. Таблицы индексированы по
+    (инструмент, время биржи), поэтому выборка инструмента за интервал не
+    просматривает остальные данные. Цены - целые нано-единицы, время -
+    наносекунды Unix, как в событиях market_events. Снимок стакана
+    сохраняется, только если изменилась его вершина.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.path.join(data_dir("ticks"), "ticks.sqlite3")
+        self.dropped = 0
+        self._pending: List[MarketEvent] = []
+        self._condition = threading.Condition()
+        self._writing = False
+        self._flush_requested = False
+        self._writer = None
+        self._closed = False
+        self._instrument_ids: Dict[str, int] = {}
+        self._last_tops: Dict[str, tuple] = {}
+        with closing(self._connect()) as connection:
+            # WAL: чтение (окно аналитики, другой процесс) не ждет транзакцию писателя
+            connection.execute("PRAGMA journal_mode=WAL")
+            for statement in SCHEMA:
+                connection.execute(statement)
+            connection.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=10)
+
+    # --- запись ---
+
+    def add(self, event: MarketEvent):
+        self.add_many((event,))
+
+    def add_many(self, events: Iterable[MarketEvent]):
+        """Ставит события в очередь писателя; вызывается из любого потока и не ждет диска."""
+        events = list(events)
+        with self._condition:
+            if self._closed:
+                return
+            free = max(MAX_PENDING - len(self._pending), 0)
+            if len(events) > free:
+                self.dropped += len(events) - free
+                events = events[:free]
+            self._pending.extend(events)
+            if self._writer is None:
+                self._start_writer()
+
+    def _start_writer(self):
+        from workers import get_worker_pool
+
+        self._writer = get_worker_pool().spawn(self._write_loop, name="tick db writer")
+
+    def flush(self, timeout: float = 2.0) -> bool:
+        """Ждет, пока писатель сохранит все поставленные события. False - не успел за timeout."""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            self._flush_requested = True
+            self._condition.notify_all()
+            while self._pending or self._writing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def _write_loop(self, token):
+        with closing(self._connect()) as connection:
+            self._prune(connection)
+            while True:
+                with self._condition:
+                    # Одна транзакция за интервал, раньше - только по flush() или при остановке
+                    if not self._flush_requested and not self._closed and not token.cancelled:
+                        self._condition.wait(FLUSH_INTERVAL)
+                    self._flush_requested = False
+                    batch, self._pending = self._pending, []
+                    self._writing = bool(batch)
+                    finished = self._closed or token.cancelled
+                try:
+                    if batch:
+                        self._write_batch(connection, batch)
+                except sqlite3.Error as e:
+                    logger.error(f"Failed to write {len(batch)} ticks: {e}")
+                    self._instrument_ids.clear()  # откат мог забрать и новые инструменты
+                finally:
+                    with self._condition:
+                        self._writing = False
+                        self._condition.notify_all()
+                if finished and not batch:
+                    return
+
+    def _instrument_id(self, connection: sqlite3.Connection, uid: str) -> int:
+        instrument_id = self._instrument_ids.get(uid)
+        if instrument_id is None:
+            connection.execute("INSERT OR IGNORE INTO instruments (uid) VALUES (?)", (uid,))
+            instrument_id = connection.execute("SELECT id FROM instruments WHERE uid = ?", (uid,)).fetchone()[0]
+            self._instrument_ids[uid] = instrument_id
+        return instrument_id
+
+    def _write_batch(self, connection: sqlite3.Connection, batch: List[MarketEvent]):
+        trades, last_prices, book_tops = [], [], []
+        with connection:
+            for event in batch:
+                instrument = self._instrument_id(connection, event.instrument)
+                if isinstance(event, Trade):
+                    trades.append((instrument, event.ts_ns, event.price, event.quantity, event.direction))
+                elif isinstance(event, LastPrice):
+                    last_prices.append((instrument, event.ts_ns, event.price))
+                elif isinstance(event, BookSnapshot):
+                    top = (
+                        event.bid_prices[0] if event.bid_prices else None,
+                        event.bid_quantities[0] if event.bid_quantities else None,
+                        event.ask_prices[0] if event.ask_prices else None,
+                        event.ask_quantities[0] if event.ask_quantities else None,
+                    )
+                    if self._last_tops.get(event.instrument) != top:
+                        self._last_tops[event.instrument] = top
+                        book_tops.append((instrument, event.ts_ns, *top))
+            connection.executemany("INSERT INTO trades VALUES (?, ?, ?, ?, ?)", trades)
+            connection.executemany("INSERT INTO last_prices VALUES (?, ?, ?)", last_prices)
+            connection.executemany("INSERT INTO book_tops VALUES (?, ?, ?, ?, ?, ?)", book_tops)
+
+    def _prune(self, connection: sqlite3.Connection):
+        cutoff = _to_ns(time.time() - RETENTION_DAYS * 86400)
+        try:
+            with connection:
+                for table in TABLES:
+                    connection.execute(f"DELETE FROM {table} WHERE ts < ?", (cutoff,))
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to prune tick database: {e}")
+
+    # --- чтение ---
+
+    def _query(self, sql: str, params: tuple) -> list:
+        with closing(self._connect()) as connection:
+            return connection.execute(sql, params).fetchall()
+
+    @staticmethod
+    def _range(instrument: str, start: Moment, end: Moment) -> Tuple[str, list]:
+        clauses = ["instrument = (SELECT id FROM instruments WHERE uid = ?)"]
+        params: list = [instrument]
+        if start is not None:
+            clauses.append("ts >= ?")
+            params.append(_to_ns(start))
+        if end is not None:
+            clauses.append("ts < ?")
+            params.append(_to_ns(end))
+        return " AND ".join(clauses), params
+
+    def trades(self, instrument: str, start: Moment = None, end: Moment = None, min_quantity: int = 0,
+               direction: Optional[int] = None, limit: Optional[int] = None) -> List[TradeRow]:
+        """Сделки инструмента в [start, end) по времени биржи, не меньше min_quantity лотов.
+
+        Пример: db.trades(uid, datetime(..., 10, tzinfo=MOSCOW_TZ), datetime(..., 11, ...), min_quantity=5000)
+        """
+        where, params = self._range(instrument, start, end)
+        if min_quantity:
+            where += " AND quantity >= ?"
+            params.append(min_quantity)
+        if direction is not None:
+            where += " AND direction = ?"
+            params.append(int(direction))
+        sql = f"SELECT ts, price, quantity, direction FROM trades WHERE {where} ORDER BY ts"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return self._query(sql, tuple(params))
+
+    def last_prices(self, instrument: str, start: Moment = None, end: Moment = None) -> List[LastPriceRow]:
+        where, params = self._range(instrument, start, end)
+        return self._query(f"SELECT ts, price FROM last_prices WHERE {where} ORDER BY ts", tuple(params))
+
+    def book_tops(self, instrument: str, start: Moment = None, end: Moment = None) -> List[BookTopRow]:
+        """Смены лучших цен стакана: (время, bid, объем bid, ask, объем ask)."""
+        where, params = self._range(instrument, start, end)
+        return self._query(
+            f"SELECT ts, bid_price, bid_quantity, ask_price, ask_quantity FROM book_tops WHERE {where} ORDER BY ts",
+            tuple(params),
+        )
+
+    def time_range(self, instrument: str) -> Optional[Tuple[int, int]]:
+        """Время первой и последней сохраненной сделки инструмента (нс) или None."""
+        where, params = self._range(instrument, None, None)
+        first, last = self._query(f"SELECT MIN(ts), MAX(ts) FROM trades WHERE {where}", tuple(params))[0]
+        return (first, last) if first is not None else None
+
+    def instruments(self) -> List[str]:
+        return [uid for (uid,) in self._query("SELECT uid FROM instruments ORDER BY uid", ())]
+
+    def close(self, timeout: float = 5.0):
+        """Дописывает очередь и останавливает писателя."""
+        self.flush(timeout)
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.wait(timeout)
+
+
+_db: Optional[TickDatabase] = None
+_db_lock = threading.Lock()
+
+
+def get_tick_db() -> TickDatabase:
+    """Общая база тиков приложения."""
+    global _db
+    with _db_lock:
+        if _db is None:
+            _db = TickDatabase()
+        return _db
+
+
+def shutdown(timeout: float = 5.0):
+    """Дописывает очередь общей базы при закрытии приложения (если база открывалась)."""
+    global _db
+    with _db_lock:
+        db, _db = _db, None
+    if db is not None:
+        db.close(timeout)
@@ -0,0 +1,127 @@
+# tick_lod.py
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import List, Tuple
+
+# Во сколько раз каждый уровень пирамиды грубее предыдущего
+LEVEL_FACTOR = 8
+
+# Число уровней над сырыми точками: 8^7 ≈ 2 млн точек на ведро верхнего уровня
+LEVELS = 7
+
+Column = Tuple[float, float, float, float, float]  # время, первая, мин, макс, последняя цена
+
+
+class _Level:
+    """Ведра по LEVEL_FACTOR^k подряд идущих точек: время начала, первая/мин/макс/последняя цена."""
+
+    __slots__ = ("size", "ts", "first", "low", "high", "last")
+
+    def __init__(self, size: int):
+        self.size = size
+        self.ts = array("d")
+        self.first = array("d")
+        self.low = array("d")
+        self.high = array("d")
+        self.last = array("d")
+
+    def add(self, index: int, ts: float, price: float):
+        if index % self.size == 0:
+            self.ts.append(ts)
+            self.first.append(price)
+            self.low.append(price)
+            self.high.append(price)
+            self.last.append(price)
+            return
+        if price < self.low[-1]:
+            self.low[-1] = price
+        if price > self.high[-1]:
+            self.high[-1] = price
+        self.last[-1] = price
+
+
+class TickPyramid:
+    """Тики (время, цена) с многоуровневым кэшем min/max для отрисовки в ширину экрана.
+
+    Новая точка обновляет только последнее ведро каждого уровня, поэтому
+    добавление стоит O(LEVELS) и прореживание не пересчитывается. Запрос
+    диапазона берет самый грубый уровень, у которого на пиксель приходится
+    хотя бы пара ведер, и сводит ведра в столбцы по пикселям.
+    """
+
+    def __init__(self, levels: int = LEVELS, factor: int = LEVEL_FACTOR):
+        self.ts = array("d")
+        self.price = array("d")
+        self._levels = [_Level(factor ** (k + 1)) for k in range(levels)]
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    def append(self, ts: float, price: float):
+        # Лента приходит по времени; запоздавшая точка ставится в конец с временем предыдущей
+        if self.ts and ts < self.ts[-1]:
+            ts = self.ts[-1]
+        index = len(self.ts)
+        self.ts.append(ts)
+        self.price.append(price)
+        for level in self._levels:
+            level.add(index, ts, price)
+
+    def clear(self):
+        self.__init__(len(self._levels), self._levels[0].size)
+
+    def time_range(self) -> Tuple[float, float]:
+        if not self.ts:
+            return 0.0, 0.0
+        return self.ts[0], self.ts[-1]
+
+    def points(self, start: float, end: float) -> List[Tuple[float, float]]:
+        """Сырые точки в [start, end] (для масштаба, где точек меньше, чем пикселей)."""
+        lo = bisect_left(self.ts, start)
+        hi = bisect_right(self.ts, end)
+        return list(zip(self.ts[lo:hi], self.price[lo:hi]))
+
+    def columns(self, start: float, end: float, width: int) -> List[Column]:
+        """Столбцы min/max по пикселям для [start, end] шириной width.
+
+        Если точек в диапазоне не больше 2*width, каждая точка - свой столбец.
+        """
+        if width <= 0 or end <= start:
+            return []
+        lo = bisect_left(self.ts, start)
+        hi = bisect_right(self.ts, end)
+        count = hi - lo
+        if count <= 0:
+            return []
+        if count <= 2 * width:
+            return [(t, p, p, p, p) for t, p in zip(self.ts[lo:hi], self.price[lo:hi])]
+
+        level = None
+        for candidate in self._levels:
+            if count // candidate.size < 2 * width:
+                break
+            level = candidate
+        if level is None:
+            source_ts, first, low, high, last = self.ts, self.price, self.price, self.price, self.price
+            begin, stop = lo, hi
+        else:
+            source_ts, first, low, high, last = level.ts, level.first, level.low, level.high, level.last
+            # Ведра, задевающие диапазон: крайние могут чуть выходить за него
+            begin, stop = lo // level.size, (hi - 1) // level.size + 1
+
+        scale = width / (end - start)
+        result: List[list] = []
+        current = -1
+        for i in range(begin, stop):
+            x = int((source_ts[i] - start) * scale)
+            if x != current:
+                current = x
+                result.append([source_ts[i], first[i], low[i], high[i], last[i]])
+            else:
+                column = result[-1]
+                if low[i] < column[2]:
+                    column[2] = low[i]
+                if high[i] > column[3]:
+                    column[3] = high[i]
+                column[4] = last[i]
+        return [tuple(column) for column in result]
@@ -1,91 +1,281 @@
 import threading
 from PyQt5.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QComboBox,
-    QTableWidget, QTableWidgetItem, QGroupBox, QHeaderView
+    QTableView, QGroupBox, QHeaderView, QLineEdit
 )
-from PyQt5.QtCore import Qt, QTimer, pyqtSignal, QObject
-from tinkoff.invest import Client, CandleInterval
+from PyQt5.QtCore import (
+    Qt, QTimer, pyqtSignal, QObject, QAbstractTableModel, QModelIndex, QSortFilterProxyModel
+)
+from tinkoff.invest import CandleInterval
 from datetime import datetime, timezone, timedelta
 import pytz
+from request_scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, is_rate_limited
+from workers import get_worker_pool
+from bar_builder import BarBuilder, candles_to_rows
+from candle_store import get_candle_store
 
 class MarketDataStreamer(QObject):
-    data_updated = pyqtSignal(str, dict)  # instrument_uid, data dict
+    data_updated = pyqtSignal(dict)  # {instrument_uid: data dict} за один цикл опроса
 
-    def __init__(self, token, instruments):
+    def __init__(self, scheduler):
         super().__init__()
-        self.token = token
-        self.instruments = instruments  # {uid: {ticker, class_code}}
+        self.scheduler = scheduler
+        self.instruments = set()  # uid опрашиваемых инструментов
+        self._lock = threading.Lock()
         self.running = False
-        self.threads = {}
+        self.task = None
+        self._prices_future = None
+        self._volume_futures = {}  # uid -> Future
+        # Свои минутные бары для объема дня: общий построитель ведут стрим и окно аналитики,
+        # список не должен сбрасывать их серии
+        self.bars = BarBuilder(intervals=(60,))
 
     def start(self):
         self.running = True
-        for uid in self.instruments:
-            if uid not in self.threads:
-                t = threading.Thread(target=self.stream_instrument, args=(uid,), daemon=True)
-                self.threads[uid] = t
-                t.start()
+        self.task = get_worker_pool().spawn(self.poll_instruments, name="watchlist poll")
 
     def stop(self):
         self.running = False
+        if self.task:
+            self.task.cancel()
+
+    def add_instrument(self, uid):
+        with self._lock:
+            self.instruments.add(uid)
+
+    def remove_instrument(self, uid):
+        with self._lock:
+            self.instruments.discard(uid)
+            self._volume_futures.pop(uid, None)
+        self.bars.drop(uid)
 
-    def stream_instrument(self, uid):
-        # Для простоты: обновляем данные раз в 1 секунду (имитация стриминга)
-        while self.running:
-            try:
-                with Client(self.token) as client:
-                    # Последняя цена
-                    last_price = client.market_data.get_last_prices(instrument_id=[uid])
-                    price = None
-                    time = None
-                    if last_price.last_prices:
-                        p = last_price.last_prices[0].price
-                        price = p.units + p.nano / 1e9
-                        time = last_price.last_prices[0].time
-                    # Минутные свечи за день (только объем, оборот убран)
-                    now = datetime.now(timezone.utc)
-                    msk = pytz.timezone('Europe/Moscow')
-                    msk_now = now.astimezone(msk)
-                    msk_midnight = msk_now.replace(hour=0, minute=0, second=0, microsecond=0)
-                    utc_midnight = msk_midnight.astimezone(timezone.utc)
-                    candles = client.market_data.get_candles(
-                        instrument_id=uid,
-                        from_=utc_midnight,
-                        to=now,
-                        interval=CandleInterval.CANDLE_INTERVAL_1_MIN
+    def poll_instruments(self, token):
+        # Раз в секунду: один общий GetLastPrices на все инструменты и фоновые запросы свечей.
+        # Пока предыдущий запрос не выполнен (например, исчерпан лимит), новый не ставим,
+        # поэтому при нехватке бюджета таблица обновляется реже, а не показывает ошибки
+        while not token.cancelled:
+            with self._lock:
+                uids = list(self.instruments)
+            if uids and (self._prices_future is None or self._prices_future.done()):
+                self._prices_future = self.scheduler.get_last_prices(uids, PRIORITY_BACKGROUND)
+                self._prices_future.add_done_callback(self._on_last_prices)
+            for uid in uids:
+                future = self._volume_futures.get(uid)
+                if future is None or future.done():
+                    future = self.scheduler.submit(
+                        "market_data",
+                        lambda client, uid=uid: self._load_day_volume(client, uid),
+                        PRIORITY_BACKGROUND,
+                        key=("day_volume", uid)
                     )
-                    volume = 0
-                    if candles.candles:
-                        for c in candles.candles:
-                            v = c.volume
-                            volume += v
-                    else:
-                        volume = None
-
-                    # Время по Москве
-                    msk_time = None
-                    if time:
-                        msk_time = time.astimezone(msk).strftime('%d.%m.%Y %H:%M:%S')
-                    data = {
-                        'price': price,
-                        'volume': volume,
-                        'time': msk_time
-                    }
-                    self.data_updated.emit(uid, data)
-            except Exception as e:
-                self.data_updated.emit(uid, {'error': str(e)})
-            import time as t
-            t.sleep(1)
+                    self._volume_futures[uid] = future
+                    future.add_done_callback(lambda f, uid=uid: self._on_day_volume(uid, f))
+            token.sleep(1)
+
+    def _load_day_volume(self, client, uid):
+        # Минутные бары дня хранятся локально: первый запрос берет свечи с полуночи,
+        # следующие - только с начала последней (еще не закрытой) минуты
+        now = datetime.now(timezone.utc)
+        msk = pytz.timezone('Europe/Moscow')
+        msk_now = now.astimezone(msk)
+        msk_midnight = msk_now.replace(hour=0, minute=0, second=0, microsecond=0)
+        utc_midnight = msk_midnight.astimezone(timezone.utc)
+        builder = self.bars
+        store = get_candle_store()
+        last_start = builder.last_start(uid, 60)
+        if last_start is None or last_start < utc_midnight.timestamp():
+            builder.drop(uid)  # новый день
+            # Свечи, уже лежащие в локальном хранилище, не запрашиваем повторно
+            stored = store.rows(uid, "1m", int(utc_midnight.timestamp()))
+            if stored:
+                builder.seed(uid, stored, 60)
+            last_start = builder.last_start(uid, 60)
+        if last_start is not None:
+            from_ = datetime.fromtimestamp(last_start, timezone.utc)
+        else:
+            from_ = utc_midnight
+        candles = client.market_data.get_candles(
+            instrument_id=uid,
+            from_=from_,
+            to=now,
+            interval=CandleInterval.CANDLE_INTERVAL_1_MIN
+        )
+        rows = candles_to_rows(candles.candles)
+        # В хранилище только закрытые минуты: последняя свеча еще меняется
+        store.write(uid, "1m", rows[:-1])
+        builder.seed(uid, rows, 60)
+        if builder.last_start(uid, 60) is None:
+            return None
+        return builder.volume_since(uid, 60, utc_midnight.timestamp())
+
+    def _on_last_prices(self, future):
+        if future.cancelled() or not self.running:
+            return
+        error = future.exception()
+        if error is not None:
+            with self._lock:
+                uids = list(self.instruments)
+            self._emit_error(uids, error)
+            return
+        msk = pytz.timezone('Europe/Moscow')
+        updates = {}
+        for uid, last_price in future.result().items():
+            p = last_price.price
+            # Время по Москве
+            msk_time = last_price.time.astimezone(msk).strftime('%d.%m.%Y %H:%M:%S') if last_price.time else None
+            updates[uid] = {
+                'price': p.units + p.nano / 1e9,
+                'time': msk_time,
+                'timestamp': last_price.time.timestamp() if last_price.time else None
+            }
+        if updates:
+            self.data_updated.emit(updates)
+
+    def _on_day_volume(self, uid, future):
+        if future.cancelled() or not self.running:
+            return
+        error = future.exception()
+        if error is not None:
+            self._emit_error([uid], error)
+            return
+        self.data_updated.emit({uid: {'volume': future.result()}})
+
+    def _emit_error(self, uids, error):
+        # Исчерпанный лимит не ошибка для пользователя: оставляем прежние значения
+        if is_rate_limited(error):
+            return
+        self.data_updated.emit({uid: {'error': str(error)} for uid in uids})
+
+
+def format_number(val):
+    # Форматирование объема
+    if val is None:
+        return "-"
+    try:
+        return f"{int(round(val)):,}".replace(",", " ")
+    except Exception:
+        return str(val)
+
+
+class WatchlistModel(QAbstractTableModel):
+    """Модель таблицы наблюдения: строка ищется по UID за O(1),
+    при обновлении перерисовываются только изменившиеся ячейки."""
+
+    COLUMNS = ["Тикер", "Последняя цена", "Объем (день)", "Время (МСК)"]
+    SORT_ROLE = Qt.UserRole
+
+    # Индексы полей строки
+    UID, TICKER, PRICE, VOLUME, TIME, TIMESTAMP, ERROR = range(7)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows = []  # [uid, ticker, price, volume, time, timestamp, error]
+        self._row_by_uid = {}
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.COLUMNS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self._rows[index.row()]
+        column = index.column()
+        if role == Qt.DisplayRole:
+            if column == 0:
+                return row[self.TICKER]
+            if column == 1:
+                if row[self.ERROR]:
+                    return f"Ошибка: {row[self.ERROR]}"
+                return str(row[self.PRICE]) if row[self.PRICE] is not None else "-"
+            if column == 2:
+                return format_number(row[self.VOLUME])
+            return row[self.TIME] if row[self.TIME] is not None else "-"
+        if role == self.SORT_ROLE:
+            # Числовая сортировка; пустые значения всегда внизу по возрастанию
+            if column == 0:
+                return row[self.TICKER]
+            value = row[(self.PRICE, self.VOLUME, self.TIMESTAMP)[column - 1]]
+            return value if value is not None else float("-inf")
+        return None
+
+    def uid_at(self, row):
+        return self._rows[row][self.UID]
+
+    def add_instrument(self, uid, ticker):
+        position = len(self._rows)
+        self.beginInsertRows(QModelIndex(), position, position)
+        self._rows.append([uid, ticker, None, None, None, None, None])
+        self._row_by_uid[uid] = position
+        self.endInsertRows()
+
+    def remove_instrument(self, uid):
+        position = self._row_by_uid.pop(uid, None)
+        if position is None:
+            return
+        self.beginRemoveRows(QModelIndex(), position, position)
+        del self._rows[position]
+        for row in self._rows[position:]:
+            self._row_by_uid[row[self.UID]] -= 1
+        self.endRemoveRows()
+
+    def update_instruments(self, updates):
+        """Применяет {uid: data} и сообщает виду только об изменившихся ячейках."""
+        for uid, data in updates.items():
+            position = self._row_by_uid.get(uid)
+            if position is None:
+                continue
+            row = self._rows[position]
+            changed = []
+            if 'error' in data:
+                if row[self.ERROR] != data['error']:
+                    row[self.ERROR] = data['error']
+                    changed.append(1)
+            elif 'price' in data:
+                if row[self.ERROR] is not None or row[self.PRICE] != data['price']:
+                    row[self.ERROR] = None
+                    row[self.PRICE] = data['price']
+                    changed.append(1)
+                if row[self.TIME] != data['time']:
+                    row[self.TIME] = data['time']
+                    row[self.TIMESTAMP] = data['timestamp']
+                    changed.append(3)
+            if 'volume' in data and row[self.VOLUME] != data['volume']:
+                row[self.VOLUME] = data['volume']
+                changed.append(2)
+            if changed:
+                self.dataChanged.emit(self.index(position, min(changed)),
+                                      self.index(position, max(changed)),
+                                      [Qt.DisplayRole, self.SORT_ROLE])
 
 class TickerWindow(QGroupBox):
+    # Справочник площадок из фонового потока: (площадки, {(тикер, площадка): инструмент}) или ошибка
+    instruments_loaded = pyqtSignal(list, dict)
+    instruments_failed = pyqtSignal(str)
+
     def __init__(self, parent=None):
         super().__init__("ПОИСК ИНСТРУМЕНТОВ")
         self.parent = parent
+        self.model = WatchlistModel(self)
+        self.proxy_model = QSortFilterProxyModel(self)
+        self.proxy_model.setSourceModel(self.model)
+        self.proxy_model.setSortRole(WatchlistModel.SORT_ROLE)
+        self.proxy_model.setFilterKeyColumn(0)
+        self.proxy_model.setFilterCaseSensitivity(Qt.CaseInsensitive)
         self.init_ui()
         self.class_codes = []
         self.ticker_map = {}  # (ticker, class_code) -> instrument
         self.selected_instruments = {}  # uid -> {ticker, class_code}
         self.streamer = None
+        self.instruments_loaded.connect(self.on_instruments_loaded)
+        self.instruments_failed.connect(lambda message: self.parent.show_info(message))
 
     def init_ui(self):
         layout = QVBoxLayout(self)
@@ -111,14 +301,19 @@ class TickerWindow(QGroupBox):
         select_layout.addWidget(self.ticker_combo)
         select_layout.addWidget(self.add_button)
 
-        # Изменено количество столбцов на 4 (убран "Оборот (день)")
-        self.table = QTableWidget(0, 4)
-        self.table.setHorizontalHeaderLabels([
-            "Тикер", "Последняя цена", "Объем (день)", "Время (МСК)"
-        ])
+        # Фильтр по тикеру
+        self.filter_input = QLineEdit()
+        self.filter_input.setPlaceholderText("Фильтр по тикеру")
+        self.filter_input.textChanged.connect(self.proxy_model.setFilterFixedString)
+
+        self.table = QTableView()
+        self.table.setModel(self.proxy_model)
+        self.table.setSortingEnabled(True)
+        self.table.sortByColumn(0, Qt.AscendingOrder)
+        self.table.verticalHeader().setVisible(False)
         self.table.horizontalHeader().setStretchLastSection(True)
-        self.table.setSelectionBehavior(self.table.SelectRows)
-        self.table.setSelectionMode(self.table.SingleSelection)
+        self.table.setSelectionBehavior(QTableView.SelectRows)
+        self.table.setSelectionMode(QTableView.SingleSelection)
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive) # Разрешаем интерактивное изменение размеров
 
         # Кнопка удаления
@@ -126,6 +321,7 @@ class TickerWindow(QGroupBox):
         self.remove_button.clicked.connect(self.remove_ticker)
 
         layout.addLayout(select_layout)
+        layout.addWidget(self.filter_input)
         layout.addWidget(self.table)
         layout.addWidget(self.remove_button)
 
@@ -139,27 +335,36 @@ class TickerWindow(QGroupBox):
         self.ticker_map = {}
         if not self.parent.token:
             return
+        # Справочники - тяжелые запросы под лимитом API: грузятся в фоне, не в потоке GUI
+        get_worker_pool().submit(self._load_class_codes_in_thread, self.parent.scheduler)
+
+    def _load_class_codes_in_thread(self, scheduler):
+        ticker_map = {}
         try:
-            with Client(self.parent.token) as client:
-                all_instruments = []
-                # Получаем акции
-                shares_response = client.instruments.shares()
-                all_instruments.extend(shares_response.instruments)
-                # Получаем фьючерсы
-                futures_response = client.instruments.futures()
-                all_instruments.extend(futures_response.instruments)
-
-                codes = set()
-                for inst in all_instruments:
-                    if inst.class_code in ('TQBR', 'SPBFUT'):
-                        codes.add(inst.class_code)
-                        self.ticker_map[(inst.ticker, inst.class_code)] = inst
-
-                self.class_codes = sorted(list(codes))
-                self.class_code_combo.addItems(self.class_codes)
+            all_instruments = []
+            # Получаем акции
+            shares_response = scheduler.call("instruments", lambda client: client.instruments.shares(), PRIORITY_INTERACTIVE)
+            all_instruments.extend(shares_response.instruments)
+            # Получаем фьючерсы
+            futures_response = scheduler.call("instruments", lambda client: client.instruments.futures(), PRIORITY_INTERACTIVE)
+            all_instruments.extend(futures_response.instruments)
+
+            codes = set()
+            for inst in all_instruments:
+                if inst.class_code in ('TQBR', 'SPBFUT'):
+                    codes.add(inst.class_code)
+                    ticker_map[(inst.ticker, inst.class_code)] = inst
+
+            self.instruments_loaded.emit(sorted(codes), ticker_map)
 
         except Exception as e:
-            self.parent.show_info(f"Ошибка загрузки площадок: {str(e)}")
+            self.instruments_failed.emit(f"Ошибка загрузки площадок: {str(e)}")
+
+    def on_instruments_loaded(self, class_codes, ticker_map):
+        self.class_code_combo.clear()
+        self.class_codes = class_codes
+        self.ticker_map = ticker_map
+        self.class_code_combo.addItems(self.class_codes)
 
     def on_class_code_changed(self, idx):
         if idx < 0 or not self.parent.token:
@@ -187,57 +392,28 @@ class TickerWindow(QGroupBox):
             self.parent.show_info("Этот тикер уже добавлен")
             return
         self.selected_instruments[uid] = {'ticker': ticker, 'class_code': class_code}
-        self.update_table()
-        self.start_streaming()
+        self.model.add_instrument(uid, ticker)
+        self.ensure_streaming()
+        self.streamer.add_instrument(uid)
         self.parent.show_info(f"Добавлен {ticker} ({class_code})")
 
-    def update_table(self):
-        self.table.setRowCount(len(self.selected_instruments))
-        for row, (uid, info) in enumerate(self.selected_instruments.items()):
-            self.table.setItem(row, 0, QTableWidgetItem(info['ticker']))
-            self.table.setItem(row, 1, QTableWidgetItem("-"))
-            self.table.setItem(row, 2, QTableWidgetItem("-"))
-            self.table.setItem(row, 3, QTableWidgetItem("-")) # Время (МСК)
-            # self.table.setItem(row, 4, QTableWidgetItem("-")) # Оборот убран
-
-    def start_streaming(self):
-        if self.streamer:
-            self.streamer.stop()
-        self.streamer = MarketDataStreamer(self.parent.token, self.selected_instruments)
-        self.streamer.data_updated.connect(self.on_data_update)
-        self.streamer.start()
-
-    def on_data_update(self, uid, data):
-        if uid not in self.selected_instruments:
-            return
-        row = list(self.selected_instruments.keys()).index(uid)
-        if 'error' in data:
-            self.table.setItem(row, 1, QTableWidgetItem(f"Ошибка: {data['error']}"))
-            return
-        # Форматирование объема
-        def format_number(val):
-            if val is None:
-                return "-"
-            try:
-                return f"{int(round(val)):,}".replace(",", " ")
-            except Exception:
-                return str(val)
-        price_str = str(data['price']) if data['price'] is not None else "-"
-        volume_str = format_number(data['volume'])
-        # turnover_str = format_number(data['turnover']) # Оборот убран
-        self.table.setItem(row, 1, QTableWidgetItem(price_str))
-        self.table.setItem(row, 2, QTableWidgetItem(volume_str))
-        # self.table.setItem(row, 3, QTableWidgetItem(turnover_str)) # Оборот убран
-        self.table.setItem(row, 3, QTableWidgetItem(data['time'] if data['time'] is not None else "-"))
+    def ensure_streaming(self):
+        # Опрос запускается один раз, дальше инструменты добавляются и удаляются на ходу
+        if self.streamer is None:
+            self.streamer = MarketDataStreamer(self.parent.scheduler)
+            self.streamer.data_updated.connect(self.on_data_update)
+            self.streamer.start()
+
+    def on_data_update(self, updates):
+        self.model.update_instruments(updates)
 
     def remove_ticker(self):
-        selected = self.table.currentRow()
-        if selected < 0 or selected >= len(self.selected_instruments):
+        selected = self.table.selectionModel().currentIndex()
+        if not selected.isValid():
             self.parent.show_info("Выделите строку для удаления")
             return
-        uid = list(self.selected_instruments.keys())[selected]
-        info = self.selected_instruments[uid]
-        del self.selected_instruments[uid]
-        self.update_table()
-        self.start_streaming()
-        self.parent.show_info(f"Удалён {info['ticker']} ({info['class_code']})")
\ No newline at end of file
+        uid = self.model.uid_at(self.proxy_model.mapToSource(selected).row())
+        info = self.selected_instruments.pop(uid)
+        self.model.remove_instrument(uid)
+        self.streamer.remove_instrument(uid)
+        self.parent.show_info(f"Удалён {info['ticker']} ({info['class_code']})")
@@ -0,0 +1,89 @@
+# trade_counters.py
+from array import array
+from typing import Optional
+
+
+class RollingCounter:
+    """Счетчик событий по секундам в кольцевом буфере.
+
+    В ячейке хранится накопленная сумма на конец секунды, поэтому число событий
+    в любом окне внутри горизонта - разность двух ячеек, O(1). Ячеек на одну
+    больше горизонта: окну во весь горизонт нужна сумма на конец секунды перед
+    ним. Секунды старше горизонта перезаписываются: память не растет со
+    временем сессии.
+    """
+
+    def __init__(self, horizon: int = 3600, resolution: float = 1.0):
+        self.horizon = horizon
+        self.resolution = resolution
+        self._size = horizon + 1
+        self._cum = array("q", bytes(8 * self._size))
+        self._head: Optional[int] = None  # последняя заполненная секунда
+        self._start: Optional[int] = None  # первая секунда с событиями
+        self.total = 0
+
+    def clear(self):
+        self._cum = array("q", bytes(8 * self._size))
+        self._head = None
+        self._start = None
+        self.total = 0
+
+    def _second(self, ts: float) -> int:
+        return int(ts // self.resolution)
+
+    def _advance(self, second: int):
+        if self._head is None:
+            self._head = self._start = second
+            self._cum[second % self._size] = self.total
+            return
+        if second <= self._head:
+            return
+        # Пропущенные секунды получают текущую сумму; не больше одного круга
+        for s in range(max(self._head + 1, second - self.horizon), second + 1):
+            self._cum[s % self._size] = self.total
+        self._head = second
+
+    def advance(self, ts: float):
+        """Сдвигает голову буфера к моменту ts без добавления событий."""
+        self._advance(self._second(ts))
+
+    def add(self, ts: float, amount: int = 1):
+        """Учитывает amount событий в момент ts (секунды эпохи).
+
+        Запоздавшее событие дописывается в свою секунду и во все последующие;
+        события старше горизонта отбрасываются.
+        """
+        second = self._second(ts)
+        self._advance(second)
+        if second <= self._head - self.horizon:
+            return
+        self.total += amount
+        self._start = min(self._start, second)
+        for s in range(second, self._head + 1):
+            self._cum[s % self._size] += amount
+
+    def _cum_before(self, second: int) -> int:
+        """Накопленная сумма до начала секунды second."""
+        if self._head is None:
+            return 0
+        if second > self._head:
+            return self.total
+        # Окно длиннее горизонта обрезается до горизонта, и только потом сравнивается с началом:
+        # иначе окно от начала давней сессии вернуло бы все события сессии
+        second = max(second, self._head - self.horizon + 1)
+        if second <= self._start:
+            return 0
+        return self._cum[(second - 1) % self._size]
+
+    def since(self, start_ts: float) -> int:
+        """Число событий с момента start_ts до последнего учтенного."""
+        return self.total - self._cum_before(self._second(start_ts))
+
+    def between(self, start_ts: float, end_ts: float) -> int:
+        """Число событий в [start_ts, end_ts)."""
+        return self._cum_before(self._second(end_ts)) - self._cum_before(self._second(start_ts))
+
+    def last(self, seconds: float, now: float) -> int:
+        """Число событий в скользящем окне последних seconds секунд."""
+        self.advance(now)
+        return self.since(now - seconds + self.resolution)
@@ -0,0 +1,124 @@
+# trade_index.py
+from array import array
+from collections import deque
+from itertools import compress
+from typing import Dict, Hashable, List
+
+# Ветвление дерева максимумов: сколько узлов уровня покрывает узел уровня выше
+FANOUT = 64
+
+
+class _QuantityIndex:
+    """Номера и объемы сделок в порядке поступления с деревом максимумов объема.
+
+    levels[0] - объемы сделок, levels[k] - максимумы блоков по FANOUT узлов
+    уровня k-1. Добавление - дописывание в конец и подъем максимума, пока он
+    растет: O(log n). Последняя сделка с объемом не меньше порога ищется
+    спуском по блокам, максимум которых дотягивает до порога: O(log n) на
+    найденную сделку, история целиком не просматривается.
+    """
+
+    def __init__(self):
+        self.seqs = array("q")
+        self.levels: List[array] = [array("q")]
+
+    def add(self, seq: int, quantity: int):
+        self.seqs.append(seq)
+        levels = self.levels
+        pos = len(levels[0])
+        levels[0].append(quantity)
+        for level in levels[1:]:
+            pos //= FANOUT
+            if pos == len(level):
+                level.append(quantity)
+            elif level[pos] < quantity:
+                level[pos] = quantity
+            else:
+                break
+        top = levels[-1]
+        if len(top) > FANOUT:
+            levels.append(array("q", [max(top[i:i + FANOUT]) for i in range(0, len(top), FANOUT)]))
+
+    @staticmethod
+    def _rightmost(values: array, start: int, end: int, threshold: int) -> int:
+        """Последняя позиция в values[start:end] со значением не меньше threshold или -1."""
+        block = values[start:end]
+        if not block or max(block) < threshold:
+            return -1
+        return next(compress(range(end - 1, start - 1, -1), map(threshold.__le__, reversed(block))))
+
+    def _find(self, threshold: int, end: int) -> int:
+        """Последняя позиция левее end с объемом не меньше threshold или -1."""
+        levels = self.levels
+        level = 0
+        # Подъем: остаток своего блока на уровне, затем предыдущие блоки уровнем выше
+        while True:
+            top = level == len(levels) - 1
+            start = 0 if top else end - end % FANOUT
+            pos = self._rightmost(levels[level], start, end, threshold)
+            if pos >= 0:
+                break
+            if top or start == 0:
+                return -1
+            level, end = level + 1, start // FANOUT
+        # Спуск: в найденном блоке всегда есть значение не меньше порога
+        while level:
+            level -= 1
+            start = pos * FANOUT
+            pos = self._rightmost(levels[level], start, min(start + FANOUT, len(levels[level])), threshold)
+        return pos
+
+    def latest(self, threshold: int, count: int) -> List[int]:
+        """Номера последних count сделок с объемом не меньше threshold, от старых к новым."""
+        result = []
+        end = len(self.seqs)
+        while len(result) < count:
+            end = self._find(threshold, end)
+            if end < 0:
+                break
+            result.append(self.seqs[end])
+        result.reverse()
+        return result
+
+    def __len__(self) -> int:
+        return len(self.seqs)
+
+
+class LargeTradeIndex:
+    """Крупные сделки по направлениям.
+
+    Для текущего порога ведутся короткие списки последних крупных сделок,
+    которые только дополняются. Все сделки дополнительно лежат в дереве
+    максимумов объема, поэтому смена порога - спуск к последним подходящим
+    сделкам, а не пересмотр истории.
+    Сделки задаются номерами (seq) в общей ленте сделок.
+    """
+
+    def __init__(self, threshold: int = 0, max_entries: int = 50):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._indexes: Dict[Hashable, _QuantityIndex] = {}
+        self.recent: Dict[Hashable, deque] = {}
+
+    def add(self, seq: int, quantity: int, direction: Hashable) -> bool:
+        """Добавляет сделку. Возвращает True, если она крупная при текущем пороге."""
+        index = self._indexes.get(direction)
+        if index is None:
+            index = self._indexes[direction] = _QuantityIndex()
+            self.recent[direction] = deque(maxlen=self.max_entries)
+        index.add(seq, quantity)
+        if quantity >= self.threshold:
+            self.recent[direction].append(seq)
+            return True
+        return False
+
+    def set_threshold(self, threshold: int) -> Dict[Hashable, List[int]]:
+        """Меняет порог; возвращает последние крупные сделки по направлениям."""
+        self.threshold = threshold
+        for direction, index in self._indexes.items():
+            self.recent[direction] = deque(index.latest(threshold, self.max_entries), maxlen=self.max_entries)
+        return {direction: list(seqs) for direction, seqs in self.recent.items()}
+
+    def clear(self):
+        self._indexes.clear()
+        self.recent.clear()
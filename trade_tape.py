@@ -0,0 +1,181 @@
+# trade_tape.py
+import logging
+import mmap
+import os
+import shutil
+import tempfile
+import weakref
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Столбцы ленты: имя -> typecode array. Время в микросекундах эпохи
+COLUMNS = (("ts", "q"), ("price", "d"), ("quantity", "q"), ("direction", "b"))
+ROW_SIZE = sum(array(code).itemsize for _, code in COLUMNS)
+
+CHUNK_SIZE = 65536
+MEMORY_BUDGET = 64 * 1024 * 1024
+
+
+class _Chunk:
+    """Блок ленты: по массиву на столбец. После выгрузки столбцы - memoryview поверх mmap."""
+
+    def __init__(self):
+        self.columns = {name: array(code) for name, code in COLUMNS}
+        self._files = []
+        self.spilled = False
+
+    def __len__(self) -> int:
+        return len(self.columns["ts"])
+
+    @property
+    def first_ts(self) -> int:
+        return self.columns["ts"][0]
+
+    @property
+    def last_ts(self) -> int:
+        return self.columns["ts"][-1]
+
+    def nbytes(self) -> int:
+        return 0 if self.spilled else len(self) * ROW_SIZE
+
+    def spill(self, directory: str, number: int):
+        """Переносит столбцы в файлы и отображает их в память только для чтения."""
+        columns = {}
+        for name, code in COLUMNS:
+            path = os.path.join(directory, f"{number}.{name}")
+            with open(path, "wb") as f:
+                self.columns[name].tofile(f)
+            with open(path, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._files.append(mm)
+            columns[name] = memoryview(mm).cast(code)
+        self.columns = columns
+        self.spilled = True
+
+    def close(self):
+        try:
+            for column in self.columns.values():
+                if isinstance(column, memoryview):
+                    column.release()
+            for mm in self._files:
+                mm.close()
+        except BufferError:
+            # Срез столбца еще у кого-то в руках: файл закроется вместе с ним
+            logger.debug("Spilled chunk is still referenced, leaving mmap open")
+        self._files = []
+
+
+class TradeTape:
+    """Колоночная лента сделок блоками фиксированного размера.
+
+    Сделка занимает ROW_SIZE байт вместо нескольких сотен у dict. Когда закрытые
+    блоки превышают memory_budget, самые старые выгружаются в файлы и читаются
+    через mmap. Срез по времени находит блоки и границы внутри них бисекцией.
+    Столбцы отдаются как array/memoryview и поддерживают буферный протокол.
+    """
+
+    def __init__(self, chunk_size: int = CHUNK_SIZE, memory_budget: int = MEMORY_BUDGET,
+                 spill_dir: Optional[str] = None):
+        self.chunk_size = chunk_size
+        self.memory_budget = memory_budget
+        self._spill_root = spill_dir
+        self._spill_dir: Optional[str] = None
+        self._chunks: List[_Chunk] = [_Chunk()]
+        self._starts = [0]  # номер первой сделки каждого блока
+        self._spilled = 0
+        self._length = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    def append(self, ts_us: int, price: float, quantity: int, direction: int) -> int:
+        """Добавляет сделку, возвращает ее номер в ленте."""
+        chunk = self._chunks[-1]
+        if len(chunk) >= self.chunk_size:
+            chunk = _Chunk()
+            self._chunks.append(chunk)
+            self._starts.append(self._length)
+            self._enforce_budget()
+        columns = chunk.columns
+        columns["ts"].append(ts_us)
+        columns["price"].append(price)
+        columns["quantity"].append(quantity)
+        columns["direction"].append(direction)
+        self._length += 1
+        return self._length - 1
+
+    def _enforce_budget(self):
+        while self.memory_usage() > self.memory_budget and self._spilled < len(self._chunks) - 1:
+            if self._spill_dir is None:
+                self._spill_dir = tempfile.mkdtemp(prefix="trade_tape_", dir=self._spill_root)
+                # Файлы выгрузки удаляются и при выходе без явного close()
+                weakref.finalize(self, shutil.rmtree, self._spill_dir, True)
+            self._chunks[self._spilled].spill(self._spill_dir, self._spilled)
+            self._spilled += 1
+
+    def memory_usage(self) -> int:
+        """Байт данных в оперативной памяти (без выгруженных блоков)."""
+        return sum(chunk.nbytes() for chunk in self._chunks)
+
+    @property
+    def spilled_chunks(self) -> int:
+        return self._spilled
+
+    def row(self, index: int) -> Tuple[int, float, int, int]:
+        """(ts_us, price, quantity, direction) сделки по номеру."""
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError(index)
+        chunk_index = bisect_right(self._starts, index) - 1
+        columns = self._chunks[chunk_index].columns
+        offset = index - self._starts[chunk_index]
+        return (columns["ts"][offset], columns["price"][offset],
+                columns["quantity"][offset], columns["direction"][offset])
+
+    def segments(self, start_us: Optional[int] = None, end_us: Optional[int] = None) -> Iterator[dict]:
+        """Срезы столбцов по блокам для сделок с start_us <= ts < end_us.
+
+        Время в ленте считается неубывающим (порядок поступления со стрима).
+        """
+        for chunk in self._chunks:
+            if not len(chunk):
+                continue
+            if end_us is not None and chunk.first_ts >= end_us:
+                break
+            if start_us is not None and chunk.last_ts < start_us:
+                continue
+            ts = chunk.columns["ts"]
+            lo = bisect_left(ts, start_us) if start_us is not None else 0
+            hi = bisect_left(ts, end_us) if end_us is not None else len(chunk)
+            if lo < hi:
+                yield {name: column[lo:hi] for name, column in chunk.columns.items()}
+
+    def columns(self, start_us: Optional[int] = None, end_us: Optional[int] = None) -> dict:
+        """Столбцы сделок за интервал, склеенные в массивы."""
+        result = {name: array(code) for name, code in COLUMNS}
+        for segment in self.segments(start_us, end_us):
+            for name, column in segment.items():
+                if isinstance(column, memoryview):
+                    result[name].frombytes(column.tobytes())
+                else:
+                    result[name].extend(column)
+        return result
+
+    def clear(self):
+        self.close()
+        self._chunks = [_Chunk()]
+        self._starts = [0]
+        self._spilled = 0
+        self._length = 0
+
+    def close(self):
+        """Закрывает отображения и удаляет файлы выгрузки."""
+        for chunk in self._chunks:
+            chunk.close()
+        if self._spill_dir is not None:
+            shutil.rmtree(self._spill_dir, ignore_errors=True)
+            self._spill_dir = None
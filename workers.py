@@ -0,0 +1,197 @@
+# workers.py
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Потоков под фоновые задачи приложения (загрузка данных, опрос, долгие циклы)
+MAX_WORKERS = 8
+
+
+class CancellationToken:
+    """Флаг отмены для долгих задач. sleep() прерывается сразу при отмене."""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def sleep(self, seconds: float) -> bool:
+        """Ждет seconds секунд. Возвращает True, если задачу отменили."""
+        return self._event.wait(seconds)
+
+
+class TaskHandle:
+    """Ссылка на задачу пула: отмена и ожидание завершения."""
+
+    def __init__(self, name: str, future: Future, token: CancellationToken):
+        self.name = name
+        self.future = future
+        self.token = token
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def cancel(self):
+        self.token.cancel()
+        if self._loop is not None and self._task is not None:
+            self._loop.call_soon_threadsafe(self._task.cancel)
+        else:
+            self.future.cancel()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Ждет завершения задачи. Возвращает False по таймауту."""
+        try:
+            self.future.exception(timeout)
+        except Exception:
+            # CancelledError или TimeoutError
+            return self.future.done()
+        return True
+
+    @property
+    def done(self) -> bool:
+        return self.future.done()
+
+
+class WorkerPool:
+    """Общий ограниченный пул потоков и event loop для асинхронных задач.
+
+    Все фоновые задачи приложения запускаются здесь, поэтому число потоков
+    не растет с числом окон и инструментов, а при остановке задачи реально
+    завершаются и их можно дождаться.
+    """
+
+    def __init__(self, max_workers: int = MAX_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="worker")
+        self._tasks: Set[TaskHandle] = set()
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    def submit(self, fn: Callable, *args, name: Optional[str] = None) -> TaskHandle:
+        """Короткая задача в пуле потоков."""
+        return self._start(name or fn.__name__, lambda token: fn(*args))
+
+    def spawn(self, fn: Callable, *args, name: Optional[str] = None) -> TaskHandle:
+        """Долгая задача: fn(token, *args) должна проверять token и выходить при отмене."""
+        return self._start(name or fn.__name__, lambda token: fn(token, *args))
+
+    def _start(self, name: str, call: Callable[[CancellationToken], Any]) -> TaskHandle:
+        token = CancellationToken()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Worker pool is shut down")
+            future = self._executor.submit(call, token)
+            handle = TaskHandle(name, future, token)
+            self._tasks.add(handle)
+        future.add_done_callback(lambda f: self._finished(handle))
+        return handle
+
+    def run_coroutine(self, coro_fn: Callable, *args, name: Optional[str] = None) -> TaskHandle:
+        """Запускает coro_fn(*args) в общем event loop."""
+        loop = self._ensure_loop()
+        token = CancellationToken()
+        future = Future()
+        handle = TaskHandle(name or coro_fn.__name__, future, token)
+        handle._loop = loop
+
+        def create_task():
+            task = loop.create_task(coro_fn(*args))
+            handle._task = task
+            if token.cancelled:
+                task.cancel()
+            task.add_done_callback(lambda t: self._set_future(future, t))
+
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Worker pool is shut down")
+            self._tasks.add(handle)
+        future.add_done_callback(lambda f: self._finished(handle))
+        loop.call_soon_threadsafe(create_task)
+        return handle
+
+    @staticmethod
+    def _set_future(future: Future, task: asyncio.Task):
+        if task.cancelled():
+            future.cancel()
+        elif task.exception() is not None:
+            future.set_exception(task.exception())
+        else:
+            future.set_result(task.result())
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._loop_thread = threading.Thread(
+                    target=self._run_loop, args=(self._loop,), name="async-tasks", daemon=True
+                )
+                self._loop_thread.start()
+            return self._loop
+
+    @staticmethod
+    def _run_loop(loop: asyncio.AbstractEventLoop):
+        asyncio.set_event_loop(loop)
+        loop.run_forever()
+
+    def _finished(self, handle: TaskHandle):
+        with self._lock:
+            self._tasks.discard(handle)
+        future = handle.future
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Task {handle.name} failed: {future.exception()}")
+
+    def stats(self) -> Dict[str, int]:
+        """Число живых задач: в потоках и в event loop."""
+        with self._lock:
+            tasks = list(self._tasks)
+        async_tasks = sum(1 for t in tasks if t._loop is not None)
+        return {"threads": len(tasks) - async_tasks, "async": async_tasks}
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return self._ensure_loop()
+
+    def shutdown(self, timeout: float = 5.0):
+        """Отменяет все задачи, ждет их завершения и останавливает потоки."""
+        with self._lock:
+            self._closed = True
+            tasks = list(self._tasks)
+        for handle in tasks:
+            handle.cancel()
+        for handle in tasks:
+            if not handle.wait(timeout):
+                logger.warning(f"Task {handle.name} did not stop in {timeout}s")
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop_thread.join(timeout)
+        self._executor.shutdown(wait=False)
+
+
+_pool: Optional[WorkerPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_worker_pool() -> WorkerPool:
+    """Общий пул задач приложения."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool()
+        return _pool
+
+
+def shutdown(timeout: float = 5.0):
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(timeout)